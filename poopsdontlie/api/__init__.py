@@ -1,2 +1,3 @@
 from poopsdontlie.api.countries import list_countries, list_country_regions, is_valid_region, get_region_data_for_country, get_valid_regions,\
-    get_all_region_data_funcs_for_country
+    get_all_region_data_funcs_for_country, expand_regions
+from poopsdontlie.helpers.background import ci_is_final
@@ -1,10 +1,13 @@
 from poopsdontlie.countries import countries
+from poopsdontlie.helpers.lazy import LazyFunction
 from functools import lru_cache
 
-import pycountry
+import inspect
 
 
 def list_countries():
+    import pycountry
+
     return {k: pycountry.countries.get(alpha_3=k) for k in list(sorted(countries.keys()))}
 
 
@@ -33,7 +36,102 @@ def get_valid_regions(country):
     return _regionmap(country).keys()
 
 
-def get_region_data_for_country(country, region):
-    regionmap = _regionmap(country)
+def expand_regions(country, regions):
+    """
+    Expands all or a comma separated list of regions to a list of region names with one name per dataset, invalid
+    names are kept so the caller can report them
+    """
+    if regions.lower().strip() == 'all':
+        return [k[0] for k in countries[country].regions.keys()]
+
+    names, funcs = [], set()
+    for name in (r.strip() for r in regions.split(',')):
+        func = _regionmap(country).get(name.lower())
+        if func is not None and func in funcs:
+            continue
+
+        names.append(name)
+        if func is not None:
+            funcs.add(func)
+
+    return names
+
+
+def _parameters(func):
+    return inspect.signature(func.resolve() if isinstance(func, LazyFunction) else func).parameters
+
+
+def get_region_data_for_country(country, region, columns=None, layout=None, max_points=None, how='mean', start=None,
+                                end=None):
+    """
+    Returns the dataset of a region, optionally only the given columns (full column names or region codes), only the
+    dates from start to end (inclusive) and in the long layout (see poopsdontlie.helpers.layout). With max_points the
+    dataset is returned at the finest resolution, daily, weekly or monthly, that has no more than max_points dates,
+    aggregated by how (mean or median, see poopsdontlie.helpers.rollup)
+    """
+    from poopsdontlie.helpers.layout import check_layout, wide_to_long
+
+    func = _regionmap(country)[region.lower()]
+    parameters = _parameters(func)
+
+    long = check_layout(layout) == 'long'
+    if long and 'layout' not in parameters:
+        raise ValueError(f'Region {region} has no long layout')
+
+    kwargs = {'layout': 'long'} if long else {}
+
+    if max_points is not None:
+        from poopsdontlie.helpers import rollup
+
+        if not rollup.has_rollups(func):
+            raise ValueError(f'Region {region} has no rollups')
+
+        if columns is None or 'columns' in parameters:
+            return rollup.fit(func, max_points, how, columns=columns, start=start, end=end, **kwargs)
+
+        # datasets without a columns argument are selected in the wide layout
+        df = rollup.fit(func, max_points, how, start=start, end=end)
+        from poopsdontlie.helpers.columns import select_columns
+
+        df = df[select_columns(df, columns)]
+
+        return wide_to_long(df) if long else df
+
+    if columns is None:
+        df = func(**kwargs)
+    elif 'columns' in parameters:
+        # the dataset computes (or loads) only the requested columns
+        df = func(columns=columns, **kwargs)
+    else:
+        from poopsdontlie.helpers.columns import select_columns
+
+        df = func()
+        df = df[select_columns(df, columns)]
+        df = wide_to_long(df) if long else df
+
+    if start is None and end is None:
+        return df
+
+    from poopsdontlie.helpers.rollup import between
+
+    return between(df, start, end)
+
+
+def region_has_rollups(country, region):
+    from poopsdontlie.helpers.rollup import has_rollups
+
+    return has_rollups(_regionmap(country)[region.lower()])
+
+
+def get_region_rollup_for_country(country, region, resolution, how='mean', layout=None):
+    """
+    Returns the weekly (resolution W) or monthly (M) rollup of the dataset of a region, aggregated by how, as
+    precomputed by the refresh command
+    """
+    from poopsdontlie.helpers import rollup
+
+    func = _regionmap(country)[region.lower()]
+    if not rollup.has_rollups(func):
+        raise ValueError(f'Region {region} has no rollups')
 
-    return regionmap[region.lower()]()
+    return rollup.rollup_func(func)(resolution=resolution, how=how, layout=layout)
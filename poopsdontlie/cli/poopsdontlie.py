@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 from cleo import Command, Application
-from poopsdontlie.api import list_countries, list_country_regions, is_valid_region, get_region_data_for_country, get_valid_regions
-from poopsdontlie.helpers.config import config, config_file, write_default_config
+from poopsdontlie.api import list_countries, list_country_regions, is_valid_region, get_region_data_for_country, get_valid_regions, \
+    ci_is_final, expand_regions
+from poopsdontlie.helpers.config import config, config_file, write_default_config, env_overrides
 from pathlib import Path
 
 import os
 import logging
-import pkg_resources  # part of setuptools
+import time
 
-from poopsdontlie.helpers.remotecache import cache_gen
+# heavy modules (pandas, geopandas, statsmodels, ...) are imported inside the commands that need them
+# so that commands like list and config start instantly
 
 
 class Config(Command):
@@ -21,12 +23,208 @@ class Config(Command):
     def handle(self):  # type: () -> Optional[int]
         self.write(f'Config location: {config_file.absolute()}\n\n')
 
-        if self.option('refresh'):
+        if self.option('refresh') or not config_file.is_file():
             write_default_config()
 
         with open(config_file, 'r') as fh:
             print(fh.read())
 
+        overrides = [f'{env}={os.environ[env]} ({k})' for env, (k, _) in env_overrides.items() if os.environ.get(env, '') != '']
+        if overrides:
+            self.write('Overridden by environment:\n')
+            for override in overrides:
+                self.write(f'  {override}\n')
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:0.0f}{unit}'
+        size /= 1024
+
+    return f'{size:0.1f}TB'
+
+
+def _format_age(seconds):
+    if seconds is None:
+        return '-'
+
+    sign = '-' if seconds < 0 else ''
+    seconds = abs(seconds)
+    for unit, div in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= div:
+            return f'{sign}{seconds / div:0.1f}{unit}'
+
+    return f'{sign}{seconds:0.0f}s'
+
+
+def _print_profile(command, records):
+    from poopsdontlie.helpers.profiling import summarize
+
+    command.line('')
+    command.line('<info>Profile</info> (wall time includes nested stages)')
+    command.render_table(
+        ['Stage', 'Calls', 'Wall', 'CPU', 'Peak RSS delta', 'Cache hits', 'Cache misses'],
+        [[e['stage'], str(e['calls']), f'{e["wall_time"]:0.2f}s', f'{e["cpu_time"]:0.2f}s', _format_size(e['peak_rss_delta']),
+          str(e['hits']), str(e['misses'])] for e in summarize(records)]
+    )
+
+
+class ProfileOption:
+    """
+    Collects stage records while a command runs when --profile is given and prints a summary afterwards
+    """
+
+    def __init__(self, command):
+        self._command = command
+        self._sink = None
+
+    def __enter__(self):
+        if self._command.option('profile'):
+            from poopsdontlie.helpers.profiling import MemorySink, add_sink
+
+            self._sink = add_sink(MemorySink())
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._sink is not None:
+            from poopsdontlie.helpers.profiling import remove_sink
+
+            remove_sink(self._sink)
+            _print_profile(self._command, self._sink.records)
+
+
+def wait_for_background(command):
+    """
+    Finish the jobs that compute confidence intervals in the background, before the interpreter shuts down
+    """
+    from poopsdontlie.helpers import background
+
+    if background.pending():
+        command.line('<comment>Waiting for the confidence intervals that are computed in the background</comment>')
+
+    background.wait()
+
+
+def _caches():
+    from poopsdontlie.helpers.cache import LocalFilesystemCache, RemoteCache
+
+    return {'local': LocalFilesystemCache(), 'remote': RemoteCache()}
+
+
+def _validate_level(command):
+    from poopsdontlie.helpers.cache import levels
+
+    level = command.option('level')
+    valid_levels = [*levels, 'remote']
+    if level is not None and level not in valid_levels:
+        command.line_error(f'Cache level {level} invalid, choose one of: {", ".join(valid_levels)}')
+        return False
+
+    return True
+
+
+class CacheStats(Command):
+    """
+    Shows size, age and hit counts per cache level and per cached entry
+
+    stats
+        {--level= : Only show entries for this cache level}
+    """
+
+    def handle(self):  # type: () -> Optional[int]
+        if not _validate_level(self):
+            return 100
+
+        level = self.option('level')
+        now = time.time()
+
+        rows = []
+        totals = {}
+        for cache_name, cache in _caches().items():
+            for entry in cache.entries():
+                if level is not None and entry['cache_level'] != level:
+                    continue
+
+                rows.append([
+                    cache_name,
+                    entry['cache_level'],
+                    entry['key'],
+                    _format_size(entry['size']),
+                    _format_age(now - entry['created']),
+                    _format_age(None if entry['invalidate_by'] is None else entry['invalidate_by'] - now),
+                    '-' if entry['hits'] is None else str(entry['hits']),
+                    _format_age(now - entry['last_access']),
+                ])
+
+                total = totals.setdefault((cache_name, entry['cache_level']), [0, 0, 0])
+                total[0] += 1
+                total[1] += entry['size']
+                total[2] += entry['hits'] or 0
+
+        self.render_table(['Cache', 'Level', 'Key', 'Size', 'Age', 'Expires in', 'Hits', 'Last access'], rows)
+        self.line('')
+        self.render_table(
+            ['Cache', 'Level', 'Entries', 'Size', 'Hits'],
+            [[c, l, str(n), _format_size(size), str(hits)] for (c, l), (n, size, hits) in sorted(totals.items())]
+        )
+
+
+class CachePrune(Command):
+    """
+    Removes expired entries and evicts the least recently used entries when the cache exceeds cache_max_size
+
+    prune
+        {--max-size= : Override cache_max_size from the config, e.g. 500MB or 2GB}
+    """
+
+    def handle(self):  # type: () -> Optional[int]
+        from poopsdontlie.helpers.cache import parse_size
+
+        try:
+            max_size = parse_size(self.option('max-size') or config.get('cache_max_size'))
+        except ValueError as e:
+            self.line_error(str(e))
+            return 100
+
+        for cache_name, cache in _caches().items():
+            if max_size is None:
+                removed = cache.sweep_expired()
+            else:
+                removed = cache.evict(max_size)
+
+            self.line(f'{cache_name}: removed {len(removed)} entries, freed {_format_size(sum(e["size"] for e in removed))}')
+
+
+class CacheClear(Command):
+    """
+    Removes cached entries
+
+    clear
+        {--level= : Only remove entries for this cache level}
+    """
+
+    def handle(self):  # type: () -> Optional[int]
+        if not _validate_level(self):
+            return 100
+
+        level = self.option('level')
+        for cache_name, cache in _caches().items():
+            removed = cache.clear(None if level == 'remote' and cache_name == 'remote' else level)
+            self.line(f'{cache_name}: removed {len(removed)} entries, freed {_format_size(sum(e["size"] for e in removed))}')
+
+
+class Cache(Command):
+    """
+    Inspect and clean up the local cache directory
+
+    cache
+    """
+
+    commands = [CacheStats(), CachePrune(), CacheClear()]
+
+    def handle(self):  # type: () -> Optional[int]
+        return self.call('help', self.config.name)
+
 
 class GenerateRemoteCache(Command):
     """
@@ -36,9 +234,13 @@ class GenerateRemoteCache(Command):
         {outdir : Output path where the csv and meta files are stored.}
         {--no-cache : Do not use cache}
         {--force-regen : Force regenerating all cache files}
+        {--profile : Print a per-stage timing and memory summary}
     """
 
     def handle(self):  # type: () -> Optional[int]
+        from poopsdontlie.helpers.cache import memoized
+        from poopsdontlie.helpers.remotecache import cache_gen
+
         outdir = Path(self.argument('outdir'))
 
         outdir.mkdir(exist_ok=True, parents=True)
@@ -50,7 +252,84 @@ class GenerateRemoteCache(Command):
         if self.option('force-regen'):
             force_regen = True
 
-        cache_gen(outdir, force_regen)
+        # the datasets share their upstream stages, those are loaded or computed once
+        with ProfileOption(self), memoized():
+            cache_gen(outdir, force_regen)
+
+
+class Refresh(Command):
+    """
+    Keep the local cache fresh: wait for upstream updates and recompute the datasets as soon as new data appears, run with serve_stale enabled elsewhere so readers never wait for a computation.
+
+    refresh
+        {countries?* : ISO Alpha-3 names of the countries, all supported countries when left out}
+        {--once : Recompute the expired datasets once and exit}
+        {--poll-interval=300 : Seconds between checks for new upstream data}
+        {--poll-timeout=21600 : Seconds to keep checking after an update time before giving up until the next one}
+        {--c|cache-dir= : Set cache dir for local cache}
+        {--profile : Print a per-stage timing and memory summary}
+    """
+
+    def handle(self):  # type: () -> Optional[int]
+        from poopsdontlie.helpers import refresh
+
+        if self.option('cache-dir'):
+            config['cachedir'] = self.option('cache-dir')
+
+        if config['cache'] != 'local':
+            self.line_error(f'The refresh command keeps the local cache fresh, the configured cache is {config["cache"]}')
+            return 100
+
+        valid_countries = sorted(list_countries().keys())
+        countries = [c.upper() for c in self.argument('countries')] or valid_countries
+        for country in countries:
+            if country not in valid_countries:
+                self.line(f'<error>Error:</error> country {country} not supported, use one of: {", ".join(valid_countries)}')
+                return 400
+
+        try:
+            with ProfileOption(self):
+                if self.option('once'):
+                    for country in countries:
+                        refresh.print_timings(country, refresh.refresh(country))
+                else:
+                    refresh.run(countries, int(self.option('poll-interval')), int(self.option('poll-timeout')))
+        finally:
+            wait_for_background(self)
+
+
+class Serve(Command):
+    """
+    Serve the datasets over HTTP, see poopsdontlie.helpers.server for the endpoints
+
+    serve
+        {--host=127.0.0.1 : Address to listen on}
+        {--port=8000 : Port to listen on}
+        {--max-age=60 : Seconds before a dataset is reloaded from the cache}
+        {--warm : Load all datasets and serialize their default responses before serving}
+        {--c|cache-dir= : Set cache dir for local cache}
+    """
+
+    def handle(self):  # type: () -> Optional[int]
+        from poopsdontlie.helpers.server import DataStore, make_server
+
+        if self.option('cache-dir'):
+            config['cachedir'] = self.option('cache-dir')
+
+        store = DataStore(max_age=int(self.option('max-age')))
+        if self.option('warm'):
+            store.warm()
+
+        server = make_server(self.option('host'), int(self.option('port')), store)
+        self.line(f'Serving on http://{self.option("host")}:{server.server_address[1]}/countries')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            wait_for_background(self)
 
 
 class ListSupportedCountries(Command):
@@ -92,16 +371,21 @@ class ListSupportedDatasets(Command):
 
 class GetRegionData(Command):
     """
-    Get the wastewater dataset for a specific country / region pair.
+    Get the wastewater dataset for a specific country / region pair, or several regions in one run that loads or computes the stages they share once.
 
     get
         {country : ISO Alpha-3 name of the country as listed by the list-command}
-        {region : Region name of the country as listed by the regions-command}
+        {region : Region name of the country as listed by the regions-command, a comma separated list of them or all}
         {outdir : Directory for storing the data}
-        {--format= : Either xlsx, json or csv (default)}
+        {--format= : One of csv (default), csv.gz, csv.zst, json, ndjson, parquet, feather or xlsx}
         {--no-cache : Do not use cache}
         {--cache-type= : Override config cache type, choose one of remote, local, none}
         {--c|cache-dir= : Set cache dir for local cache}
+        {--columns=* : Only get these columns, by column name or region code, e.g. GM0363}
+        {--layout= : wide (default, one column per region) or long (one row per date and region)}
+        {--max-points= : Get weekly or monthly rollups when the daily data has more dates than this}
+        {--how= : Aggregation of the rollups, mean (default) or median}
+        {--profile : Print a per-stage timing and memory summary}
     """
 
     def handle(self):  # type: () -> Optional[int]
@@ -113,15 +397,27 @@ class GetRegionData(Command):
             self.line_error(f'Directory {outdir.absolute()} does not exist')
             return 100
 
+        from poopsdontlie.helpers.export import export, formats
+
         if self.option('format'):
             format = self.option('format').lower().strip()
-            valid_output_formats = ('xlsx', 'json', 'csv')
-            if format not in valid_output_formats:
-                self.line_error(f'Output format {format} does not exist, choose one of {", ".join(valid_output_formats)}')
+            if format not in formats:
+                self.line_error(f'Output format {format} does not exist, choose one of {", ".join(formats)}')
                 return 200
         else:
             format = 'csv'
 
+        max_points = None
+        if self.option('max-points'):
+            try:
+                max_points = int(self.option('max-points'))
+            except ValueError:
+                max_points = 0
+
+            if max_points < 1:
+                self.line_error(f'--max-points={self.option("max-points")} invalid, use a positive number')
+                return 250
+
         if self.option('cache-type'):
             cache_type = self.option('cache-type').lower().strip()
             valid_types = ['remote', 'local', 'none']
@@ -129,6 +425,8 @@ class GetRegionData(Command):
                 self.write(f'<error>Error:</error> --cache-type={cache_type} invalid, choose one of: {", ".join(valid_types)}')
                 return 300
 
+            config['cache'] = cache_type
+
         if self.option('no-cache'):
             config['cache'] = None
 
@@ -141,28 +439,63 @@ class GetRegionData(Command):
             self.line(f'<error>Error:</error> country {country} not supported, use one of: {", ".join(valid_countries)}')
             return 400
 
-        if not is_valid_region(country, region):
-            self.line(f'<error>Error:</error> region {region} not supported, use one of: {", ".join(get_valid_regions(country))}')
-            return 500
-
-        df = get_region_data_for_country(country, region)
-
-        if format == 'csv':
-            filename = outdir / f'{country}_{region}.csv'
-            df.to_csv(filename, index=True)
-        elif format == 'xlsx':
-            filename = outdir / f'{country}_{region}.xlsx'
-            df.to_excel(filename, sheet_name=f'{country}_{region}')
-        elif format == 'json':
-            filename = outdir / f'{country}_{region}.json'
-            df.to_json(filename, orient='index')
+        regions = expand_regions(country, region)
+        for region in regions:
+            if not is_valid_region(country, region):
+                self.line(f'<error>Error:</error> region {region} not supported, use one of: {", ".join(get_valid_regions(country))}')
+                return 500
+
+        from poopsdontlie.helpers.cache import memoized
+
+        timings = []
+        retval = None
+        try:
+            with ProfileOption(self), memoized():
+                for region in regions:
+                    start = time.perf_counter()
+
+                    try:
+                        df = get_region_data_for_country(
+                            country, region, self.option('columns') or None, self.option('layout'),
+                            max_points=max_points, how=self.option('how') or 'mean',
+                        )
+                    except ValueError as e:
+                        self.line_error(str(e))
+                        retval = 600
+                        continue
+
+                    try:
+                        path = export(df, outdir, f'{country}_{region}', format)
+                    except ImportError as e:
+                        self.line_error(str(e))
+                        return 700
+
+                    timings.append((region, time.perf_counter() - start, path))
+
+                    if not ci_is_final(df):
+                        self.line(f'<comment>The confidence intervals of {region} are not final yet, they are computed in the background and cached when done</comment>')
+        finally:
+            wait_for_background(self)
+
+        if len(regions) > 1:
+            self.line('')
+            for region, seconds, path in timings:
+                self.line(f'{region:<32} {seconds:8.2f}s  {path}')
+
+        return retval
 
 
 def run():
     logging.basicConfig(format='%(message)s', level=logging.INFO)
 
     package = 'poops-dont-lie'
-    ver = pkg_resources.require(package)[0].version
+    try:
+        from importlib.metadata import version
+    except ImportError:  # python < 3.8
+        from pkg_resources import get_distribution
+
+        version = lambda name: get_distribution(name).version
+    ver = version(package)
 
     application = Application(name=package, version=ver)
 
@@ -170,9 +503,12 @@ def run():
         application.add(GenerateRemoteCache())
 
     application.add(Config())
+    application.add(Cache())
     application.add(ListSupportedCountries())
     application.add(ListSupportedDatasets())
     application.add(GetRegionData())
+    application.add(Refresh())
+    application.add(Serve())
 
     application.run()
 
@@ -1,9 +1,11 @@
 from poopsdontlie.helpers.io import download_file_with_progressbar
-from poopsdontlie.helpers.cache import cached_results, invalidate_beginning_of_next_month, invalidate_after_time_for_tz
-from poopsdontlie.helpers.joblib import tqdm_joblib
-from joblib import Parallel, delayed
+from poopsdontlie.helpers.cache import cached_results, InvalidateBeginningOfNextMonth, InvalidateAfterTimeForTz, PartitionedStore, \
+    fingerprint, partition_by_month, writable_cache, resolve_invalidate_after
+from poopsdontlie.helpers import planner
+from poopsdontlie.helpers.profiling import stage
+from poopsdontlie.helpers.shared import shared_inputs, resolve, pickled_size
+from joblib import delayed
 from tqdm.auto import tqdm
-from functools import lru_cache
 
 import numpy as np
 import pandas as pd
@@ -13,11 +15,26 @@ import warnings
 
 rivm_update_time = [(15, 17), 'Europe/Amsterdam']  # updates start at 15:15 Amsterdam time, it usually takes a minute or two before update is finished
 
-@cached_results(key='cbs_awzi_population_mappings_2020', invalidate_after=invalidate_beginning_of_next_month(), cache_level='backend')
-def download_awzi_population_mappings_2020():
-    mapping_excel = 'https://www.cbs.nl/-/media/_excel/2021/01/aantal-inwoners-per-verzorgingsgebied-van-rioolwaterzuiveringsinstallaties.xlsx'
+cbs_mappings_2020_url = 'https://www.cbs.nl/-/media/_excel/2021/01/aantal-inwoners-per-verzorgingsgebied-van-rioolwaterzuiveringsinstallaties.xlsx'
+cbs_mappings_2021_url = 'https://www.cbs.nl/-/media/_excel/2021/39/20210930-aantal-inwoners-per-verzorgingsgebied-2021.xlsx'
+rivm_sewage_data_url = 'https://data.rivm.nl/covid-19/COVID-19_rioolwaterdata.json'
+
+# the upstream sources with the policy that tells when they are updated, see helpers.refresh
+def upstream_sources():
+    return [
+        ('rivm_sewage_data', rivm_sewage_data_url, InvalidateAfterTimeForTz(*rivm_update_time)),
+        ('cbs_awzi_population_mappings_2020', cbs_mappings_2020_url, InvalidateBeginningOfNextMonth()),
+        ('cbs_awzi_population_mappings_2021', cbs_mappings_2021_url, InvalidateBeginningOfNextMonth()),
+    ]
+
+
+# rows that are mapped in-process to measure the cost per row before the work is planned
+_MAP_MERGE_PROBE_ROWS = 100
+
+
+def parse_awzi_population_mappings_2020(fh):
     sheet = 'Tabel 1'
-    df_rwzi = pd.read_excel(download_file_with_progressbar(mapping_excel), sheet, skiprows=2)
+    df_rwzi = pd.read_excel(fh, sheet, skiprows=2)
 
     # both start and end-rows have the same offset
     offset = 3
@@ -30,18 +47,25 @@ def download_awzi_population_mappings_2020():
     return df_rwzi.reset_index(drop=True)
 
 
-@cached_results(key='cbs_awzi_population_mappings_2021', invalidate_after=invalidate_beginning_of_next_month(), cache_level='backend')
-def download_awzi_population_mappings_2021():
-    mapping_excel = 'https://www.cbs.nl/-/media/_excel/2021/39/20210930-aantal-inwoners-per-verzorgingsgebied-2021.xlsx'
+@cached_results(key='cbs_awzi_population_mappings_2020', invalidate_after=InvalidateBeginningOfNextMonth(), cache_level='backend')
+def download_awzi_population_mappings_2020():
+    return parse_awzi_population_mappings_2020(download_file_with_progressbar(cbs_mappings_2020_url))
+
+
+def parse_awzi_population_mappings_2021(fh):
     sheet = 'Tabel 1'
-    df_rwzi = pd.read_excel(download_file_with_progressbar(mapping_excel), sheet)
+    df_rwzi = pd.read_excel(fh, sheet)
 
     return df_rwzi
 
 
-@cached_results(key='rivm_sewage_data', invalidate_after=invalidate_after_time_for_tz(*rivm_update_time), cache_level='backend')
-def download_sewage_data():
-    df_sewage = pd.read_json(download_file_with_progressbar('https://data.rivm.nl/covid-19/COVID-19_rioolwaterdata.json'))
+@cached_results(key='cbs_awzi_population_mappings_2021', invalidate_after=InvalidateBeginningOfNextMonth(), cache_level='backend')
+def download_awzi_population_mappings_2021():
+    return parse_awzi_population_mappings_2021(download_file_with_progressbar(cbs_mappings_2021_url))
+
+
+def parse_sewage_data(fh):
+    df_sewage = pd.read_json(fh)
 
     df_sewage['Date_measurement'] = pd.to_datetime(df_sewage['Date_measurement'])
     df_sewage = df_sewage.set_index('Date_measurement')
@@ -52,6 +76,11 @@ def download_sewage_data():
     return df_sewage
 
 
+@cached_results(key='rivm_sewage_data', invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time), cache_level='backend')
+def download_sewage_data():
+    return parse_sewage_data(download_file_with_progressbar(rivm_sewage_data_url))
+
+
 def get_vals_for_non_null_cols(cols, df):
     sel = ~df[cols].isnull()
     sel = sel.columns[sel.iloc[0]]
@@ -70,12 +99,10 @@ def gm_or_vr_to_dict_2020(df, popsize):
     return {k.split('\n')[0].split(' ')[0]: int(round(v / 100 * popsize, 0)) for k, v in sel.to_dict().items()}
 
 
-def get_rwzi_mappings_2020(rwzi_number, df_rwzi_2020, vrcols_2020, gmcols_2020):
-    if not hasattr(get_rwzi_mappings_2020, 'cache'):
-        get_rwzi_mappings_2020.cache = {}
-
-    if rwzi_number in get_rwzi_mappings_2020.cache:
-        return get_rwzi_mappings_2020.cache[rwzi_number]
+def get_rwzi_mappings_2020(rwzi_number, df_rwzi_2020, vrcols_2020, gmcols_2020, cache=None):
+    # cache holds the mappings of the plants looked up in df_rwzi_2020 so far, it must not outlive that table
+    if cache is not None and rwzi_number in cache:
+        return cache[rwzi_number]
 
     df_rwzi = df_rwzi_2020[df_rwzi_2020['Code Rioolwaterzuiveringsinstallatie'] == rwzi_number]
 
@@ -97,7 +124,8 @@ def get_rwzi_mappings_2020(rwzi_number, df_rwzi_2020, vrcols_2020, gmcols_2020):
     ret['VR'] = gm_or_vr_to_dict_2020(df_vr, ret['population_size'])
     ret['GM'] = gm_or_vr_to_dict_2020(df_gm, ret['population_size'])
 
-    get_rwzi_mappings_2020.cache[rwzi_number] = ret
+    if cache is not None:
+        cache[rwzi_number] = ret
 
     return ret
 
@@ -139,47 +167,107 @@ def get_rwzi_mappings_2021(measurement_date, rwzi_number, df_rwzi_2021):
     return ret
 
 
-def get_rwzi_mappings(measurement_date, rwzi_number, idx, df_rwzi_2020, vrcols_2020, gmcols_2020, df_rwzi_2021):
+def get_rwzi_mappings(measurement_date, rwzi_number, idx, df_rwzi_2020, vrcols_2020, gmcols_2020, df_rwzi_2021, cache=None):
     ret = None
 
     if measurement_date.year == 2020:
-        ret = get_rwzi_mappings_2020(rwzi_number, df_rwzi_2020, vrcols_2020, gmcols_2020)
+        ret = get_rwzi_mappings_2020(rwzi_number, df_rwzi_2020, vrcols_2020, gmcols_2020, cache)
     elif measurement_date.year > 2020:
         ret = get_rwzi_mappings_2021(measurement_date, rwzi_number, df_rwzi_2021)
 
         # if it doesn't exist, it's probably in the 2020 dataset
         if ret is None:
-            ret = get_rwzi_mappings_2020(rwzi_number, df_rwzi_2020, vrcols_2020, gmcols_2020)
+            ret = get_rwzi_mappings_2020(rwzi_number, df_rwzi_2020, vrcols_2020, gmcols_2020, cache)
 
     if ret is not None:
-        ret['idx'] = idx
+        # the cached mappings are shared by all rows of a plant
+        ret = {**ret, 'idx': idx}
 
     return ret
 
 
-def _rwzi_mappings_worker(rows, df_rwzi_2020, vrcols_2020, gmcols_2020, df_rwzi_2021):
+def _rwzi_mappings_worker(rows, shared_rwzi_2020, shared_rwzi_2021):
+    df_rwzi_2020, vrcols_2020, gmcols_2020 = resolve(shared_rwzi_2020)
+    df_rwzi_2021 = resolve(shared_rwzi_2021)
+
+    # per call, workers are reused between runs that may map with newer tables
+    cache = {}
+
     retvals = []
     for idx, row in rows.iterrows():
-        retvals.append(get_rwzi_mappings(row['Date_measurement'], row['RWZI_AWZI_code'], idx, df_rwzi_2020, vrcols_2020, gmcols_2020, df_rwzi_2021))
+        retvals.append(get_rwzi_mappings(row['Date_measurement'], row['RWZI_AWZI_code'], idx, df_rwzi_2020, vrcols_2020, gmcols_2020, df_rwzi_2021, cache))
 
     return retvals
 
 
-@cached_results(key='merged_mapping_rwzi_gmvr', invalidate_after=invalidate_after_time_for_tz(*rivm_update_time), cache_level='backend')
+def _reuse_mapped_partitions(store, df_rwzi_gm_vr, tables_fingerprint):
+    """
+    Split the rows in monthly partitions, returns the mapped partitions that can be reused from the store, the rows that
+    still have to be mapped and the source fingerprint of every month
+    """
+    reused = []
+    to_map = []
+    source_fingerprints = {}
+
+    for month, part in partition_by_month(df_rwzi_gm_vr, 'Date_measurement').items():
+        # the row labels are positions in the full table, they shift when rows are added so they are not hashed
+        source_fingerprints[month] = fingerprint(part, index=False, salt=tables_fingerprint)
+        df_mapped = store.get_partition(month, source_fingerprints[month])
+
+        if df_mapped is None or df_mapped.shape[0] != part.shape[0]:
+            to_map.append(part)
+        else:
+            df_mapped.index = part.index
+            reused.append(df_mapped)
+
+    df_to_map = pd.concat(to_map) if to_map else df_rwzi_gm_vr.iloc[:0]
+
+    return reused, df_to_map, source_fingerprints
+
+
 def map_merge_rwzi_gmvr(df_rwzi_gm_vr, jobs):
+    """
+    Map the measurements to municipalities / safety-regions, the result is only cached as monthly partitions
+    """
     df_rwzi_2021 = get_df_rwzi_2021()
     df_rwzi_2020, vrcols_2020, gmcols_2020 = get_df_rwzi_2020()
 
-    chunksize = 300
-    chunks = np.array_split(df_rwzi_gm_vr, np.ceil(df_rwzi_gm_vr.shape[0] / chunksize))
+    # months of which the measurements and the mapping tables did not change are reused from the partition store
+    store = PartitionedStore(writable_cache(), 'merged_mapping_rwzi_gmvr', cache_level='backend', date_column='Date_measurement')
+    tables_fingerprint = fingerprint(df_rwzi_2020) + fingerprint(df_rwzi_2021)
+    reused, df_rwzi_gm_vr, source_fingerprints = _reuse_mapped_partitions(store, df_rwzi_gm_vr, tables_fingerprint)
+    print(f'Reusing {len(reused)} of {len(source_fingerprints)} monthly partitions')
+
+    stage_name = 'map_merge_rwzi_gmvr.map'
+    retvals = []
+    rows = df_rwzi_gm_vr
 
     print('Map rwzi data to municipalities / safety-regions')
-    with tqdm_joblib(tqdm(total=len(chunks), unit='runner tasks')) as progress_bar:
+    if not planner.has_cost(stage_name):
+        # measure the cost per row on a probe in this process
+        probe, rows = rows.iloc[:_MAP_MERGE_PROBE_ROWS], rows.iloc[_MAP_MERGE_PROBE_ROWS:]
+        with planner.measure(stage_name, n_items=probe.shape[0]):
+            retvals.append(_rwzi_mappings_worker(probe, (df_rwzi_2020, vrcols_2020, gmcols_2020), df_rwzi_2021))
+
+    plan = planner.plan(stage_name, n_items=rows.shape[0], max_workers=jobs)
+    offsets = np.cumsum([0, *plan.chunks])
+    chunks = [rows.iloc[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    executor = plan.executor()
+
+    # the mapping tables are written once and memory-mapped by the workers instead of pickled for every chunk
+    with shared_inputs(executor) as shared, \
+            stage(stage_name, df_rwzi_gm_vr, chunks=len(chunks), n_jobs=plan.n_jobs, executor=executor.__class__.__name__) as s:
+        shared_rwzi_2020 = shared.put((df_rwzi_2020, vrcols_2020, gmcols_2020))
+        shared_rwzi_2021 = shared.put(df_rwzi_2021)
+        s.set(shared_bytes=shared.nbytes, ipc_bytes_per_task=pickled_size((shared_rwzi_2020, shared_rwzi_2021)),
+              reused_partitions=len(reused))
+
         # retvals = Parallel(n_jobs=jobs)(
         #     delayed(get_rwzi_mappings)(row['Date_measurement'], row['RWZI_AWZI_code'], idx, df_rwzi_2020, vrcols_2020, gmcols_2020, df_rwzi_2021) for idx, row in df_rwzi_gm_vr.iterrows()
         # )
-        retvals = Parallel(n_jobs=jobs)(
-            delayed(_rwzi_mappings_worker)(rows, df_rwzi_2020, vrcols_2020, gmcols_2020, df_rwzi_2021) for rows in chunks
+        retvals += executor.run(
+            (delayed(_rwzi_mappings_worker)(chunk, shared_rwzi_2020, shared_rwzi_2021) for chunk in chunks),
+            n_jobs=plan.n_jobs, progress=tqdm(total=len(chunks), unit='runner tasks'),
         )
 
 
@@ -187,29 +275,35 @@ def map_merge_rwzi_gmvr(df_rwzi_gm_vr, jobs):
 
     # ignore fragmentation error
     warnings.simplefilter(action='ignore', category=pd.errors.PerformanceWarning)
-    for i in tqdm(retvals):
-        for r in i:
-            assert r is not None
+    with stage('map_merge_rwzi_gmvr.merge', df_rwzi_gm_vr) as s:
+        df_rwzi_gm_vr = df_rwzi_gm_vr.copy()
+
+        for i in tqdm(retvals):
+            for r in i:
+                assert r is not None
 
-            idx = r['idx']
-            df_rwzi_gm_vr.at[idx, 'population_attached_to_rwzi'] = r['population_size']
+                idx = r['idx']
+                df_rwzi_gm_vr.at[idx, 'population_attached_to_rwzi'] = r['population_size']
 
-            for k, v in r['GM'].items():
-                df_rwzi_gm_vr.at[idx, k] = v
+                for k, v in r['GM'].items():
+                    df_rwzi_gm_vr.at[idx, k] = v
 
-            for k, v in r['VR'].items():
-                df_rwzi_gm_vr.at[idx, k] = v
+                for k, v in r['VR'].items():
+                    df_rwzi_gm_vr.at[idx, k] = v
 
-    # defrag the table
-    df_rwzi_gm_vr = df_rwzi_gm_vr.copy()
+        # defrag the table
+        df_rwzi_gm_vr = pd.concat([*reused, df_rwzi_gm_vr] if df_rwzi_gm_vr.shape[0] or not reused else reused).sort_index()
+        s.set_output(df_rwzi_gm_vr)
 
     # enable performance warnings
     warnings.simplefilter(action='default', category=pd.errors.PerformanceWarning)
 
+    store.write(df_rwzi_gm_vr, resolve_invalidate_after(InvalidateAfterTimeForTz(*rivm_update_time)), source_fingerprints)
+
     return df_rwzi_gm_vr
 
 
-@cached_results(key='rna_flow_per_gmvr', invalidate_after=invalidate_after_time_for_tz(*rivm_update_time), cache_level='backend')
+@cached_results(key='rna_flow_per_gmvr', invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time), cache_level='backend')
 def rna_flow_per_gmvr(df_rna_flow_gmvz, gmcols, vrcols):
     print('Splitting RNA flow per municipality / safety-region')
     for col in tqdm([*gmcols, *vrcols]):
@@ -225,7 +319,7 @@ def rna_flow_per_gmvr(df_rna_flow_gmvz, gmcols, vrcols):
     return df_rna_flow_gmvz
 
 
-@cached_results(key='get_rwzi_gmvm_mapped_data', invalidate_after=invalidate_after_time_for_tz(*rivm_update_time), cache_level='backend')
+@cached_results(key='get_rwzi_gmvm_mapped_data', invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time), cache_level='backend')
 def get_rwzi_gmvm_mapped_data(jobs):
     df_sewage = download_sewage_data()
 
@@ -243,7 +337,8 @@ def get_rwzi_gmvm_mapped_data(jobs):
     return df_rwzi_gm_vr
 
 
-@lru_cache()
+# the mapping tables are read through the cached downloads on every call, so they are replaced when CBS publishes new
+# ones, also in a long-running process like the refresh daemon
 def get_df_rwzi_2020():
     df_rwzi_2020 = download_awzi_population_mappings_2020()
 
@@ -253,14 +348,13 @@ def get_df_rwzi_2020():
     return df_rwzi_2020, vrcols_2020, gmcols_2020
 
 
-@lru_cache()
 def get_df_rwzi_2021():
     df_rwzi_2021 = download_awzi_population_mappings_2021()
 
     return df_rwzi_2021
 
 
-@cached_results(key='get_geodata_gemeentes', invalidate_after=invalidate_beginning_of_next_month(), cache_level='backend')
+@cached_results(key='get_geodata_gemeentes', invalidate_after=InvalidateBeginningOfNextMonth(), cache_level='backend')
 def get_geodata_gemeentes():
     # Haal de kaart met gemeentegrenzen op van PDOK
     geodata_url = 'https://geodata.nationaalgeoregister.nl/cbsgebiedsindelingen/wfs?request=GetFeature&service=WFS&version=2.0.0&typeName=cbs_gemeente_2021_gegeneraliseerd&outputFormat=json'
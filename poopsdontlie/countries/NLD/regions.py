@@ -1,7 +1,10 @@
 from poopsdontlie.countries.NLD.helpers import download_sewage_data, get_rwzi_gmvm_mapped_data, rivm_update_time, get_geodata_gemeentes
-from poopsdontlie.helpers.cache import cached_results, invalidate_after_time_for_tz
+from poopsdontlie.helpers.cache import cached_results, cached_columns, InvalidateAfterTimeForTz
+from poopsdontlie.helpers.columns import select_columns
+from poopsdontlie.helpers.layout import wide_to_long, smoothed_to_long
 from poopsdontlie.helpers import config
-from tqdm.auto import tqdm
+
+import functools
 
 import pandas as pd
 import numpy as np
@@ -9,91 +12,129 @@ import numpy as np
 from poopsdontlie.smoothers.lowess import lowess_per_col, lowess_from_median
 
 
+# lowess results are cached per column, so a request for a few regions only smooths those regions
+lowess_per_column = cached_columns(
+    key='lowess_per_column',
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
+    config_keys=('bootstrap_iters', 'bootstrap_tol'),
+)(lowess_per_col)
+
+
+def _per_capita(df_rwzi_gm_vr, cols):
+    # float arrays with NaN for missing values, a plant without population gives NaN instead of inf
+    values = df_rwzi_gm_vr[cols].to_numpy(dtype=float, na_value=np.nan)
+    population = df_rwzi_gm_vr['population_attached_to_rwzi'].to_numpy(dtype=float, na_value=np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_capita = values / population[:, None]
+
+    return np.where(np.isfinite(per_capita), per_capita, np.nan)
+
+
+def _to_int(df):
+    return df.round(0).astype(pd.Int64Dtype())
+
+
+# the layout argument of the datasets is handled by cached_results, it converts the cached wide frame with to_long
 @cached_results(
     key='rna_flow_per_capita_for_veiligheidsregio',
-    invalidate_after=invalidate_after_time_for_tz(*rivm_update_time),
-    cache_level='apiresult'
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
+    cache_level='apiresult',
+    to_long=wide_to_long,
+    rollups=True,
 )
-def rna_flow_per_capita_for_veiligheidsregio(jobs=config['n_jobs']):
+def rna_flow_per_capita_for_veiligheidsregio(jobs=None, layout=None):
+    if jobs is None:
+        jobs = config['n_jobs']
+
     df_rwzi_gm_vr = get_rwzi_gmvm_mapped_data(jobs=jobs)
     vrcols = sorted([x for x in df_rwzi_gm_vr.columns if x.startswith('VR')])
 
-    df_vr_rna_flow = pd.DataFrame(index=pd.to_datetime([]))
-
     print('Converting RNA flow per municipality / safety-region to flow per capita')
-    for col in tqdm(vrcols):
-        df_vr = df_rwzi_gm_vr[['Date_measurement', col, 'population_attached_to_rwzi']].groupby('Date_measurement').sum()
-        df_vr_rna_flow = df_vr_rna_flow.join(
-            (df_vr[col] / df_vr['population_attached_to_rwzi']).round(0).resample('D').last().rename(f'RNA_flow_per_capita_{col}'),
-            how='outer'
-        )
+    # total flow of a safety region per date divided by the total population attached to the plants of that date,
+    # for all safety regions at once
+    df_sums = pd.DataFrame(
+        df_rwzi_gm_vr[[*vrcols, 'population_attached_to_rwzi']].to_numpy(dtype=float, na_value=np.nan),
+        columns=[*vrcols, 'population_attached_to_rwzi'],
+    ).groupby(df_rwzi_gm_vr['Date_measurement'].to_numpy()).sum()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df_vr_rna_flow = df_sums[vrcols].div(df_sums['population_attached_to_rwzi'], axis=0)
 
-    return df_vr_rna_flow.round(0).astype(pd.Int64Dtype())
+    df_vr_rna_flow = df_vr_rna_flow.replace([np.inf, -np.inf], np.nan).round(0)
+    df_vr_rna_flow.index = pd.DatetimeIndex(df_vr_rna_flow.index, name='Date_measurement')
+
+    return _to_int(df_vr_rna_flow.resample('D').last().add_prefix('RNA_flow_per_capita_'))
 
 
 @cached_results(
     key='smoothed_rna_flow_per_capita_for_veiligheidsregio',
-    invalidate_after=invalidate_after_time_for_tz(*rivm_update_time),
-    cache_level='smoothed_api_result'
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
+    cache_level='smoothed_api_result',
+    bypass_if=('columns',),
+    to_long=smoothed_to_long,
+    rollups=True,
+    provisional={'ci': False},
 )
-def smoothed_rna_flow_per_capita_for_veiligheidsregio():
+def smoothed_rna_flow_per_capita_for_veiligheidsregio(columns=None, ci=True, layout=None):
     df = rna_flow_per_capita_for_veiligheidsregio()
 
-    df_smooth = lowess_per_col(df, df.columns)
+    df_smooth = lowess_per_column(df, select_columns(df, columns), ci=ci)
 
     return df_smooth
 
 
 @cached_results(
     key='rna_flow_per_capita_for_gemeente',
-    invalidate_after=invalidate_after_time_for_tz(*rivm_update_time),
-    cache_level='apiresult'
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
+    cache_level='apiresult',
+    to_long=wide_to_long,
+    rollups=True,
 )
-def rna_flow_per_capita_for_gemeente(jobs=config['n_jobs']):
+def rna_flow_per_capita_for_gemeente(jobs=None, layout=None):
+    if jobs is None:
+        jobs = config['n_jobs']
+
     df_rwzi_gm_vr = get_rwzi_gmvm_mapped_data(jobs=jobs)
     gmcols = sorted([x for x in df_rwzi_gm_vr.columns if x.startswith('GM')])
 
-    df_gem_rna_flow = pd.DataFrame(index=pd.to_datetime([]))
-
     print('Converting RNA flow per municipality / safety-region to flow per capita')
-    for col in tqdm(gmcols):
-        # first select the columns of interest
-        df_sel = df_rwzi_gm_vr[['Date_measurement', col, 'population_attached_to_rwzi']].copy()
-
-        # now divide RNA flow by population number
-        df_sel[col] = df_sel[col] / df_sel['population_attached_to_rwzi']
+    # divide RNA flow by population number and take the mean if there's more than one measurement, for all
+    # municipalities at once
+    df_gem_rna_flow = pd.DataFrame(_per_capita(df_rwzi_gm_vr, gmcols), columns=gmcols) \
+        .groupby(df_rwzi_gm_vr['Date_measurement'].to_numpy()).mean().round(0)
+    df_gem_rna_flow.index = pd.DatetimeIndex(df_gem_rna_flow.index, name='Date_measurement')
 
-        # take the mean if theres more than one measurement
-        df_gem = df_sel.groupby('Date_measurement').sum() / df_sel.groupby('Date_measurement').count()
+    df_gem_rna_flow = df_gem_rna_flow.resample('D').last().add_prefix('RNA_flow_per_capita_')
 
-        # join data into result dataframe
-        df_gem_rna_flow = df_gem_rna_flow.join(
-            df_gem[col].round(0).resample('D').last().rename(f'RNA_flow_per_capita_{col}'),
-            how='outer'
-        )
-
-    return df_gem_rna_flow.round(0).replace(0, np.nan).astype(pd.Int64Dtype())
+    return _to_int(df_gem_rna_flow.replace(0, np.nan))
 
 
 @cached_results(
     key='smoothed_rna_flow_per_capita_for_gemeente',
-    invalidate_after=invalidate_after_time_for_tz(*rivm_update_time),
-    cache_level='smoothed_api_result'
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
+    cache_level='smoothed_api_result',
+    bypass_if=('columns',),
+    to_long=smoothed_to_long,
+    rollups=True,
+    provisional={'ci': False},
 )
-def smoothed_rna_flow_per_capita_for_gemeente():
+def smoothed_rna_flow_per_capita_for_gemeente(columns=None, ci=True, layout=None):
     df = rna_flow_per_capita_for_gemeente()
 
-    df_smooth = lowess_per_col(df, df.columns)
+    df_smooth = lowess_per_column(df, select_columns(df, columns), ci=ci)
 
     return df_smooth
 
 
 @cached_results(
     key='rna_flow_per_capita_for_rwzi',
-    invalidate_after=invalidate_after_time_for_tz(*rivm_update_time),
-    cache_level='apiresult'
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
+    cache_level='apiresult',
+    to_long=wide_to_long,
+    rollups=True,
 )
-def rna_flow_per_capita_for_rwzi():
+def rna_flow_per_capita_for_rwzi(layout=None):
     df = download_sewage_data()
 
     df['RNA_flow_per_100000'] = (df['RNA_flow_per_100000'] / 100_000).round(0)
@@ -113,20 +154,24 @@ def rna_flow_per_capita_for_rwzi():
 
 @cached_results(
     key='smoothed_rna_flow_per_capita_for_rwzi',
-    invalidate_after=invalidate_after_time_for_tz(*rivm_update_time),
-    cache_level='smoothed_api_result'
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
+    cache_level='smoothed_api_result',
+    bypass_if=('columns',),
+    to_long=smoothed_to_long,
+    rollups=True,
+    provisional={'ci': False},
 )
-def smoothed_rna_flow_per_capita_for_rwzi():
+def smoothed_rna_flow_per_capita_for_rwzi(columns=None, ci=True, layout=None):
     df = rna_flow_per_capita_for_rwzi()
 
-    df_smooth = lowess_per_col(df, df.columns)
+    df_smooth = lowess_per_column(df, select_columns(df, columns), ci=ci)
 
     return df_smooth
 
 
 @cached_results(
     key='rna_flow_per_100k_people_for_rwzi',
-    invalidate_after=invalidate_after_time_for_tz(*rivm_update_time),
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
     cache_level='apiresult'
 )
 def rna_flow_per_100k_people_for_rwzi():
@@ -135,13 +180,16 @@ def rna_flow_per_100k_people_for_rwzi():
 
 @cached_results(
     key='smoothed_rna_flow_per_capita_national_level',
-    invalidate_after=invalidate_after_time_for_tz(*rivm_update_time),
-    cache_level='smoothed_api_result'
+    invalidate_after=InvalidateAfterTimeForTz(*rivm_update_time),
+    cache_level='smoothed_api_result',
+    provisional={'ci': False},
+    to_long=functools.partial(smoothed_to_long, region='NL'),
+    rollups=True,
 )
-def smoothed_rna_flow_per_capita_national_level():
+def smoothed_rna_flow_per_capita_national_level(ci=True, layout=None):
     # get RWZI data and cast to float64 for easier processing
     df_rwzi = rna_flow_per_capita_for_rwzi().astype(pd.Float64Dtype())
 
-    df_smooth = lowess_from_median(df_rwzi)
+    df_smooth = lowess_from_median(df_rwzi, ci=ci)
 
     return df_smooth
@@ -0,0 +1,195 @@
+"""
+Generator for synthetic RIVM sewage data and CBS sewage treatment plant mappings
+
+The generated files have the same layout as the upstream files, so they go through the same parsers and pipeline as
+the real data. Used by the benchmark suite to measure performance offline at a configurable scale.
+"""
+import itertools
+import json
+
+from collections import namedtuple
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from poopsdontlie.countries.NLD.helpers import parse_sewage_data, parse_awzi_population_mappings_2020, \
+    parse_awzi_population_mappings_2021
+
+
+SyntheticDataset = namedtuple('SyntheticDataset', ['sewage_json', 'mappings_2020_xlsx', 'mappings_2021_xlsx'])
+
+
+def _regions(n_plants, n_gemeentes, n_veiligheidsregios, rng):
+    gemeentes = [f'GM{i:04d}' for i in range(1, n_gemeentes + 1)]
+    veiligheidsregios = [f'VR{i:02d}' for i in range(1, n_veiligheidsregios + 1)]
+
+    # every municipality is part of exactly one safety region
+    gm_to_vr = {gm: veiligheidsregios[i % n_veiligheidsregios] for i, gm in enumerate(gemeentes)}
+
+    plants = []
+    for i in range(n_plants):
+        # plants serve one to three municipalities, every municipality is served by at least one plant
+        served = {gemeentes[i % n_gemeentes]}
+        served |= set(rng.choice(gemeentes, size=rng.integers(0, 3), replace=False))
+        served = sorted(served)
+
+        shares = rng.dirichlet(np.ones(len(served)))
+        gm_shares = dict(zip(served, shares))
+
+        vr_shares = {}
+        for gm, share in gm_shares.items():
+            vr_shares[gm_to_vr[gm]] = vr_shares.get(gm_to_vr[gm], 0) + share
+
+        plants.append({
+            'code': 1000 + i,
+            'name': f'RWZI {1000 + i}',
+            'population': int(rng.integers(5_000, 500_000)),
+            'GM': gm_shares,
+            'VR': vr_shares,
+        })
+
+    return plants, gemeentes, veiligheidsregios
+
+
+def _sewage_json(plants, start, n_days, rng):
+    dates = pd.date_range(start, periods=n_days, freq='D')
+
+    # a few covid waves, every plant follows the national trend with its own noise and offset
+    t = np.arange(n_days)
+    trend = 1e13 * (1.5 + np.sin(t / 45) + .5 * np.sin(t / 11))
+
+    records = []
+    for plant in plants:
+        # plants start reporting at different dates and measure a few times per week
+        first_day = int(rng.integers(0, max(1, n_days // 5)))
+        measured = rng.random(n_days) < .5
+        measured[:first_day] = False
+
+        level = trend * rng.lognormal(0, .3) * rng.lognormal(0, .4, size=n_days)
+
+        for day in np.flatnonzero(measured):
+            value = '' if rng.random() < .01 else float(round(level[day]))
+            records.append({
+                'Date_measurement': dates[day].strftime('%Y-%m-%d'),
+                'RWZI_AWZI_code': plant['code'],
+                'RWZI_AWZI_name': plant['name'],
+                'X_coordinate': int(rng.integers(10_000, 280_000)),
+                'Y_coordinate': int(rng.integers(300_000, 620_000)),
+                'Postal_code': f'{rng.integers(1000, 9999)}AA',
+                'Security_region_code': next(iter(plant['VR'])),
+                'Security_region_name': next(iter(plant['VR'])),
+                'Percentage_in_security_region': '1',
+                'RNA_flow_per_100000': value,
+                'Representative_measurement': True,
+            })
+
+    return json.dumps(records).encode()
+
+
+def _mappings_2020_xlsx(plants, gemeentes, veiligheidsregios, rng):
+    gmcols = [f'{gm} Gemeente {gm[2:]}' for gm in gemeentes]
+    vrcols = [f'{vr} Veiligheidsregio {vr[2:]}' for vr in veiligheidsregios]
+    columns = ['Code Rioolwaterzuiveringsinstallatie', 'Naam Rioolwaterzuiveringsinstallatie', 'Inwoners verzorgingsgebied', *gmcols, *vrcols]
+
+    rows = []
+    for plant in plants:
+        row = {'Code Rioolwaterzuiveringsinstallatie': plant['code'], 'Naam Rioolwaterzuiveringsinstallatie': plant['name'],
+               'Inwoners verzorgingsgebied': plant['population']}
+        # CBS publishes percentages rounded to one decimal
+        row.update({f'{gm} Gemeente {gm[2:]}': round(share * 100, 1) for gm, share in plant['GM'].items()})
+        row.update({f'{vr} Veiligheidsregio {vr[2:]}': round(share * 100, 1) for vr, share in plant['VR'].items()})
+        rows.append(row)
+
+    # inhabitants that are not connected to a sewage treatment plant
+    rows.append({'Code Rioolwaterzuiveringsinstallatie': 'Geen', 'Naam Rioolwaterzuiveringsinstallatie': 'Geen',
+                 'Inwoners verzorgingsgebied': int(rng.integers(1_000, 10_000))})
+
+    df = pd.DataFrame(rows, columns=columns)
+
+    # the CBS sheet has a title, two header rows and a three row header- and footer-block around the data
+    header = pd.DataFrame([['code', 'naam', 'aantal'], ['', '', ''], ['', '', '']], columns=columns[:3]).reindex(columns=columns)
+    footer = pd.DataFrame([['Bron: synthetic'], ['Toelichting'], ['Einde tabel']], columns=columns[:1]).reindex(columns=columns)
+    df = pd.concat([header, df, footer], ignore_index=True)
+
+    fh = BytesIO()
+    with pd.ExcelWriter(fh, engine='openpyxl') as writer:
+        pd.DataFrame([['Aantal inwoners per verzorgingsgebied (synthetic)'], [None]]).to_excel(writer, sheet_name='Tabel 1', header=False, index=False)
+        df.to_excel(writer, sheet_name='Tabel 1', startrow=2, index=False)
+    fh.seek(0)
+
+    return fh.getvalue()
+
+
+def _mappings_2021_xlsx(plants, start):
+    startdatum = pd.Timestamp(start).replace(month=1, day=1)
+
+    # mappings that were replaced before startdatum, to have some rows with an einddatum like the upstream sheet
+    expired = (startdatum - pd.DateOffset(years=1), startdatum - pd.Timedelta(days=1))
+
+    rows = []
+    for i, plant in enumerate(plants):
+        periods = [(startdatum, pd.NaT)] if i % 10 else [expired, (startdatum, pd.NaT)]
+
+        for (start_period, end_period), regio_type in itertools.product(periods, ('GM', 'VR')):
+            for regio_code, share in plant[regio_type].items():
+                for toelichting in ('definitief', 'voorlopig'):
+                    rows.append({
+                        'rwzi_code': plant['code'],
+                        'rwzi_naam': plant['name'],
+                        'regio_type': regio_type,
+                        'regio_code': regio_code,
+                        'regio_naam': regio_code,
+                        'inwoners': plant['population'],
+                        'aandeel': share,
+                        'startdatum': start_period,
+                        'einddatum': end_period,
+                        'toelichting': toelichting,
+                    })
+
+    fh = BytesIO()
+    pd.DataFrame(rows).to_excel(fh, sheet_name='Tabel 1', index=False, engine='openpyxl')
+
+    return fh.getvalue()
+
+
+def generate_dataset(n_plants=50, n_days=365, start='2020-09-01', n_gemeentes=None, n_veiligheidsregios=25, seed=0):
+    """
+    Generate the raw RIVM sewage json and CBS 2020 / 2021 mapping sheets for n_plants over n_days
+
+    The default start date makes the measurements span both the 2020 and 2021 mapping sheets.
+    """
+    rng = np.random.default_rng(seed)
+
+    if n_gemeentes is None:
+        # roughly the ratio of municipalities to sewage treatment plants in the Netherlands
+        n_gemeentes = max(1, int(n_plants * 1.2))
+
+    n_veiligheidsregios = min(n_veiligheidsregios, n_gemeentes)
+
+    plants, gemeentes, veiligheidsregios = _regions(n_plants, n_gemeentes, n_veiligheidsregios, rng)
+
+    return SyntheticDataset(
+        sewage_json=_sewage_json(plants, start, n_days, rng),
+        mappings_2020_xlsx=_mappings_2020_xlsx(plants, gemeentes, veiligheidsregios, rng),
+        mappings_2021_xlsx=_mappings_2021_xlsx(plants, start),
+    )
+
+
+def parse_dataset(dataset):
+    """
+    Parse a synthetic dataset with the same parsers that are used for the upstream files
+    """
+    return {
+        'rivm_sewage_data': parse_sewage_data(BytesIO(dataset.sewage_json)),
+        'cbs_awzi_population_mappings_2020': parse_awzi_population_mappings_2020(BytesIO(dataset.mappings_2020_xlsx)),
+        'cbs_awzi_population_mappings_2021': parse_awzi_population_mappings_2021(BytesIO(dataset.mappings_2021_xlsx)),
+    }
+
+
+def seed_cache(cache, dataset):
+    """
+    Store a parsed synthetic dataset in a cache under the keys of the upstream downloads, so the pipeline runs offline
+    """
+    for key, df in parse_dataset(dataset).items():
+        cache.put(key, df, 'backend', None)
@@ -1,6 +1,7 @@
-from poopsdontlie.countries import NLD
+from poopsdontlie.countries.NLD import datasets as NLD
 
 countries = {
     # Please use ISO ALpha-3 notation
+    # the dataset registry of a country should not import any compute code, see helpers.lazy.LazyFunction
     'NLD': NLD,
 }
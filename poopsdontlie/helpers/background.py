@@ -0,0 +1,67 @@
+"""
+Background jobs that finish work after a fast provisional result was returned
+
+Jobs run one at a time in a worker thread of this process, a job that is submitted again while it is still pending
+is not run twice. Call wait() before the process ends: jobs that are left to the interpreter shutdown fail as soon as
+they start an executor like loky, which can not start its workers anymore at that point.
+"""
+import threading
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+
+_executor = None
+_jobs = {}
+_lock = threading.Lock()
+
+
+def ci_is_final(df):
+    """
+    False for a provisional result of which the confidence intervals are still being computed in the background
+    """
+    return getattr(df, 'attrs', {}).get('ci_final', True)
+
+
+def _report_failure(key, future):
+    e = future.exception()
+    if e is not None:
+        print(f'Background job {key} failed:')
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+
+def submit(key, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) in the background unless a job with the same key is still pending, returns its future
+    """
+    global _executor
+
+    with _lock:
+        if key in _jobs and not _jobs[key].done():
+            return _jobs[key]
+
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='poopsdontlie-background')
+
+        future = _executor.submit(func, *args, **kwargs)
+        future.add_done_callback(lambda f: _report_failure(key, f))
+        _jobs[key] = future
+
+    return future
+
+
+def pending():
+    with _lock:
+        return [key for key, future in _jobs.items() if not future.done()]
+
+
+def wait(timeout=None):
+    """
+    Wait until all submitted jobs are done, returns the keys of the jobs that are still pending after timeout
+    """
+    with _lock:
+        futures = list(_jobs.values())
+
+    wait_futures(futures, timeout=timeout)
+
+    return pending()
@@ -1,5 +1,14 @@
+import contextlib
 import functools
+import hashlib
 import inspect
+import json
+import os
+import re
+import shutil
+import uuid
+import threading
+import time
 
 import pandas as pd
 import pickle
@@ -9,16 +18,25 @@ import requests
 from requests import HTTPError
 
 from tqdm.auto import tqdm
-from poopsdontlie.helpers import config
+from poopsdontlie.helpers import config, background, mmapstore
+from poopsdontlie.helpers.filelock import FileLock, LockTimeout
+from poopsdontlie.helpers.io import atomic_write
+from poopsdontlie.helpers.layout import check_layout
+from poopsdontlie.helpers.profiling import stage
 from abc import ABCMeta, abstractmethod
 from pathlib import Path
 from datetime import datetime
+from glob import escape as glob_escape
 
 
+# seconds between writes of the hit counts of an entry and between measurements of the size of the local cache
+_STATS_INTERVAL = 60
+
 _levels_definition = {
     'backend': {'namespace': 'backend'},
     'apiresult': {'namespace': 'api'},
-    'smoothed_api_result': {'namespace': 'api'}
+    'smoothed_api_result': {'namespace': 'api'},
+    'smoothed_column': {'namespace': 'api'},
 }
 levels = [*_levels_definition.keys()]
 
@@ -66,46 +84,449 @@ def invalidate_tomorrow_after_time_for_tz(time_tuple, tz):
     return (pd.Timestamp.utcnow().tz_convert(tz) + pd.Timedelta(days=1)).replace(microsecond=0, **vals).tz_convert('UTC')
 
 
+class InvalidationPolicy(metaclass=ABCMeta):
+    """
+    Determines when a cache entry expires, evaluated each time an entry is written
+
+    Passing a policy instead of a timestamp to cached_results keeps long-running processes from caching results with
+    an expiry date that was calculated when the module was imported.
+    """
+
+    @abstractmethod
+    def __call__(self):
+        """Returns the UTC timestamp after which an entry written now is invalid, or None if it never expires"""
+        pass
+
+
+class InvalidateBeginningOfNextMonth(InvalidationPolicy):
+    def __call__(self):
+        return invalidate_beginning_of_next_month()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+
+class InvalidateAfterTimeForTz(InvalidationPolicy):
+    def __init__(self, time_tuple, tz):
+        _prep_time_tuple(time_tuple)
+
+        self.time_tuple = tuple(time_tuple)
+        self.tz = tz
+
+    def __call__(self):
+        return invalidate_after_time_for_tz(self.time_tuple, self.tz)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.time_tuple}, {self.tz!r})'
+
+
+class InvalidateTomorrowAfterTimeForTz(InvalidateAfterTimeForTz):
+    def __call__(self):
+        return invalidate_tomorrow_after_time_for_tz(self.time_tuple, self.tz)
+
+
+def resolve_invalidate_after(invalidate_after):
+    """
+    Turns an invalidation policy (or any other callable) into a timestamp, timestamps and None are returned as-is
+    """
+    if callable(invalidate_after):
+        return invalidate_after()
+
+    return invalidate_after
+
+
+_size_units = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+
+
+def parse_size(size):
+    """
+    Parse a size such as 1024, '500MB' or '2 GB' to a number of bytes, None means unlimited
+    """
+    if size is None or isinstance(size, int):
+        return size
+
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?B?)\s*', str(size).upper())
+    if match is None:
+        raise ValueError(f'Invalid size {size}, use a number of bytes or a value like 500MB or 2GB')
+
+    return int(float(match.group(1)) * _size_units[match.group(2)])
+
+
+def fingerprint(df, index=True, salt=''):
+    """
+    Content hash of a frame: its columns, dtypes and values (and index), salt is hashed along with it
+    """
+    h = hashlib.sha256(salt.encode())
+    h.update(repr([str(c) for c in df.columns]).encode())
+    h.update(repr([str(t) for t in df.dtypes]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=index).values.tobytes())
+
+    return h.hexdigest()
+
+
+def partition_by_month(df, date_column=None):
+    """
+    Split a frame by the month of its DatetimeIndex or date_column, returns a dict of YYYY-MM: partition
+    """
+    dates = pd.DatetimeIndex(df.index if date_column is None else df[date_column])
+    months = dates.strftime('%Y-%m')
+
+    return {month: df[months == month] for month in sorted(set(months))}
+
+
+def month_is_immutable(month, now=None):
+    """
+    Months that ended more than partition_immutable_days ago are not expected to change anymore
+    """
+    if now is None:
+        now = pd.Timestamp.utcnow()
+
+    month_end = pd.Timestamp(f'{month}-01', tz='UTC') + pd.offsets.MonthBegin(1)
+
+    return month_end + pd.Timedelta(days=config['partition_immutable_days']) <= now
+
+
+class PartitionedStore:
+    """
+    A frame stored as monthly partitions in a cache, with an index of the partitions and their fingerprints
+
+    Partitions are only rewritten when their content changed. Partitions of immutable months never expire, open
+    months expire with invalidate_by. A partition can be stored with the fingerprint of the data it was derived from,
+    so it can be reused as long as that source data did not change.
+    """
+
+    def __init__(self, cache, key, cache_level='backend', date_column=None):
+        self._cache = cache
+        self._key = key
+        self._cache_level = cache_level
+        self._date_column = date_column
+
+    def _partition_key(self, month):
+        return f'{self._key}@{month}'
+
+    def index(self):
+        return self._cache.get(f'{self._key}@partitions', self._cache_level) or {}
+
+    def get_partition(self, month, source_fingerprint=None):
+        entry = self.index().get(month)
+        if entry is None or (source_fingerprint is not None and entry['source_fingerprint'] != source_fingerprint):
+            return None
+
+        return self._cache.get(self._partition_key(month), self._cache_level)
+
+    def read(self):
+        partitions = [self._cache.get(self._partition_key(month), self._cache_level) for month in sorted(self.index())]
+        if not partitions or any(p is None for p in partitions):
+            return None
+
+        return pd.concat(partitions)
+
+    def write(self, df, invalidate_by=None, source_fingerprints=None):
+        """
+        Store the partitions of df that changed, returns the months that were written
+        """
+        if source_fingerprints is None:
+            source_fingerprints = {}
+
+        index = self.index()
+        new_index = {}
+        written = []
+
+        for month, part in partition_by_month(df, self._date_column).items():
+            entry = {
+                # with a date column the row labels are just positions, they are not part of the content
+                'fingerprint': fingerprint(part, index=self._date_column is None),
+                'source_fingerprint': source_fingerprints.get(month),
+                'rows': part.shape[0],
+            }
+            new_index[month] = entry
+
+            if index.get(month) == entry and self._cache.exists(self._partition_key(month), self._cache_level):
+                continue
+
+            self._cache.put(self._partition_key(month), part, self._cache_level, None if month_is_immutable(month) else invalidate_by)
+            written.append(month)
+
+        for month in index.keys() - new_index.keys():
+            self._cache.remove(self._partition_key(month), self._cache_level)
+
+        self._cache.put(f'{self._key}@partitions', new_index, self._cache_level, None)
+
+        return written
+
+
+def writable_cache():
+    """
+    The cache to store intermediate results like partitions in, the remote cache is read-only so they are stored
+    locally when it is used
+    """
+    cache = _cache_factory()
+    if isinstance(cache, RemoteCache):
+        return LocalFilesystemCache()
+
+    return cache
+
+
 def _is_valid_cache_level(level):
     return level in levels
 
 
-def cached_results(key, invalidate_after, cache_level='backend'):
+def _variant_key(key, vary_on, kwargs):
+    variant = [f'{arg}={kwargs[arg]}' for arg in vary_on if kwargs.get(arg) is not None]
+
+    return '@'.join([key, *variant])
+
+
+# results of cached_results by (key, cache_level) while a memoized() block runs in the thread
+_memo_state = threading.local()
+
+
+@contextlib.contextmanager
+def memoized():
+    """
+    Keep the results of cached_results in memory while the block runs, e.g. for a batch of datasets that share
+    upstream stages: each stage is loaded from the cache (or computed) once instead of once per dataset. Callers get a
+    copy, so a caller that changes its result in place does not change it for the others. Only the thread that runs the
+    block uses the kept results.
+    """
+    outer = getattr(_memo_state, 'memo', None)
+    if outer is None:
+        _memo_state.memo = {}
+
+    try:
+        yield
+    finally:
+        _memo_state.memo = outer
+
+
+# set by refreshing() for the thread that refreshes the cache
+_refresh_state = threading.local()
+
+
+@contextlib.contextmanager
+def refreshing(force=False):
+    """
+    Refresh the cache in the block: expired entries are recomputed even when the serve_stale config key is set, with
+    force every entry of cached_results is recomputed (per-column entries store the fingerprint of their input data and
+    are only recomputed when that changed). Entries are replaced with an atomic rename, so readers get the old or the new one
+    and never wait for the computation.
+    """
+    outer = getattr(_refresh_state, 'force', None)
+    _refresh_state.force = force
+
+    try:
+        yield
+    finally:
+        _refresh_state.force = outer
+
+
+def _is_refreshing():
+    return getattr(_refresh_state, 'force', None) is not None
+
+
+def _lookup(cache, key, cache_level):
+    if getattr(_refresh_state, 'force', None):
+        return None
+
+    return _get_cached(cache, key, cache_level)
+
+
+def _copy(retval):
+    return retval.copy() if hasattr(retval, 'copy') else retval
+
+
+def _finalize_cached(cache, key, cache_level, invalidate_after, func, args, kwargs):
+    # another process may have finalized the entry already
+    with cache.lock(key, cache_level):
+        retval = _get_cached(cache, key, cache_level, verbose=False)
+        if retval is not None and background.ci_is_final(retval):
+            return
+
+        cache.put(key, func(*args, **kwargs), cache_level, resolve_invalidate_after(invalidate_after))
+
+    print(f'Cached {key} with final confidence intervals')
+
+
+def cached_results(key, invalidate_after, cache_level='backend', bypass_if=(), provisional=None, vary_on=(),
+                   to_long=None, rollups=False):
+    """
+    Cache the result of func under key, calls that pass a not-None value for one of the arguments in bypass_if are
+    not cached as a whole, e.g. a selection of columns that is cached per column instead. Calls that pass a not-None
+    value for one of the arguments in vary_on are cached under their own key, e.g. another resolution of the result.
+
+    to_long converts the result of a func that takes a layout argument to the long layout, e.g. wide_to_long (see
+    poopsdontlie.helpers.layout). Only the wide result is cached, calls with layout='long' convert it. rollups marks a
+    dataset that has weekly and monthly rollups (see poopsdontlie.helpers.rollup).
+
+    provisional are the arguments that make func return a fast result without confidence intervals, e.g.
+    {'ci': False}. When the ci_mode config key is background that result is cached and returned right away and the
+    entry is replaced by the complete result once a background job has computed it.
+    """
     if not _is_valid_cache_level(cache_level):
         raise ValueError(f'Cache level {cache_level} invalid, should be one of {", ".join(levels)}')
 
+    base_key = key
+
     def decorator_cached_results(func):
         _invalidate_registry[func] = {
             'key': key,
             'cache_level': cache_level,
             'invalidate_after': invalidate_after,
+            'country': _country_of(func),
+            'to_long': to_long,
+            'rollups': rollups,
         }
+        signature = inspect.signature(func)
 
         @functools.wraps(func)
         def wrapper_cached_results(*args, **kwargs):
+            # bypass_if, vary_on and layout arguments can be passed positionally too
+            arguments = signature.bind_partial(*args, **kwargs).arguments if bypass_if or vary_on or to_long else kwargs
+            if to_long is not None and arguments.get('layout') is not None:
+                df = wrapper_cached_results(**{k: v for k, v in arguments.items() if k != 'layout'})
+                return to_long(df) if check_layout(arguments['layout']) == 'long' else df
+
+            if any(arguments.get(arg) is not None for arg in bypass_if):
+                return func(*args, **kwargs)
+
+            # key is shadowed so the rest of the wrapper uses the key of this variant
+            key = _variant_key(base_key, vary_on, arguments)
             cache = _cache_factory()
+            data_in = next((a for a in (*args, *kwargs.values()) if hasattr(a, 'shape')), None)
+            two_phase = provisional is not None and config['ci_mode'] == 'background'
+
+            def usable(retval):
+                # without two phases a provisional result left by an earlier run is computed again
+                return retval is not None and (two_phase or background.ci_is_final(retval))
+
+            with stage(key, data_in, cache='hit', cache_level=cache_level, cache_adapter=cache.__class__.__name__) as s:
+                memo = getattr(_memo_state, 'memo', None)
+                if memo is not None and usable(memo.get((key, cache_level))):
+                    s.set(cache='memo')
+                    retval = _copy(memo[(key, cache_level)])
+                    s.set_output(retval)
 
-            if cache.exists(key, cache_level):
-                retval = cache.get(key, cache_level)
-                if retval is not None:
-                    print(f'Using cached {key}')
                     return retval
 
-            retval = func(*args, **kwargs)
-            cache.put(key, retval, cache_level, invalidate_after)
+                retval = _lookup(cache, key, cache_level)
+
+                if not usable(retval):
+                    # only one process computes a missing entry, the others wait and reuse its result
+                    with cache.lock(key, cache_level):
+                        retval = _lookup(cache, key, cache_level)
+
+                        if not usable(retval):
+                            s.set(cache='miss')
+                            retval = func(*args, **{**kwargs, **provisional}) if two_phase else func(*args, **kwargs)
+                            cache.put(key, retval, cache_level, resolve_invalidate_after(invalidate_after))
+
+                if two_phase and not background.ci_is_final(retval):
+                    s.set(ci_final=False)
+                    final_kwargs = {k: v for k, v in kwargs.items() if k not in provisional}
+                    background.submit((key, cache_level), _finalize_cached, cache, key, cache_level, invalidate_after, func, args, final_kwargs)
+
+                if memo is not None:
+                    memo[(key, cache_level)] = _copy(retval)
+
+                s.set_output(retval)
 
             return retval
         return wrapper_cached_results
     return decorator_cached_results
 
 
+def _merge_attrs(dfs):
+    attrs = {}
+    for df in dfs:
+        for k, v in df.attrs.items():
+            if isinstance(v, dict):
+                attrs.setdefault(k, {}).update(v)
+            else:
+                attrs[k] = v
+
+    return attrs
+
+
+def cached_columns(key, invalidate_after, cache_level='smoothed_column', config_keys=()):
+    """
+    Cache the result of func(df, columns, **kwargs) per column
+
+    Every column is computed on its own, as func(df[[col]], [col], **kwargs), and cached under the column name and the
+    kwargs and config_keys the result depends on, along with a fingerprint of the column data it was computed from.
+    Cached columns are reused while that data did not change, so a request for a few columns only computes those and a
+    request for all columns only computes the ones that are missing or outdated. An outdated column is replaced.
+    """
+    if not _is_valid_cache_level(cache_level):
+        raise ValueError(f'Cache level {cache_level} invalid, should be one of {", ".join(levels)}')
+
+    def decorator_cached_columns(func):
+        @functools.wraps(func)
+        def wrapper_cached_columns(df, columns, **kwargs):
+            columns = list(columns)
+            if not columns:
+                return func(df, columns, **kwargs)
+
+            cache = writable_cache()
+            params = repr(sorted({**{k: config[k] for k in config_keys}, **kwargs}.items()))
+            params_hash = hashlib.sha256(params.encode()).hexdigest()[:16]
+
+            with stage(key, df[columns], cache_level=cache_level, cache_adapter=cache.__class__.__name__) as s:
+                col_keys = {col: f'{key}@{col}@{params_hash}' for col in columns}
+                sources = {col: fingerprint(df[[col]], salt=params)[:16] for col in columns}
+                results = {col: _get_cached_column(cache, col_keys[col], cache_level, sources[col]) for col in columns}
+
+                missing = [col for col, result in results.items() if result is None]
+                print(f'Reusing {len(columns) - len(missing)} of {len(columns)} cached columns for {key}')
+                s.set(cached_columns=len(columns) - len(missing), computed_columns=len(missing))
+
+                for col in missing:
+                    results[col] = func(df[[col]], [col], **kwargs)
+
+                    stored = results[col].copy(deep=False)
+                    stored.attrs = {**results[col].attrs, 'source_fingerprint': sources[col]}
+                    cache.put(col_keys[col], stored, cache_level, resolve_invalidate_after(invalidate_after))
+
+                retval = pd.concat([results[col] for col in columns], axis=1)
+                retval.attrs = _merge_attrs(results.values())
+                s.set_output(retval)
+
+            return retval
+        return wrapper_cached_columns
+    return decorator_cached_columns
+
+
+def _get_cached_column(cache, key, cache_level, source_fingerprint):
+    # a column computed from other data is outdated, put replaces it
+    retval = _get_cached(cache, key, cache_level, verbose=False)
+    if retval is None or retval.attrs.get('source_fingerprint') != source_fingerprint:
+        return None
+
+    retval.attrs = {k: v for k, v in retval.attrs.items() if k != 'source_fingerprint'}
+
+    return retval
+
+
+def _get_cached(cache, key, cache_level, verbose=True):
+    # with serve_stale expired entries are used until the refresh daemon replaces them
+    stale = config['serve_stale'] and not _is_refreshing()
+
+    if cache.exists(key, cache_level):
+        retval = cache.get(key, cache_level, ignore_expiredate=stale)
+        if retval is not None:
+            if verbose:
+                print(f'Using cached {key}')
+            return retval
+
+    return None
+
+
 class CacheAdapter(metaclass=ABCMeta):
     @abstractmethod
     def put(self, key, value, cache_level, invalidate_by=None):
         pass
 
     @abstractmethod
-    def get(self, key, cache_level):
+    def get(self, key, cache_level, ignore_expiredate=False):
         pass
 
     @abstractmethod
@@ -116,6 +537,10 @@ class CacheAdapter(metaclass=ABCMeta):
     def remove(self, key, cache_level):
         pass
 
+    def lock(self, key, cache_level):
+        # adapters that are shared between processes should override this
+        return contextlib.nullcontext()
+
 
 class NoCache(CacheAdapter):
     def exists(self, key, cache_level):
@@ -124,7 +549,7 @@ class NoCache(CacheAdapter):
     def put(self, key, value, cache_level, invalidate_by=None):
         return None
 
-    def get(self, key, cache_level):
+    def get(self, key, cache_level, ignore_expiredate=False):
         return None
 
     def remove(self, key, cache_level):
@@ -137,23 +562,158 @@ class LocalFilesystemCache(CacheAdapter):
 
         return cachefile.is_file()
 
-    def __init__(self, cache_dir=Path(config['cachedir']) / 'local'):
-        self._cdir = cache_dir
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = Path(config['cachedir']) / 'local'
+
+        self._cdir = Path(cache_dir)
         self._cdir.mkdir(parents=True, exist_ok=True)
 
+        # hits not written to the stats files yet by cache file: (hits, last write, last access)
+        self._hits = {}
+        # size of the cache as tracked by put, and when it was last measured
+        self._size = None
+        self._size_measured = 0.
+
     def _quote_safe(self, str):
         return urllib.parse.quote(str, safe='')
 
     def _genpath(self, key, cache_level):
         return self._cdir / f'{cache_level}-{self._quote_safe(key)}.bin'
 
+    def _genlockpath(self, key, cache_level):
+        return self._cdir / 'locks' / f'{cache_level}-{self._quote_safe(key)}.lock'
+
     def _read(self, path):
-        with open(path, 'rb') as fh:
-            return pickle.load(fh)
+        try:
+            with open(path, 'rb') as fh:
+                cacheobj = pickle.load(fh)
+        except FileNotFoundError:
+            # removed by another process in the meantime
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, TypeError, ValueError) as e:
+            print(f'CACHE WARN: {path.name} is corrupt ({e.__class__.__name__}: {e})')
+            self._quarantine(path)
+            return None
+
+        if not isinstance(cacheobj, dict) or not {'invalidate_by', 'created', 'value'} <= cacheobj.keys():
+            print(f'CACHE WARN: {path.name} does not contain a valid cache object')
+            self._quarantine(path)
+            return None
+
+        return cacheobj
 
     def _write(self, path, obj):
-        with open(path, 'wb') as fh:
-            pickle.dump(obj, fh)
+        atomic_write(path, lambda fh: pickle.dump(obj, fh))
+
+    def _genstatspath(self, cachefile):
+        return cachefile.with_suffix('.stats')
+
+    def _sidecars(self, cachefile):
+        # the memory-mapped copies of an entry, named <stem>.<token>.mmap
+        for path in self._cdir.glob(f'{glob_escape(cachefile.stem)}.*.mmap'):
+            if path.name[:-len('.mmap')].rsplit('.', 1)[0] == cachefile.stem:
+                yield path
+
+    def _write_sidecar(self, cachefile, value):
+        # a new directory per write, the rename makes it appear complete and readers of the old one are unaffected
+        token = uuid.uuid4().hex[:12]
+        sidecar = self._cdir / f'{cachefile.stem}.{token}.mmap'
+        tmpdir = self._cdir / f'.{sidecar.name}.tmpdir'
+
+        try:
+            mmapstore.write(tmpdir, value)
+            os.replace(tmpdir, sidecar)
+        except BaseException:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+
+        return sidecar
+
+    def _read_stats(self, cachefile):
+        try:
+            with open(self._genstatspath(cachefile), 'r') as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            pass
+
+        # entries written by older versions have no stats file, derive what we can from the filesystem
+        try:
+            stat = cachefile.stat()
+        except FileNotFoundError:
+            return None
+
+        cache_level, quoted_key = cachefile.stem.split('-', 1)
+
+        return {
+            'key': urllib.parse.unquote(quoted_key),
+            'cache_level': cache_level,
+            'created': stat.st_mtime,
+            'invalidate_by': None,
+            'size': stat.st_size,
+            'hits': 0,
+            'last_access': stat.st_mtime,
+        }
+
+    def _write_stats(self, cachefile, stats):
+        atomic_write(self._genstatspath(cachefile), lambda fh: json.dump(stats, fh), mode='w')
+
+    def _register_hit(self, cachefile):
+        # the stats file of an entry is written at most once per _STATS_INTERVAL, hits in between are kept in memory
+        hits, written, _ = self._hits.get(cachefile, (0, None, None))
+        hits += 1
+        now = time.monotonic()
+
+        if written is not None and now - written < _STATS_INTERVAL:
+            self._hits[cachefile] = (hits, written, time.time())
+            return
+
+        stats = self._read_stats(cachefile)
+        if stats is None:
+            self._hits.pop(cachefile, None)
+            return
+
+        stats['hits'] += hits
+        stats['last_access'] = time.time()
+
+        # hit counts are informational, losing an update to a concurrent reader is fine
+        with contextlib.suppress(OSError):
+            self._write_stats(cachefile, stats)
+
+        self._hits[cachefile] = (0, now, stats['last_access'])
+
+    def _with_pending_hits(self, cachefile, stats):
+        hits, _, last_access = self._hits.get(cachefile, (0, None, None))
+        if last_access is None:
+            return stats
+
+        return {**stats, 'hits': stats['hits'] + hits, 'last_access': max(stats['last_access'], last_access)}
+
+    def _track_size(self, grown):
+        """
+        Returns the size of the cache after a put that grew it by grown bytes, the cache directory is measured once
+        per _STATS_INTERVAL since other processes write to it too
+        """
+        now = time.monotonic()
+        if self._size is None or now - self._size_measured > _STATS_INTERVAL:
+            self._size = sum(e['size'] for e in self.entries())
+            self._size_measured = now
+        else:
+            self._size += grown
+
+        return self._size
+
+    def _quarantine(self, path):
+        quarantine_dir = self._cdir / 'corrupt'
+        quarantine_dir.mkdir(parents=True, exist_ok=True)
+
+        target = quarantine_dir / f'{path.name}.{pd.Timestamp.utcnow().strftime("%Y%m%dT%H%M%S%f")}'
+        with contextlib.suppress(FileNotFoundError):
+            os.replace(path, target)
+            print(f'CACHE WARN: moved {path.name} to {target}')
+
+    def lock(self, key, cache_level, timeout=None):
+        return FileLock(self._genlockpath(key, cache_level), timeout=timeout)
 
     def put(self, key, value, cache_level, invalidate_by=None):
         cachefile = self._genpath(key, cache_level)
@@ -164,9 +724,40 @@ class LocalFilesystemCache(CacheAdapter):
             'value': value,
         }
 
+        max_size = parse_size(config.get('cache_max_size'))
+        previous = self._read_stats(cachefile) or {'size': 0}
+
+        sidecar = None
+        if config['cache_mmap'] and mmapstore.can_mmap(value):
+            # the entry only points to the memory-mapped copy
+            sidecar = self._write_sidecar(cachefile, value)
+            cacheobj.update(value=None, mmap=sidecar.name)
+
         self._write(cachefile, cacheobj)
 
-    def get(self, key, cache_level):
+        # only the copy the replaced entry pointed to, a concurrent put may have just written another one and pointed
+        # the entry to it; copies orphaned by such a race are left to sweep_expired
+        if previous.get('mmap') is not None and (sidecar is None or previous['mmap'] != sidecar.name):
+            shutil.rmtree(self._cdir / previous['mmap'], ignore_errors=True)
+
+        now = time.time()
+        size = cachefile.stat().st_size + (0 if sidecar is None else mmapstore.size(sidecar))
+        self._hits.pop(cachefile, None)
+        self._write_stats(cachefile, {
+            'key': key,
+            'cache_level': cache_level,
+            'created': now,
+            'invalidate_by': None if invalidate_by is None else pd.Timestamp(invalidate_by).timestamp(),
+            'size': size,
+            'hits': 0,
+            'last_access': now,
+            'mmap': None if sidecar is None else sidecar.name,
+        })
+
+        if max_size is not None and self._track_size(size - previous['size']) > max_size:
+            self.evict(max_size)
+
+    def get(self, key, cache_level, ignore_expiredate=False):
         cachefile = self._genpath(key, cache_level)
 
         if not self.exists(key, cache_level):
@@ -174,25 +765,144 @@ class LocalFilesystemCache(CacheAdapter):
 
         cacheobj = self._read(cachefile)
 
-        if cacheobj['invalidate_by'] is None or pd.Timestamp.utcnow() < cacheobj['invalidate_by']:
-            return cacheobj['value']
+        if cacheobj is None:
+            return None
+
+        if ignore_expiredate or cacheobj['invalidate_by'] is None or pd.Timestamp.utcnow() < cacheobj['invalidate_by']:
+            value = cacheobj['value']
+            if cacheobj.get('mmap') is not None:
+                try:
+                    value = mmapstore.read(self._cdir / cacheobj['mmap'])
+                except FileNotFoundError:
+                    # replaced by another process after the entry was read
+                    return None
+
+            self._register_hit(cachefile)
+            return value
+
+        # with serve_stale other readers keep using the expired entry until it is replaced
+        if not config['serve_stale']:
+            self.remove(key, cache_level)
 
-        self.remove(key, cache_level)
         return None
 
     def remove(self, key, cache_level):
-        cachefile = self._genpath(key, cache_level)
-        if cachefile.is_file():
-            cachefile.unlink()
+        self._remove_file(self._genpath(key, cache_level))
+
+    def _remove_file(self, cachefile):
+        self._hits.pop(cachefile, None)
+
+        for path in (cachefile, self._genstatspath(cachefile)):
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+
+        self._remove_sidecars(cachefile)
+
+    def _remove_sidecars(self, cachefile):
+        # processes that mapped a removed copy keep their mapping until they drop the frame
+        for sidecar in self._sidecars(cachefile):
+            shutil.rmtree(sidecar, ignore_errors=True)
+
+    def _is_orphaned(self, sidecar):
+        # stats written before sidecars were recorded in them say nothing about which copy is current
+        stats = self._read_stats(self._cdir / f'{sidecar.name[:-len(".mmap")].rsplit(".", 1)[0]}.bin')
+        return stats is None or ('mmap' in stats and stats['mmap'] != sidecar.name)
+
+    def entries(self):
+        """
+        Stats for all entries in this cache: key, cache_level, created, invalidate_by, size, hits and last_access
+        """
+        for cachefile in sorted(self._cdir.glob('*.bin')):
+            stats = self._read_stats(cachefile)
+            if stats is not None:
+                yield {**self._with_pending_hits(cachefile, stats), 'path': cachefile}
+
+    def _try_remove_entry(self, entry):
+        # entries that are locked are being (re)computed by another process, leave them alone
+        try:
+            with self.lock(entry['key'], entry['cache_level'], timeout=0):
+                self._remove_file(entry['path'])
+        except LockTimeout:
+            return False
+
+        return True
+
+    def sweep_expired(self, tmp_max_age=3600):
+        """
+        Remove expired entries, temp-files left behind by crashed writers and memory-mapped copies orphaned by
+        concurrent puts, safe to run while the cache is in use.
+        With serve_stale expired entries are kept, readers use them until the refresh replaces them.
+        """
+        now = time.time()
+        removed = []
+
+        for entry in [] if config['serve_stale'] else self.entries():
+            if entry['invalidate_by'] is not None and entry['invalidate_by'] <= now and self._try_remove_entry(entry):
+                removed.append(entry)
+
+        for tmpfile in self._cdir.glob('.*.tmp'):
+            with contextlib.suppress(FileNotFoundError):
+                if now - tmpfile.stat().st_mtime > tmp_max_age:
+                    tmpfile.unlink()
+
+        for tmpdir in self._cdir.glob('.*.tmpdir'):
+            with contextlib.suppress(FileNotFoundError):
+                if now - tmpdir.stat().st_mtime > tmp_max_age:
+                    shutil.rmtree(tmpdir, ignore_errors=True)
+
+        for sidecar in self._cdir.glob('*.mmap'):
+            with contextlib.suppress(FileNotFoundError):
+                if now - sidecar.stat().st_mtime > tmp_max_age and self._is_orphaned(sidecar):
+                    shutil.rmtree(sidecar, ignore_errors=True)
+
+        return removed
+
+    def evict(self, max_size):
+        """
+        Remove expired entries (unless serve_stale is set), then the least recently used entries until the cache is no
+        larger than max_size bytes
+        """
+        removed = self.sweep_expired()
+
+        entries = sorted(self.entries(), key=lambda e: e['last_access'])
+        total_size = sum(e['size'] for e in entries)
+
+        for entry in entries:
+            if total_size <= max_size:
+                break
+
+            if self._try_remove_entry(entry):
+                total_size -= entry['size']
+                removed.append(entry)
+
+        self._size = total_size
+        self._size_measured = time.monotonic()
+
+        return removed
+
+    def clear(self, cache_level=None):
+        removed = []
+        for entry in self.entries():
+            if (cache_level is None or entry['cache_level'] == cache_level) and self._try_remove_entry(entry):
+                removed.append(entry)
+
+        return removed
 
 
 class RemoteCache(CacheAdapter):
-    def __init__(self, cache_root_url=config['remote_cache_url'], tmpdir=Path(config['cachedir']) / 'remote'):
+    def __init__(self, cache_root_url=None, tmpdir=None):
+        if cache_root_url is None:
+            cache_root_url = config['remote_cache_url']
+
+        if tmpdir is None:
+            tmpdir = Path(config['cachedir']) / 'remote'
+
         self._root_url = cache_root_url
         if self._root_url[-1] != '/':
             self._root_url = f'{self._root_url}/'
 
-        self._tmpdir = tmpdir
+        self._tmpdir = Path(tmpdir)
+        self._manifests = {}
 
     def _http_get_req_file(self, url, outfile):
         print(f'Downloading {url} to {outfile}')
@@ -201,13 +911,16 @@ class RemoteCache(CacheAdapter):
                 r.raise_for_status()
                 total_size_in_bytes = int(r.headers.get('content-length', 0))
                 progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True)
-                with open(outfile, 'wb') as f:
+
+                def writer(f):
                     for chunk in r.iter_content(chunk_size=8192):
                         # If you have chunk encoded response uncomment if
                         # and set chunk_size parameter to None.
                         # if chunk:
                         progress_bar.update(len(chunk))
                         f.write(chunk)
+
+                atomic_write(outfile, writer)
                 progress_bar.close()
         except HTTPError as e:
             if e.response.status_code == 404:
@@ -218,46 +931,251 @@ class RemoteCache(CacheAdapter):
         # unsupported, this cache is read-only
         pass
 
+    def _manifest(self, country, refresh=False):
+        """
+        The manifest of all datasets of a country, it is downloaded once and kept in memory until refresh is requested.
+        Returns None for a remote cache that does not publish a manifest.
+        """
+        if country in self._manifests and not refresh:
+            return self._manifests[country]
+
+        outpath = self._tmpdir / country
+        outpath.mkdir(exist_ok=True, parents=True)
+        local_manifest_file = outpath / 'manifest.json'
+
+        manifest = None
+        try:
+            self._http_get_req_file(f'{self._root_url}{country}/manifest.json', local_manifest_file)
+            with open(local_manifest_file, 'r') as fh:
+                manifest = json.load(fh)
+        except FileNotFoundError:
+            print(f'REMOTE CACHE WARN: no manifest for {country}, falling back to meta files')
+
+        self._manifests[country] = manifest
+
+        return manifest
+
+    def _get_meta(self, country, name, ignore_expiredate=False):
+        """
+        Returns the meta data of a dataset from the manifest, or from its meta file when there is no manifest
+        """
+        manifest = self._manifest(country)
+
+        if manifest is None:
+            meta_url = f'{self._root_url}{country}/{name}.meta'
+            local_meta_file = self._tmpdir / country / f'{name}.meta'
+
+            try:
+                self._http_get_req_file(meta_url, local_meta_file)
+            except FileNotFoundError as e:
+                # file does not exist in remote cache
+                print(f'REMOTE CACHE WARN: {meta_url} does not exist')
+                return None
+
+            with open(local_meta_file, 'rb') as fh:
+                return pickle.load(fh)
+
+        meta = _meta_from_manifest(manifest['datasets'].get(name))
+
+        # an expired dataset may have been published again after the manifest was downloaded
+        if meta is not None and not ignore_expiredate and _is_expired(meta):
+            meta = _meta_from_manifest(self._manifest(country, refresh=True)['datasets'].get(name))
+
+        if meta is None:
+            print(f'REMOTE CACHE WARN: {name} is not in the manifest of {country}')
+
+        return meta
+
     def get(self, key, cache_level, ignore_expiredate=False):
         func, entry = _get_registry_entry_for_key_cache_level(key, cache_level)
-        module = inspect.getmodule(func).__name__.split('.')
-        country = module[module.index('countries') + 1].upper()
+        if func is None:
+            # variants of a dataset, e.g. its weekly and monthly rollups, are not published
+            return None
 
-        meta_file = f'{func.__name__}.meta'
-        csv_file = f'{func.__name__}.csv'
+        country, name = entry.get('country') or _country_of(func), func.__name__
 
-        meta_url = f'{self._root_url}{country}/{meta_file}'
+        csv_file = f'{name}.csv'
         csv_url = f'{self._root_url}{country}/{csv_file}'
 
         outpath = self._tmpdir / country
         outpath.mkdir(exist_ok=True, parents=True)
-
-        local_meta_file = outpath / meta_file
         local_csv_file = outpath / csv_file
 
+        meta = self._get_meta(country, name, ignore_expiredate)
+        if meta is None:
+            return None
+
+        if not ignore_expiredate and _is_expired(meta):
+            print(f'REMOTE CACHE WARN: {meta["invalidate_after"]} < {pd.Timestamp.utcnow()}')
+            return None
+
+        dtype, parse_dates = self._filter_dtypes(meta['dtypes'])
+
+        # the local snapshot is used as is when its content hash matches, else the published deltas are applied to it,
+        # and a complete snapshot is downloaded when that is not possible either
+        df = self._get_unchanged(country, name, meta)
+        if df is None:
+            df = self._get_with_deltas(country, name, meta, dtype, parse_dates)
+
+        if df is None:
+            if meta.get('partitions'):
+                df = self._get_partitioned(country, name, meta, dtype, parse_dates)
+            else:
+                try:
+                    self._http_get_req_file(csv_url, local_csv_file)
+                except FileNotFoundError as e:
+                    # file does not exist in remote cache
+                    print(f'REMOTE CACHE WARN: {csv_url} does not exist')
+                    return None
+
+                df = pd.read_csv(local_csv_file, index_col=0, dtype=dtype, parse_dates=parse_dates)
+
+            if df is None:
+                return None
+
+            self._store_snapshot(country, name, meta, df)
+
+        # the snapshot just read may be expired when it is served stale, it must survive the eviction
+        max_size = parse_size(config.get('cache_max_size'))
+        if max_size is not None:
+            self.evict(max_size, keep=local_csv_file)
+
+        return df
+
+    def _get_partitioned(self, country, name, meta, dtype, parse_dates):
+        """
+        Download the monthly partitions of a dataset, partitions that were downloaded before and did not change are reused
+        """
+        outpath = self._tmpdir / country
+        partdir = outpath / name
+        partdir.mkdir(exist_ok=True, parents=True)
+
+        local_index_file = outpath / f'{name}.partitions.json'
+        local_index = {}
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(local_index_file, 'r') as fh:
+                local_index = json.load(fh)
+
+        dfs = []
+        downloaded = 0
+        for month, entry in sorted(meta['partitions'].items()):
+            local_file = partdir / f'{month}.csv'
+
+            if local_index.get(month) != entry['fingerprint'] or not local_file.is_file():
+                try:
+                    self._http_get_req_file(f'{self._root_url}{country}/{entry["file"]}', local_file)
+                except FileNotFoundError:
+                    print(f'REMOTE CACHE WARN: {entry["file"]} does not exist')
+                    return None
+
+                local_index[month] = entry['fingerprint']
+                downloaded += 1
+
+            dfs.append(pd.read_csv(local_file, index_col=0, dtype=dtype, parse_dates=parse_dates))
+
+        for local_file in partdir.glob('*.csv'):
+            if local_file.stem not in meta['partitions']:
+                local_file.unlink()
+                local_index.pop(local_file.stem, None)
+
+        atomic_write(local_index_file, lambda fh: json.dump(local_index, fh), mode='w')
+        print(f'Downloaded {downloaded} of {len(meta["partitions"])} monthly partitions of {name}')
+
+        return pd.concat(dfs)
+
+    def _store_snapshot(self, country, name, meta, df):
+        """
+        Keep the downloaded dataset with the version and content hash it was published with
+        """
+        outpath = self._tmpdir / country
+        outpath.mkdir(exist_ok=True, parents=True)
+
+        state = {
+            'version': meta['deltas']['version'] if meta.get('deltas') else None,
+            'fingerprint': meta.get('fingerprint'),
+            'invalidate_after': None if meta['invalidate_after'] is None else pd.Timestamp(meta['invalidate_after']).isoformat(),
+        }
+
+        atomic_write(outpath / f'{name}.snapshot.pkl', lambda fh: pickle.dump(df, fh, protocol=pickle.HIGHEST_PROTOCOL))
+        atomic_write(outpath / f'{name}.version.json', lambda fh: json.dump(state, fh), mode='w')
+
+    def _load_snapshot(self, country, name):
+        """
+        Returns the snapshot state and frame of a dataset, or None, None when there is no local snapshot
+        """
+        outpath = self._tmpdir / country
         try:
-            self._http_get_req_file(meta_url, local_meta_file)
-        except FileNotFoundError as e:
-            # file does not exist in remote cache
-            print(f'REMOTE CACHE WARN: {meta_url} does not exist')
+            with open(outpath / f'{name}.version.json', 'r') as fh:
+                state = json.load(fh)
+            df = pd.read_pickle(outpath / f'{name}.snapshot.pkl')
+        except (FileNotFoundError, ValueError, pickle.UnpicklingError, EOFError):
+            return None, None
+
+        return state, df
+
+    def _get_unchanged(self, country, name, meta):
+        if meta.get('fingerprint') is None:
             return None
 
-        with open(local_meta_file, 'rb') as fh:
-            meta = pickle.load(fh)
+        state, df = self._load_snapshot(country, name)
+        if state is None or state.get('fingerprint') != meta['fingerprint']:
+            return None
 
-        if not ignore_expiredate and meta['invalidate_after'] < pd.Timestamp.utcnow():
-            print(f'REMOTE CACHE WARN: {meta["invalidate_after"]} < {pd.Timestamp.utcnow()}')
+        print(f'Local copy of {name} is up to date')
+        if state.get('invalidate_after') != meta['invalidate_after']:
+            # republished without changes, only the expiry moved
+            self._store_snapshot(country, name, meta, df)
+
+        return df
+
+    def _get_with_deltas(self, country, name, meta, dtype, parse_dates):
+        """
+        Bring the local snapshot of a dataset up to date with the published deltas, returns None when the chain of
+        deltas does not start at the local version
+        """
+        deltas = meta.get('deltas')
+        if not deltas:
             return None
 
+        outpath = self._tmpdir / country
+        state, df = self._load_snapshot(country, name)
+        if state is None or state.get('version') is None:
+            return None
+
+        version = state['version']
+        if version == deltas['version']:
+            return df
+
+        chain = [d for d in deltas['chain'] if d['version'] > version]
+        if not deltas['base_version'] <= version < deltas['version'] \
+                or [d['version'] for d in chain] != list(range(version + 1, deltas['version'] + 1)):
+            print(f'REMOTE CACHE: no deltas from version {version} to {deltas["version"]} of {name}, downloading snapshot')
+            return None
+
+        local_delta_file = outpath / f'{name}.delta.csv'
         try:
-            self._http_get_req_file(csv_url, local_csv_file)
-        except FileNotFoundError as e:
-            # file does not exist in remote cache
-            print(f'REMOTE CACHE WARN: {csv_url} does not exist')
+            for delta in chain:
+                try:
+                    self._http_get_req_file(f'{self._root_url}{country}/{delta["file"]}', local_delta_file)
+                except FileNotFoundError:
+                    print(f'REMOTE CACHE WARN: {delta["file"]} does not exist')
+                    return None
+
+                if delta['keep_rows'] > df.shape[0]:
+                    return None
+
+                df_delta = pd.read_csv(local_delta_file, index_col=0, dtype=dtype, parse_dates=parse_dates)
+                df = pd.concat([df.iloc[:delta['keep_rows']], df_delta])
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                local_delta_file.unlink()
+
+        if df.shape[0] != deltas['rows']:
+            print(f'REMOTE CACHE WARN: {name} has {df.shape[0]} rows after applying deltas, expected {deltas["rows"]}')
             return None
 
-        dtype, parse_dates = self._filter_dtypes(meta['dtypes'])
-        df = pd.read_csv(local_csv_file, index_col=0, dtype=dtype, parse_dates=parse_dates)
+        print(f'Applied {len(chain)} deltas to {name}, now at version {deltas["version"]}')
+        self._store_snapshot(country, name, meta, df)
 
         return df
 
@@ -275,11 +1193,18 @@ class RemoteCache(CacheAdapter):
 
     def exists(self, key, cache_level):
         func, entry = _get_registry_entry_for_key_cache_level(key, cache_level)
-        module = inspect.getmodule(func).__name__.split('.')
-        country = module[module.index('countries') + 1].upper()
+        if func is None:
+            return False
+
+        country = entry.get('country') or _country_of(func)
+
+        if self._manifest(country) is not None:
+            # like get, an expired entry is looked up again in a fresh manifest
+            meta = self._get_meta(country, func.__name__)
+
+            return meta is not None and not _is_expired(meta)
 
-        meta_file = f'{func.__name__}.meta'
-        meta_url = f'{self._root_url}{country}/{meta_file}'
+        meta_url = f'{self._root_url}{country}/{func.__name__}.meta'
 
         try:
             r = requests.head(meta_url)
@@ -295,6 +1220,107 @@ class RemoteCache(CacheAdapter):
         # unsupported, this cache is read-only
         pass
 
+    def entries(self):
+        """
+        Stats for all files downloaded from the remote cache, the remote cache does not keep hit counts
+        """
+        # every downloaded dataset has a snapshot state file, or a meta file when it was downloaded by an older version
+        state_files = {p.with_name(p.name[:-len('.version.json')]): p for p in self._tmpdir.glob('*/*.version.json')}
+        meta_files = {p.with_suffix(''): p for p in self._tmpdir.glob('*/*.meta')}
+
+        for dataset in sorted(state_files.keys() | meta_files.keys()):
+            csv_file = dataset.with_suffix('.csv')
+            anchor = state_files.get(dataset, meta_files.get(dataset))
+
+            try:
+                stat = anchor.stat()
+            except FileNotFoundError:
+                continue
+
+            size = 0
+            for path in {csv_file, anchor, csv_file.with_suffix('.meta'), *self._partition_files(csv_file)}:
+                with contextlib.suppress(FileNotFoundError):
+                    size += path.stat().st_size
+
+            invalidate_by = None
+            with contextlib.suppress(pickle.UnpicklingError, EOFError, KeyError, TypeError, ValueError, FileNotFoundError):
+                if anchor in state_files.values():
+                    with open(anchor, 'r') as fh:
+                        invalidate_after = json.load(fh)['invalidate_after']
+                else:
+                    with open(anchor, 'rb') as fh:
+                        invalidate_after = pickle.load(fh)['invalidate_after']
+
+                invalidate_by = None if invalidate_after is None else pd.Timestamp(invalidate_after).timestamp()
+
+            registry_entry = _get_registry_entry_for_func_name(csv_file.stem)
+
+            yield {
+                'key': registry_entry['key'] if registry_entry else f'{csv_file.parent.name}/{csv_file.stem}',
+                'cache_level': registry_entry['cache_level'] if registry_entry else 'remote',
+                'created': stat.st_mtime,
+                'invalidate_by': invalidate_by,
+                'size': size,
+                'hits': None,
+                'last_access': stat.st_mtime,
+                'path': csv_file,
+            }
+
+    def _partition_files(self, csv_file):
+        # monthly partitions and the local snapshot that deltas are applied to
+        partdir = csv_file.with_suffix('')
+        sidecars = (f'{csv_file.stem}.partitions.json', f'{csv_file.stem}.snapshot.pkl', f'{csv_file.stem}.version.json')
+
+        return [*partdir.glob('*.csv'), *(p for p in (csv_file.parent / s for s in sidecars) if p.exists())]
+
+    def _remove_file(self, csv_file):
+        for path in (csv_file, csv_file.with_suffix('.meta'), *self._partition_files(csv_file)):
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+
+    def sweep_expired(self, keep=None):
+        now = time.time()
+        removed = []
+
+        for entry in self.entries():
+            if entry['path'] != keep and entry['invalidate_by'] is not None and entry['invalidate_by'] <= now:
+                self._remove_file(entry['path'])
+                removed.append(entry)
+
+        return removed
+
+    def evict(self, max_size, keep=None):
+        """
+        Remove expired entries, then the least recently used entries until the cache is no larger than max_size bytes,
+        the dataset downloaded to keep is never removed
+        """
+        removed = self.sweep_expired(keep)
+
+        entries = sorted(self.entries(), key=lambda e: e['last_access'])
+        total_size = sum(e['size'] for e in entries)
+
+        for entry in entries:
+            if total_size <= max_size:
+                break
+
+            if entry['path'] == keep:
+                continue
+
+            self._remove_file(entry['path'])
+            total_size -= entry['size']
+            removed.append(entry)
+
+        return removed
+
+    def clear(self, cache_level=None):
+        removed = []
+        for entry in self.entries():
+            if cache_level is None or entry['cache_level'] == cache_level:
+                self._remove_file(entry['path'])
+                removed.append(entry)
+
+        return removed
+
 
 
 def reiinit_cache_config():
@@ -303,7 +1329,7 @@ def reiinit_cache_config():
 
 def _cache_factory(force_init=False):
     if not force_init and hasattr(_cache_factory, '_instance'):
-        if config['cache'] == _cache_factory._impl:
+        if (config['cache'], config['cachedir']) == _cache_factory._impl:
             return _cache_factory._instance
 
     cache_impl = config['cache']
@@ -320,19 +1346,54 @@ def _cache_factory(force_init=False):
     if cache is None:
         raise ValueError(f'Invalid cache in config: {cache_impl}, try one of: remote, local, none')
 
-    _cache_factory._impl = config['cache']
+    _cache_factory._impl = (config['cache'], config['cachedir'])
     _cache_factory._instance = cache
 
     return cache
 
 
+def _country_of(func):
+    # functions of a country live in poopsdontlie.countries.<ISO>
+    module = func.__module__.split('.')
+    if 'countries' not in module[:-1]:
+        return None
+
+    return module[module.index('countries') + 1].upper()
+
+
+def _is_expired(meta):
+    return meta['invalidate_after'] is not None and meta['invalidate_after'] < pd.Timestamp.utcnow()
+
+
+def _meta_from_manifest(entry):
+    """
+    Convert a dataset entry of a manifest to the meta data format of the meta files
+    """
+    if entry is None:
+        return None
+
+    return {
+        **entry,
+        'dtypes': entry['schema'],
+        'invalidate_after': None if entry['invalidate_after'] is None else pd.Timestamp(entry['invalidate_after']),
+    }
+
+
 def _get_registry_entry_for_key_cache_level(key, cache_level):
     for k, v in _invalidate_registry.items():
         if v['key'] == key and v['cache_level'] == cache_level:
             return k, _invalidate_registry[k]
 
+    return None, None
 
-def get_func_invalidate_after(func):
+
+def _get_registry_entry_for_func_name(name):
+    for k, v in _invalidate_registry.items():
+        if k.__name__ == name:
+            return v
+
+
+def get_func_invalidation_policy(func):
     if isinstance(func, str):
         for k in _invalidate_registry:
             if k.__name__ == func:
@@ -343,4 +1404,11 @@ def get_func_invalidate_after(func):
         return _invalidate_registry[func]['invalidate_after']
 
 
+def get_func_invalidate_after(func):
+    """
+    Returns the expiry timestamp for a result of func that is written now
+    """
+    return resolve_invalidate_after(get_func_invalidation_policy(func))
+
+
 _invalidate_registry = {}
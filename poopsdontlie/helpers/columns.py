@@ -0,0 +1,53 @@
+def select_columns(df, columns):
+    """
+    Resolve the requested columns of df, a column can be requested by its full name or by the region code it ends
+    with, e.g. GM0363 for RNA_flow_per_capita_GM0363
+    """
+    if columns is None:
+        return list(df.columns)
+
+    return _resolve(list(df.columns), columns)
+
+
+def _resolve(names, columns):
+    if isinstance(columns, str):
+        columns = [columns]
+
+    selected = []
+    for column in columns:
+        if column in names:
+            selected.append(column)
+            continue
+
+        matches = [c for c in names if str(c).lower().endswith(f'_{column}'.lower())]
+        if len(matches) != 1:
+            raise ValueError(f'Column {column} {"is ambiguous" if matches else "does not exist"}, choose from: {", ".join(map(str, names))}')
+
+        selected.append(matches[0])
+
+    return selected
+
+
+def select_regions(df, columns):
+    """
+    Select the requested columns, as in select_columns, from a dataset in either layout: the columns of a wide frame
+    (with their CI columns when smoothed) or the rows of a long frame
+    """
+    from poopsdontlie.helpers.layout import is_long, region_code, source_column
+
+    if columns is None:
+        return df
+
+    if isinstance(columns, str):
+        columns = [columns]
+
+    if is_long(df):
+        codes = list(df['region_code'].unique())
+        selected = _resolve(codes, [c if c in codes else region_code(c) for c in columns])
+
+        return df[df['region_code'].isin(selected)]
+
+    sources = list(dict.fromkeys(source_column(str(c)) for c in df.columns))
+    selected = set(_resolve(sources, columns))
+
+    return df[[c for c in df.columns if source_column(str(c)) in selected]]
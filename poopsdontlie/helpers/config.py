@@ -1,12 +1,7 @@
-import psutil
-
-from yaml import load, dump
-try:
-    from yaml import CLoader as Loader, CDumper as Dumper
-except ImportError:
-    from yaml import Loader, Dumper
+import os
 
 from appdirs import user_cache_dir, user_config_dir
+from collections.abc import MutableMapping
 from pathlib import Path
 
 appname = 'poopsdontlie'
@@ -16,26 +11,110 @@ default_config = {
     'cache': 'local',
     'cachedir': user_cache_dir(appname),
     'remote_cache_url': 'https://github.com/Sikerdebaard/poops-dont-lie-data/raw/main/data/',
-    'n_jobs': psutil.cpu_count(),
-    'bootstrap_iters': 4_000,
+    'n_jobs': None,  # None means all logical CPUs
+    'executor': 'loky',  # serial, threads, loky, dask or ray
+    'executor_address': None,  # dask scheduler / ray head node address, None starts a local cluster
+    'bootstrap_iters': 4_000,  # the maximum when bootstrap_tol is set
+    'bootstrap_tol': None,  # e.g. 0.01 stops bootstrapping once the CI bounds change < 1% of the CI width per batch
+    'bootstrap_batch_size': 250,
+    'ci_mode': 'wait',  # wait: return results with CIs, background: return lowess curves first and add the CIs later
+    'cache_max_size': None,  # e.g. 2GB, None means unlimited
+    'partition_immutable_days': 42,  # monthly partitions older than this are not expected to change anymore
+    'cache_mmap': False,  # store frames memory-mapped in the local cache, processes on a host share one copy
+    'serve_stale': False,  # use expired cache entries instead of recomputing them, for when the refresh command runs
+    'profile_sinks': [],  # e.g. ['log', 'jsonl:/path/stages.jsonl', 'prometheus:/path/poopsdontlie.prom']
+}
+
+# environment variables take precedence over the config file
+env_overrides = {
+    'POOPSDONTLIE_CACHE': ('cache', str),
+    'POOPSDONTLIE_CACHEDIR': ('cachedir', str),
+    'POOPSDONTLIE_REMOTE_CACHE_URL': ('remote_cache_url', str),
+    'POOPSDONTLIE_N_JOBS': ('n_jobs', int),
+    'POOPSDONTLIE_EXECUTOR': ('executor', str),
+    'POOPSDONTLIE_EXECUTOR_ADDRESS': ('executor_address', str),
+    'POOPSDONTLIE_BOOTSTRAP_ITERS': ('bootstrap_iters', int),
+    'POOPSDONTLIE_BOOTSTRAP_TOL': ('bootstrap_tol', float),
+    'POOPSDONTLIE_CI_MODE': ('ci_mode', str),
+    'POOPSDONTLIE_CACHE_MAX_SIZE': ('cache_max_size', str),
+    'POOPSDONTLIE_CACHE_MMAP': ('cache_mmap', lambda v: v.lower() in ('1', 'true', 'yes')),
+    'POOPSDONTLIE_SERVE_STALE': ('serve_stale', lambda v: v.lower() in ('1', 'true', 'yes')),
 }
 
 
 config_file = Path(user_config_dir(appname)) / 'config.yml'
-config_file.parent.mkdir(parents=True, exist_ok=True)
 
 
 def write_default_config():
+    from yaml import dump
+
+    config_file.parent.mkdir(parents=True, exist_ok=True)
     with open(config_file, 'w') as fh:
         dump(default_config, fh)
 
 
-if not config_file.is_file():
-    write_default_config()
+def _load_config_file():
+    if not config_file.is_file():
+        return {}
+
+    from yaml import load
+    try:
+        from yaml import CLoader as Loader
+    except ImportError:
+        from yaml import Loader
+
+    with open(config_file, 'r') as fh:
+        return load(fh, Loader=Loader) or {}
+
+
+class Config(MutableMapping):
+    """
+    The apps config, loaded from the config file and environment on first access
+
+    Values are resolved when they are read, code should read the config at call time instead of freezing values as
+    default arguments so that changes (CLI options, environment variables) take effect.
+    """
+
+    def __init__(self):
+        self._values = None
+
+    def _load(self):
+        if self._values is None:
+            values = {**default_config, **_load_config_file()}
+
+            for env, (k, cast) in env_overrides.items():
+                if os.environ.get(env, '') != '':
+                    values[k] = cast(os.environ[env])
+
+            self._values = values
+
+        return self._values
+
+    def reload(self):
+        self._values = None
+
+    def __getitem__(self, key):
+        value = self._load()[key]
+
+        if key == 'n_jobs' and value is None:
+            return os.cpu_count()
+
+        return value
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+
+    def __delitem__(self, key):
+        del self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._load()!r})'
 
-with open(config_file, 'r') as fh:
-    config = load(fh, Loader=Loader)
 
-for k, v in default_config.items():
-    if k not in config:
-        config[k] = v
+config = Config()
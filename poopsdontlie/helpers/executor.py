@@ -0,0 +1,153 @@
+"""
+Execution backends for the parallel stages
+
+Every parallel stage hands its joblib delayed tasks to the executor from get_executor(), the executor is chosen with
+the executor config key:
+
+    serial   run in the calling thread, for tests and debugging
+    threads  a thread pool in this process
+    loky     a pool of worker processes on this machine (default)
+    dask     a dask.distributed cluster, executor_address points to the scheduler, a local cluster is started without it
+    ray      a ray cluster, executor_address points to the head node, a local ray is started without it
+
+dask and ray are optional dependencies: pip install poops-dont-lie[dask] or poops-dont-lie[ray]
+"""
+import contextlib
+
+from joblib import Parallel
+
+from poopsdontlie.helpers import config
+from poopsdontlie.helpers.joblib import tqdm_joblib
+
+
+class Executor:
+    # joblib backend name, None uses the joblib default (loky)
+    backend = None
+
+    # workers can read files written by this process, e.g. for shared inputs
+    shares_filesystem = True
+
+    # rough costs in seconds of starting a parallel run and of dispatching a task, used by the planner
+    startup_overhead = .05
+    task_overhead = 2e-3
+
+    def max_workers(self):
+        return config['n_jobs']
+
+    @contextlib.contextmanager
+    def _backend_context(self):
+        yield
+
+    def run(self, tasks, n_jobs=None, progress=None):
+        """
+        Run joblib delayed tasks on at most n_jobs workers and return their results in order
+
+        progress is an optional tqdm progress bar that is updated when tasks finish.
+        """
+        tasks = list(tasks)
+        n_jobs = min(n_jobs or self.max_workers(), self.max_workers(), max(1, len(tasks)))
+
+        with self._backend_context(), tqdm_joblib(progress) if progress is not None else contextlib.nullcontext():
+            return Parallel(n_jobs=n_jobs, backend=self.backend)(tasks)
+
+
+class SerialExecutor(Executor):
+    backend = 'sequential'
+    startup_overhead = 0.
+    task_overhead = 0.
+
+    def max_workers(self):
+        return 1
+
+    def run(self, tasks, n_jobs=None, progress=None):
+        # call the delayed (func, args, kwargs) tuples directly, joblib does not report progress when sequential
+        retvals = []
+        try:
+            for func, args, kwargs in tasks:
+                retvals.append(func(*args, **kwargs))
+
+                if progress is not None:
+                    progress.update()
+        finally:
+            if progress is not None:
+                progress.close()
+
+        return retvals
+
+
+class ThreadExecutor(Executor):
+    backend = 'threading'
+    startup_overhead = .01
+    task_overhead = 1e-4
+
+
+class LokyExecutor(Executor):
+    backend = 'loky'
+
+
+class DaskExecutor(Executor):
+    # the dask backend is set up with the client in _backend_context
+    backend = None
+    task_overhead = 1e-2
+
+    def __init__(self, address=None):
+        from dask.distributed import Client
+
+        # without an address dask starts a local cluster
+        self._client = Client(address) if address else Client(n_workers=config['n_jobs'])
+        self.shares_filesystem = address is None
+
+    def max_workers(self):
+        return max(1, sum(self._client.ncores().values()))
+
+    @contextlib.contextmanager
+    def _backend_context(self):
+        from joblib import parallel_backend
+
+        with parallel_backend('dask', client=self._client):
+            yield
+
+
+class RayExecutor(Executor):
+    backend = 'ray'
+    task_overhead = 1e-2
+
+    def __init__(self, address=None):
+        import ray
+        from ray.util.joblib import register_ray
+
+        ray.init(address=address, ignore_reinit_error=True)
+        register_ray()
+
+        self._ray = ray
+        self.shares_filesystem = address is None
+
+    def max_workers(self):
+        return max(1, int(self._ray.cluster_resources().get('CPU', 1)))
+
+
+executors = {
+    'serial': SerialExecutor,
+    'threads': ThreadExecutor,
+    'loky': LokyExecutor,
+    'dask': DaskExecutor,
+    'ray': RayExecutor,
+}
+
+
+def get_executor():
+    impl = (config['executor'] or 'loky').lower().strip()
+    address = config['executor_address']
+
+    if getattr(get_executor, '_impl', None) == (impl, address):
+        return get_executor._instance
+
+    if impl not in executors:
+        raise ValueError(f'Invalid executor in config: {impl}, try one of: {", ".join(executors)}')
+
+    executor = executors[impl](address) if impl in ('dask', 'ray') else executors[impl]()
+
+    get_executor._impl = (impl, address)
+    get_executor._instance = executor
+
+    return executor
@@ -0,0 +1,167 @@
+"""
+Writers for the output formats of the get command
+
+    csv       plain csv
+    csv.gz    gzip compressed csv
+    csv.zst   zstandard compressed csv, needs zstandard
+    json      one object per date, one object per row for the long layout
+    ndjson    one {date, column, value} object per line, missing values are left out, the rows as is for the long
+              layout
+    parquet   needs pyarrow
+    feather   Arrow IPC, needs pyarrow
+    xlsx      streamed row by row with xlsxwriter when it is installed, openpyxl otherwise
+
+The optional dependencies are installed with: pip install poops-dont-lie[export]
+"""
+import importlib
+import importlib.util
+
+import pandas as pd
+
+from datetime import datetime
+
+from poopsdontlie.helpers.layout import is_long
+
+
+# xlsx limits sheet names to 31 characters
+_MAX_SHEET_NAME = 31
+
+
+def _require(module):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(f'{module} is needed for this output format, install it with: pip install poops-dont-lie[export]') from None
+
+
+def _has(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def _index_name(df):
+    return df.index.name or 'date'
+
+
+def _write_csv(df, path, name):
+    return df.to_csv(path, index=True)
+
+
+def _write_csv_gz(df, path, name):
+    # level 6 is several times faster than the default level 9 for a few percent larger files
+    df.to_csv(path, index=True, compression={'method': 'gzip', 'compresslevel': 6})
+
+
+def _write_csv_zst(df, path, name):
+    _require('zstandard')
+    df.to_csv(path, index=True, compression={'method': 'zstd', 'level': 3})
+
+
+def _write_json(df, path, name):
+    if is_long(df):
+        # dates are not unique in the long layout
+        return df.rename_axis(_index_name(df)).reset_index().to_json(path, orient='records', date_format='iso')
+
+    return df.to_json(path, orient='index')
+
+
+def to_long(df):
+    """
+    Convert a wide frame (one column per region) to a long frame with date, column and value columns, frames in
+    the long layout are returned with their date index as a column
+    """
+    index_name = _index_name(df)
+    if is_long(df):
+        return df.rename_axis(index_name).reset_index()
+
+    df_long = df.rename_axis(index_name).reset_index().melt(id_vars=index_name, var_name='column', value_name='value')
+
+    return df_long.dropna(subset=['value'])
+
+
+def _write_ndjson(df, path, name):
+    return to_long(df).to_json(path, orient='records', lines=True, date_format='iso')
+
+
+def _write_parquet(df, path, name):
+    _require('pyarrow')
+    df.to_parquet(path, engine='pyarrow', index=True)
+
+
+def _write_feather(df, path, name):
+    _require('pyarrow')
+    # feather stores no index
+    df.rename_axis(_index_name(df)).reset_index().to_feather(path)
+
+
+def _write_xlsx_streaming(df, path, name):
+    import xlsxwriter
+
+    # constant_memory writes every row to disk when the next one starts, rows have to be written in order
+    workbook = xlsxwriter.Workbook(str(path), {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet(name[:_MAX_SHEET_NAME])
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+
+        worksheet.write_row(0, 0, [_index_name(df), *map(str, df.columns)])
+
+        index = df.index
+        if isinstance(index, pd.DatetimeIndex):
+            index = index.tz_localize(None).to_pydatetime()
+
+        values = df.to_numpy(dtype=object, na_value=None)
+        for row, (idx, rowvalues) in enumerate(zip(index, values), start=1):
+            if isinstance(idx, datetime):
+                worksheet.write_datetime(row, 0, idx, date_format)
+            else:
+                worksheet.write(row, 0, idx)
+
+            worksheet.write_row(row, 1, rowvalues)
+    finally:
+        workbook.close()
+
+
+def _write_xlsx(df, path, name):
+    if _has('xlsxwriter'):
+        _write_xlsx_streaming(df, path, name)
+    else:
+        df.to_excel(path, sheet_name=name[:_MAX_SHEET_NAME])
+
+
+formats = {
+    'csv': ('.csv', _write_csv),
+    'csv.gz': ('.csv.gz', _write_csv_gz),
+    'csv.zst': ('.csv.zst', _write_csv_zst),
+    'json': ('.json', _write_json),
+    'ndjson': ('.ndjson', _write_ndjson),
+    'parquet': ('.parquet', _write_parquet),
+    'feather': ('.feather', _write_feather),
+    'xlsx': ('.xlsx', _write_xlsx),
+}
+
+
+# formats that are text, their writers return the text when path is None
+text_formats = ('csv', 'json', 'ndjson')
+
+
+def serialize(df, format='csv'):
+    """
+    Returns df in one of the text formats as a string
+    """
+    if format not in text_formats:
+        raise ValueError(f'Output format {format} is not a text format, choose one of {", ".join(text_formats)}')
+
+    return formats[format][1](df, None, None)
+
+
+def export(df, outdir, name, format='csv'):
+    """
+    Write df to outdir/name.<suffix of format>, returns the path of the written file
+    """
+    if format not in formats:
+        raise ValueError(f'Output format {format} does not exist, choose one of {", ".join(formats)}')
+
+    suffix, writer = formats[format]
+    path = outdir / f'{name}{suffix}'
+    writer(df, path, name)
+
+    return path
@@ -0,0 +1,83 @@
+import os
+import time
+
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+class FileLock:
+    """
+    Inter-process exclusive lock backed by a lock file
+
+    The lock is held on an open file descriptor (flock on posix, msvcrt.locking on windows), so it is released by
+    the OS when the process holding it dies. This makes it safe to use between a cron job and a web worker that
+    share the same cache directory.
+    """
+
+    def __init__(self, path, timeout=None, poll_interval=.1):
+        self._path = Path(path)
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._fd = None
+
+    @property
+    def is_locked(self):
+        return self._fd is not None
+
+    def _try_lock(self, fd):
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:  # pragma: no cover - windows
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+
+        return True
+
+    def acquire(self):
+        if self.is_locked:
+            return self
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        start = time.monotonic()
+        while not self._try_lock(fd):
+            if self._timeout is not None and time.monotonic() - start >= self._timeout:
+                os.close(fd)
+                raise LockTimeout(f'Could not acquire lock {self._path} within {self._timeout} seconds')
+
+            time.sleep(self._poll_interval)
+
+        self._fd = fd
+
+        return self
+
+    def release(self):
+        if not self.is_locked:
+            return
+
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:  # pragma: no cover - windows
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
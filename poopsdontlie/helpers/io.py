@@ -1,9 +1,40 @@
+import contextlib
+import os
+import tempfile
+
 import requests
 from io import BytesIO
 from tqdm.auto import tqdm
+from poopsdontlie.helpers.profiling import stage
+
+
+def atomic_write(path, writer, mode='wb'):
+    """
+    Write a file with writer(fh) to a temporary file in the same directory and atomically rename it, readers either
+    see the old file or the complete new file, never a partial one
+    """
+    fd, tmppath = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as fh:
+            writer(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmppath, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmppath)
+        raise
 
 
 def download_file_with_progressbar(url, leave=True):
+    with stage('download', url=url) as s:
+        retval = _download_file_with_progressbar(url, leave)
+        s.set(bytes=retval.getbuffer().nbytes)
+
+    return retval
+
+
+def _download_file_with_progressbar(url, leave=True):
     print(f'Downloading {url}')
 
     headers = {
@@ -22,3 +53,32 @@ def download_file_with_progressbar(url, leave=True):
     retval.seek(0)
 
     return retval
+
+
+def upstream_changed(url, validators=None):
+    """
+    Check with a conditional HEAD request whether url changed since validators (the ETag and Last-Modified headers of
+    an earlier check) were taken, returns (changed, validators). Without validators, or when the server sends neither
+    header, url is assumed to have changed.
+    """
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    with stage('upstream_check', url=url) as s:
+        res = requests.head(url, headers=headers, allow_redirects=True, timeout=30)
+        s.set(status=res.status_code)
+
+    if res.status_code == 304:
+        return False, validators
+
+    res.raise_for_status()
+
+    new_validators = {'etag': res.headers.get('ETag'), 'last_modified': res.headers.get('Last-Modified')}
+    if not validators or not any(new_validators.values()):
+        return True, new_validators
+
+    return new_validators != validators, new_validators
@@ -0,0 +1,94 @@
+"""
+Wide and long layouts of the datasets
+
+The datasets are wide by default: a date index and one column per region (three per region when smoothed). The long
+layout has a date index and one row per date and region that has data:
+
+    raw       date | region_code, value
+    smoothed  date | region_code, value, ci_bottom, ci_top
+
+Regions only have rows from the date they started reporting, so long frames of sparse histories are much smaller
+and filtering a region is a lookup on the region_code column.
+"""
+import re
+
+import pandas as pd
+
+
+layouts = ('wide', 'long')
+
+# prefixes of the region columns in the wide datasets
+_REGION_PREFIXES = ('RNA_flow_per_capita_', 'rwzi_awzi_code_')
+
+_SMOOTHED_COLUMN = re.compile(r'^(?P<region>.+?)(_lowess)?(_\d+_perc_ci_(?P<bound>bottom|top))?$')
+
+
+def check_layout(layout):
+    if layout is not None and layout not in layouts:
+        raise ValueError(f'Layout {layout} invalid, choose one of: {", ".join(layouts)}')
+
+    return layout or 'wide'
+
+
+def is_long(df):
+    return 'region_code' in df.columns
+
+
+def region_code(column):
+    for prefix in _REGION_PREFIXES:
+        if column.startswith(prefix):
+            return column[len(prefix):]
+
+    return column
+
+
+def ci_bound(column):
+    """
+    Returns bottom or top for the CI columns of a smoothed wide frame, None for the other columns
+    """
+    return _SMOOTHED_COLUMN.match(column)['bound']
+
+
+def source_column(column):
+    """
+    Returns the column that a column of a smoothed wide frame was computed from, other columns are returned as is
+    """
+    return _SMOOTHED_COLUMN.match(column)['region']
+
+
+def _long_frame(df):
+    # stack the region level of the columns into the index, rows without a value are dropped
+    df_long = df.stack(level=0).dropna(subset=['value'])
+    df_long.index = df_long.index.set_names(['date', 'region_code'])
+    df_long = df_long.reset_index(level='region_code')
+    df_long.attrs = dict(df.attrs)
+
+    return df_long
+
+
+def wide_to_long(df):
+    """
+    Convert a wide frame with one column per region to the long layout
+    """
+    df = df.copy(deep=False)
+    df.columns = pd.MultiIndex.from_tuples([(region_code(str(c)), 'value') for c in df.columns])
+
+    return _long_frame(df)
+
+
+def smoothed_to_long(df, region=None):
+    """
+    Convert a smoothed wide frame with a <region>_lowess column and two CI columns per region to the long layout,
+    region overrides the region code for frames of a single region, e.g. the national level
+    """
+    fields = {None: 'value', 'bottom': 'ci_bottom', 'top': 'ci_top'}
+
+    columns = []
+    for c in df.columns:
+        m = _SMOOTHED_COLUMN.match(str(c))
+        columns.append((region or region_code(m['region']), fields[m['bound']]))
+
+    df = df.copy(deep=False)
+    df.columns = pd.MultiIndex.from_tuples(columns)
+
+    return _long_frame(df)[['region_code', 'value', 'ci_bottom', 'ci_top']]
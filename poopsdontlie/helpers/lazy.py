@@ -0,0 +1,27 @@
+import importlib
+
+
+class LazyFunction:
+    """
+    Stand-in for a function that is only imported when it is first called
+
+    Keeps the dataset registry importable without pulling in pandas, geopandas, statsmodels and friends, which makes
+    commands like list and config start instantly.
+    """
+
+    def __init__(self, module, name):
+        self.__module__ = module
+        self.__name__ = name
+        self._func = None
+
+    def resolve(self):
+        if self._func is None:
+            self._func = getattr(importlib.import_module(self.__module__), self.__name__)
+
+        return self._func
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<lazy function {self.__module__}.{self.__name__}>'
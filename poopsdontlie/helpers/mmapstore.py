@@ -0,0 +1,97 @@
+"""
+Memory-mapped storage of frames for LocalFilesystemCache
+
+A frame whose columns all share one dtype is stored as a directory with its values as a single column-major .npy
+array (plus the mask for the nullable dtypes Int64, Float64, ...) and a small pickle with the index, the columns and
+the attrs. Reading it maps the arrays into memory and builds the frame on top of them without copying, so processes
+on one host that read the same entry share one copy in the page cache instead of each unpickling their own.
+
+The arrays are mapped copy-on-write: a process that changes the frame in place gets private copies of the pages it
+writes to, the file and the other processes are unaffected.
+"""
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from pandas.api.extensions import ExtensionDtype
+from pathlib import Path
+
+
+# the nullable dtypes, stored as values and mask
+_MASKED = {'Int8', 'Int16', 'Int32', 'Int64', 'UInt8', 'UInt16', 'UInt32', 'UInt64', 'Float32', 'Float64', 'boolean'}
+
+_VALUES = 'values.npy'
+_MASK = 'mask.npy'
+_META = 'meta.pkl'
+
+
+def _dtype(df):
+    dtypes = set(df.dtypes)
+    if len(dtypes) != 1:
+        return None
+
+    dtype = dtypes.pop()
+    if isinstance(dtype, ExtensionDtype):
+        return dtype if dtype.name in _MASKED else None
+
+    return dtype if dtype.kind in 'biufM' else None
+
+
+def can_mmap(value):
+    """
+    Whether value is a frame that can be stored memory-mapped: one dtype for all columns, numeric, bool, datetime or
+    one of the nullable variants of those
+    """
+    return isinstance(value, pd.DataFrame) and value.shape[1] > 0 and value.columns.is_unique and _dtype(value) is not None
+
+
+def write(path, df):
+    """
+    Writes df to the directory path, which must not exist yet
+    """
+    path = Path(path)
+    path.mkdir(parents=True)
+
+    dtype = _dtype(df)
+    if isinstance(dtype, ExtensionDtype):
+        values = np.asfortranarray(df.to_numpy(dtype=dtype.numpy_dtype, na_value=0))
+        np.save(path / _MASK, np.asfortranarray(df.isna().to_numpy()))
+    else:
+        values = np.asfortranarray(df.to_numpy())
+
+    np.save(path / _VALUES, values)
+
+    with open(path / _META, 'wb') as fh:
+        pickle.dump({'dtype': dtype, 'index': df.index, 'columns': df.columns, 'attrs': df.attrs}, fh)
+
+
+def read(path):
+    """
+    Returns the frame stored in the directory path as a view on the memory-mapped arrays
+    """
+    path = Path(path)
+
+    with open(path / _META, 'rb') as fh:
+        meta = pickle.load(fh)
+
+    values = np.load(path / _VALUES, mmap_mode='c')
+
+    if isinstance(meta['dtype'], ExtensionDtype):
+        mask = np.load(path / _MASK, mmap_mode='c')
+        array_type = meta['dtype'].construct_array_type()
+
+        # every column is a separate block, a column of a column-major array is contiguous
+        df = pd.DataFrame({i: array_type(values[:, i], mask[:, i]) for i in range(values.shape[1])}, index=meta['index'], copy=False)
+        df.columns = meta['columns']
+    else:
+        # the transpose of a column-major array is the row-major block pandas uses, no copy is made
+        df = pd.DataFrame(values, index=meta['index'], columns=meta['columns'], copy=False)
+
+    df.attrs = meta['attrs']
+
+    return df
+
+
+def size(path):
+    return sum(p.stat().st_size for p in Path(path).iterdir())
@@ -0,0 +1,137 @@
+"""
+Work partitioning for the parallel stages
+
+The planner decides per stage whether work runs serially or in parallel, on how many workers and in which chunks. It
+is based on the number of items, their size and the measured cost per item. Costs are measured by running a small
+probe in this process the first time, they are kept per stage (normalized by item size) so later calls of the same
+stage skip the probe. Every planned run updates the cost with its measured wall time.
+
+    if not planner.has_cost('stage'):
+        with planner.measure('stage', n_items=len(probe), size=n_rows):
+            results = [work(item) for item in probe]
+
+    plan = planner.plan('stage', n_items=len(rest), size=n_rows)
+    with planner.measure_plan('stage', plan, size=n_rows):
+        results += plan.executor().run(delayed(work)(chunk) for chunk in split(rest, plan.chunks))
+"""
+import contextlib
+import threading
+import time
+
+from collections import namedtuple
+
+
+# a task should run at least this many times longer than it costs to dispatch it
+_MIN_TASK_TO_OVERHEAD = 20
+
+# upper bound of tasks per worker, more tasks balance uneven work better but add overhead
+_MAX_TASKS_PER_WORKER = 4
+
+
+_costs = {}
+_costs_lock = threading.Lock()
+
+
+class Plan(namedtuple('Plan', ['n_jobs', 'chunks', 'estimate'])):
+    """
+    n_jobs workers run len(chunks) tasks, chunks contains the number of items per task and estimate the expected
+    wall time in seconds
+    """
+
+    @property
+    def parallel(self):
+        return self.n_jobs > 1
+
+    def executor(self):
+        from poopsdontlie.helpers.executor import get_executor, SerialExecutor
+
+        return get_executor() if self.parallel else SerialExecutor()
+
+
+def split_evenly(n_items, n_parts):
+    """
+    Split n_items as evenly as possible over at most n_parts parts, no part is empty
+    """
+    n_parts = max(1, min(n_parts, n_items))
+
+    return [n_items // n_parts + (i < n_items % n_parts) for i in range(n_parts)]
+
+
+def has_cost(stage):
+    return stage in _costs
+
+
+def record_cost(stage, n_items, seconds, size=1):
+    """
+    Record the measured wall time of running n_items items of size on one worker
+    """
+    if n_items <= 0:
+        return
+
+    cost = seconds / n_items / max(size, 1)
+
+    with _costs_lock:
+        # smooth the measurements, a single run can be disturbed by e.g. a lazy import or a busy machine
+        _costs[stage] = cost if stage not in _costs else .5 * _costs[stage] + .5 * cost
+
+
+def cost_per_item(stage, size=1):
+    return _costs.get(stage, 0.) * max(size, 1)
+
+
+@contextlib.contextmanager
+def measure(stage, n_items, size=1):
+    """
+    Measure the work in the with block as n_items items of size for stage
+    """
+    start = time.perf_counter()
+    yield
+    record_cost(stage, n_items, time.perf_counter() - start, size)
+
+
+@contextlib.contextmanager
+def measure_plan(stage, plan, size=1):
+    """
+    Measure the run of plan in the with block and record the cost per item on one worker it implies
+    """
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+
+    if plan.parallel:
+        executor = plan.executor()
+        # the inverse of the estimate of plan(): startup + (work + dispatching the tasks) / n_jobs
+        seconds = (seconds - executor.startup_overhead) * plan.n_jobs - len(plan.chunks) * executor.task_overhead
+
+    if seconds > 0:
+        record_cost(stage, sum(plan.chunks), seconds, size)
+
+
+def plan(stage, n_items, size=1, max_workers=None, executor=None):
+    """
+    Plan n_items items of stage on at most max_workers workers of executor (default: the configured executor)
+    """
+    if executor is None:
+        from poopsdontlie.helpers.executor import get_executor
+        executor = get_executor()
+
+    if max_workers is None:
+        max_workers = executor.max_workers()
+    max_workers = max(1, min(max_workers, executor.max_workers(), n_items))
+
+    total = n_items * cost_per_item(stage, size)
+    task_overhead = executor.task_overhead
+
+    # work split over n workers costs startup + dispatching the tasks + the work itself, one worker runs serially
+    # in this process without any overhead
+    best = Plan(1, [n_items] if n_items else [], total)
+    for n_jobs in range(2, max_workers + 1):
+        min_task_time = _MIN_TASK_TO_OVERHEAD * task_overhead
+        n_tasks = n_jobs if min_task_time <= 0 else int(total / min_task_time)
+        n_tasks = max(n_jobs, min(n_tasks, n_jobs * _MAX_TASKS_PER_WORKER, n_items))
+
+        estimate = executor.startup_overhead + (total + n_tasks * task_overhead) / n_jobs
+        if estimate < best.estimate:
+            best = Plan(n_jobs, split_evenly(n_items, n_tasks), estimate)
+
+    return best
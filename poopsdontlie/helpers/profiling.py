@@ -0,0 +1,284 @@
+"""
+Per-stage timing and memory instrumentation
+
+Stages are measured with the stage() context manager and every finished stage is emitted as a record to the
+registered sinks. Records contain:
+
+    stage, parent, start, wall_time, cpu_time, peak_rss_delta, rows_in, cols_in, rows_out, cols_out,
+    cache (hit / miss), cache_level, pid and any extra info given to stage()
+
+cpu_time only covers this process, work done in joblib worker processes shows up as wall time of the stage that
+waits for them.
+
+Sinks are registered with add_sink() or with the profile_sinks config key, e.g.:
+
+    profile_sinks: ['log', 'jsonl:/var/log/poopsdontlie/stages.jsonl', 'prometheus:/var/lib/node_exporter/poopsdontlie.prom']
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from pathlib import Path
+
+from poopsdontlie.helpers import config
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - windows
+    resource = None
+
+
+logger = logging.getLogger('poopsdontlie.profiling')
+
+
+def _peak_rss():
+    """
+    Peak resident set size of this process in bytes, None if it can not be determined
+    """
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux reports kilobytes, macos bytes
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+    try:  # pragma: no cover - windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):  # pragma: no cover
+        return None
+
+
+def _shape(obj):
+    shape = getattr(obj, 'shape', None)
+    if shape is None:
+        return None, None
+
+    if len(shape) == 1:
+        return shape[0], 1
+
+    return shape[0], shape[1]
+
+
+class Stage:
+    def __init__(self, name, parent=None, data_in=None, **info):
+        self.record = {
+            'stage': name,
+            'parent': parent,
+            'pid': os.getpid(),
+            **info,
+        }
+        self.record['rows_in'], self.record['cols_in'] = _shape(data_in)
+        self.record['rows_out'], self.record['cols_out'] = None, None
+
+    def set_output(self, data_out):
+        self.record['rows_out'], self.record['cols_out'] = _shape(data_out)
+
+    def set(self, **info):
+        self.record.update(info)
+
+
+class LogSink:
+    def __init__(self, logger=logger, level=logging.INFO):
+        self._logger = logger
+        self._level = level
+
+    def emit(self, record):
+        extra = ''
+        if record.get('cache') is not None:
+            extra += f' cache={record["cache"]}'
+        if record['rows_out'] is not None:
+            extra += f' out={record["rows_out"]}x{record["cols_out"]}'
+        if record['peak_rss_delta'] is not None:
+            extra += f' peak_rss_delta={record["peak_rss_delta"] / 2 ** 20:0.1f}MB'
+
+        self._logger.log(self._level, f'[stage] {record["stage"]}: wall={record["wall_time"]:0.3f}s cpu={record["cpu_time"]:0.3f}s{extra}')
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        self._path = Path(path)
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, default=str) + '\n'
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self._path, 'a') as fh:
+            fh.write(line)
+
+
+class PrometheusTextfileSink:
+    """
+    Writes metrics in the prometheus textfile-collector format, the file is rewritten atomically on every record
+    """
+
+    def __init__(self, path, prefix='poopsdontlie'):
+        self._path = Path(path)
+        self._prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _inc(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        self._metrics[key] = self._metrics.get(key, 0) + value
+
+    def _set(self, name, labels, value):
+        self._metrics[(name, tuple(sorted(labels.items())))] = value
+
+    def emit(self, record):
+        labels = {'stage': record['stage']}
+
+        with self._lock:
+            self._inc('stage_runs_total', labels, 1)
+            self._inc('stage_wall_seconds_total', labels, record['wall_time'])
+            self._inc('stage_cpu_seconds_total', labels, record['cpu_time'])
+            self._set('stage_last_wall_seconds', labels, record['wall_time'])
+            if record['peak_rss_delta'] is not None:
+                self._set('stage_last_peak_rss_delta_bytes', labels, record['peak_rss_delta'])
+            if record['rows_out'] is not None:
+                self._set('stage_last_rows_out', labels, record['rows_out'])
+            if record.get('cache') is not None:
+                self._inc('stage_cache_total', {**labels, 'result': record['cache'], 'level': record.get('cache_level')}, 1)
+
+            lines = []
+            for (name, label_items), value in sorted(self._metrics.items()):
+                label_str = ','.join(f'{k}="{v}"' for k, v in label_items)
+                lines.append(f'{self._prefix}_{name}{{{label_str}}} {value}\n')
+
+            from poopsdontlie.helpers.io import atomic_write
+
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self._path, lambda fh: fh.writelines(lines), mode='w')
+
+
+class MemorySink:
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+_sinks = []
+_local = threading.local()
+
+
+def add_sink(sink):
+    _sinks.append(sink)
+
+    return sink
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def sink_from_spec(spec):
+    """
+    Create a sink from a config entry: log, jsonl:<path> or prometheus:<path>
+    """
+    kind, _, arg = spec.partition(':')
+
+    if kind == 'log':
+        return LogSink()
+    elif kind == 'jsonl' and arg:
+        return JsonLinesSink(arg)
+    elif kind == 'prometheus' and arg:
+        return PrometheusTextfileSink(arg)
+
+    raise ValueError(f'Invalid profile sink {spec}, use one of: log, jsonl:<path>, prometheus:<path>')
+
+
+def _configured_sinks():
+    specs = tuple(config.get('profile_sinks') or ())
+
+    if getattr(_configured_sinks, '_specs', None) != specs:
+        _configured_sinks._specs = specs
+        _configured_sinks._sinks = [sink_from_spec(spec) for spec in specs]
+
+    return _configured_sinks._sinks
+
+
+def _emit(record):
+    for sink in [*_sinks, *_configured_sinks()]:
+        try:
+            sink.emit(record)
+        except Exception as e:
+            # instrumentation should never break the pipeline
+            logger.warning(f'Profile sink {sink.__class__.__name__} failed: {e}')
+
+
+@contextlib.contextmanager
+def stage(name, data_in=None, **info):
+    """
+    Measure a stage of the pipeline, use the yielded Stage to add the output or extra info
+
+        with stage('aggregate', df_in) as s:
+            df_out = aggregate(df_in)
+            s.set_output(df_out)
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    s = Stage(name, parent=stack[-1] if stack else None, data_in=data_in, **info)
+    stack.append(name)
+
+    rss_before = _peak_rss()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    s.record['start'] = time.time()
+    try:
+        yield s
+    finally:
+        stack.pop()
+
+        rss_after = _peak_rss()
+        s.record['wall_time'] = time.perf_counter() - wall_start
+        s.record['cpu_time'] = time.process_time() - cpu_start
+        s.record['peak_rss_delta'] = None if rss_before is None or rss_after is None else rss_after - rss_before
+
+        _emit(s.record)
+
+
+def profiled(name=None):
+    """
+    Decorator that measures every call of a function as a stage, with its first argument as input
+    """
+    def decorator_profiled(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper_profiled(*args, **kwargs):
+            with stage(stage_name, args[0] if args else None) as s:
+                retval = func(*args, **kwargs)
+                s.set_output(retval)
+
+            return retval
+        return wrapper_profiled
+    return decorator_profiled
+
+
+def summarize(records):
+    """
+    Aggregate records per stage: calls, total wall and cpu time, largest peak rss delta and cache hits / misses
+    """
+    summary = {}
+    for record in records:
+        entry = summary.setdefault(record['stage'], {
+            'stage': record['stage'], 'calls': 0, 'wall_time': 0., 'cpu_time': 0., 'peak_rss_delta': 0, 'hits': 0, 'misses': 0,
+        })
+
+        entry['calls'] += 1
+        entry['wall_time'] += record['wall_time']
+        entry['cpu_time'] += record['cpu_time']
+        entry['peak_rss_delta'] = max(entry['peak_rss_delta'], record['peak_rss_delta'] or 0)
+        # results kept in memory by memoized() count as hits
+        entry['hits'] += record.get('cache') in ('hit', 'memo')
+        entry['misses'] += record.get('cache') == 'miss'
+
+    return sorted(summary.values(), key=lambda e: e['wall_time'], reverse=True)
@@ -0,0 +1,170 @@
+"""
+Refresh daemon that keeps the cached datasets fresh
+
+Without it the first caller after an upstream update finds the datasets expired and waits for the whole pipeline.
+The daemon does that work ahead of the callers: it sleeps until the next update time of the upstream sources, polls
+the sources that are due with conditional requests until they changed and then recomputes all datasets of their
+country inside refreshing(). Callers that set the serve_stale config key keep using the previous entries until the
+new ones replace them.
+"""
+import json
+import time
+
+import pandas as pd
+import requests
+
+from collections import namedtuple
+from pathlib import Path
+from poopsdontlie.helpers import config, background
+from poopsdontlie.helpers.cache import memoized, refreshing, resolve_invalidate_after
+from poopsdontlie.helpers.io import atomic_write, upstream_changed
+
+
+class Upstream(namedtuple('Upstream', ['country', 'name', 'url', 'policy'])):
+    """
+    An upstream source of a country, policy is the invalidation policy that tells when the source is updated
+    """
+
+
+def upstream_sources(countries):
+    from poopsdontlie.countries import countries as registry
+
+    sources = []
+    for iso in countries:
+        sources_func = getattr(registry[iso], 'upstream_sources', None)
+        if sources_func is not None:
+            sources.extend(Upstream(iso, *source) for source in sources_func())
+
+    return sources
+
+
+def _state_file():
+    return Path(config['cachedir']) / 'refresh_state.json'
+
+
+def load_state():
+    """
+    Returns the validators (ETag, Last-Modified) of the last check of every upstream source by name
+    """
+    path = _state_file()
+    if not path.is_file():
+        return {}
+
+    with open(path, 'r') as fh:
+        return json.load(fh)
+
+
+def save_state(state):
+    path = _state_file()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    atomic_write(path, lambda fh: json.dump(state, fh), mode='w')
+
+
+def next_update(sources):
+    """
+    Returns the next update time of sources and the sources that are updated at that time
+    """
+    times = {source: resolve_invalidate_after(source.policy) for source in sources}
+    times = {source: t for source, t in times.items() if t is not None}
+    if not times:
+        return None, []
+
+    wake = min(times.values())
+
+    return wake, [source for source, t in times.items() if t == wake]
+
+
+def check(sources, state):
+    """
+    Checks sources once with a conditional request, updates their validators in state and returns the changed ones
+    """
+    changed = []
+    for source in sources:
+        try:
+            is_changed, state[source.name] = upstream_changed(source.url, state.get(source.name))
+        except requests.RequestException as e:
+            print(f'Checking {source.name} failed: {e}')
+            continue
+
+        if is_changed:
+            changed.append(source)
+
+    return changed
+
+
+def poll(sources, state, interval, timeout, sleep=time.sleep):
+    """
+    Checks sources every interval seconds until one of them changed or timeout seconds passed, returns the changed
+    sources
+    """
+    deadline = time.monotonic() + timeout
+
+    while True:
+        changed = check(sources, state)
+        if changed or time.monotonic() + interval > deadline:
+            return changed
+
+        sleep(interval)
+
+
+def refresh(country, force=False):
+    """
+    Recomputes the expired datasets of a country and their rollups, or all of them with force, returns the seconds
+    per dataset
+    """
+    from poopsdontlie.api.countries import get_all_region_data_funcs_for_country
+    from poopsdontlie.helpers.rollup import has_rollups, precompute
+
+    timings = {}
+    with refreshing(force), memoized():
+        for name, func in get_all_region_data_funcs_for_country(country):
+            start = time.perf_counter()
+            func()
+            if has_rollups(func):
+                precompute(func)
+            timings[name] = time.perf_counter() - start
+
+    # the refreshed entries are final, also when the confidence intervals were computed in the background
+    background.wait()
+
+    return timings
+
+
+def print_timings(country, timings):
+    for name, seconds in timings.items():
+        print(f'{country} {name:<56} {seconds:8.2f}s')
+
+
+def run(countries, interval=300, timeout=6 * 3600, sleep=time.sleep):
+    """
+    Refresh the datasets of countries forever, see the module docstring
+    """
+    sources = upstream_sources(countries)
+    state = load_state()
+
+    # warm the cache and take the validators that the polls compare against
+    for country in countries:
+        print_timings(country, refresh(country))
+    check(sources, state)
+    save_state(state)
+
+    while True:
+        wake, due = next_update(sources)
+        if wake is None:
+            print('No upstream source has an update time')
+            return
+
+        print(f'Next update at {wake.tz_convert(None)} UTC: {", ".join(source.name for source in due)}')
+        sleep(max(0., (wake - pd.Timestamp.utcnow()).total_seconds()))
+
+        changed = poll(due, state, interval, timeout, sleep)
+        save_state(state)
+
+        if not changed:
+            print(f'No new data within {timeout} seconds, the datasets are refreshed at the next update')
+            continue
+
+        for country in sorted({source.country for source in changed}):
+            print(f'New data for {country}: {", ".join(source.name for source in changed if source.country == country)}')
+            print_timings(country, refresh(country, force=True))
@@ -1,8 +1,108 @@
+import hashlib
+import json
 import pickle
 import pandas as pd
 
 from poopsdontlie import list_countries, get_all_region_data_funcs_for_country
-from poopsdontlie.helpers.cache import get_func_invalidate_after
+from poopsdontlie.helpers.cache import get_func_invalidate_after, fingerprint, partition_by_month
+
+
+def _write_partitions(countrydir, name, df_r, date_column, old_partitions):
+    """
+    Write the monthly partitions of df_r to countrydir/name/YYYY-MM.csv, partitions of which the fingerprint did not
+    change are left untouched so clients only download the months that changed
+    """
+    partdir = countrydir / name
+    partdir.mkdir(exist_ok=True)
+
+    partitions = {}
+    written = 0
+    for month, part in partition_by_month(df_r, date_column).items():
+        partfile = partdir / f'{month}.csv'
+        part_fingerprint = fingerprint(part, index=False)
+
+        if old_partitions.get(month, {}).get('fingerprint') != part_fingerprint or not partfile.is_file():
+            part.to_csv(partfile, index=False)
+            written += 1
+
+        partitions[month] = {
+            'fingerprint': part_fingerprint,
+            'rows': part.shape[0],
+            'file': f'{name}/{month}.csv',
+        }
+
+    for partfile in partdir.glob('*.csv'):
+        if partfile.stem not in partitions:
+            partfile.unlink()
+
+    return partitions, written
+
+
+# number of deltas after which a new base snapshot is started
+_MAX_DELTA_CHAIN = 31
+
+# a delta that contains more than this fraction of the rows starts a new base snapshot instead
+_MAX_DELTA_FRACTION = .5
+
+
+def _write_delta(countrydir, name, old_lines, new_lines, old_deltas):
+    """
+    Write the rows of the csv new_lines that differ from the previously published old_lines as a delta to
+    countrydir/name/deltas/<version>.csv, returns the delta manifest of the dataset
+
+    A delta keeps the first keep_rows rows of the previous version and appends its own rows, which fits data of which
+    only the last days change. The complete csv is the snapshot of the current version, a new base starts when the
+    chain gets too long, the header changed or the delta is too large.
+    """
+    if old_deltas and old_lines == new_lines:
+        return old_deltas
+
+    deltadir = countrydir / name / 'deltas'
+    deltadir.mkdir(exist_ok=True, parents=True)
+
+    version = old_deltas['version'] + 1 if old_deltas else 1
+    n_rows = len(new_lines) - 1
+    manifest = {'base_version': version, 'version': version, 'rows': n_rows, 'chain': []}
+
+    if old_deltas and old_lines and old_lines[0] == new_lines[0] and len(old_deltas['chain']) < _MAX_DELTA_CHAIN:
+        old_rows, new_rows = old_lines[1:], new_lines[1:]
+        keep_rows = next((i for i, (a, b) in enumerate(zip(old_rows, new_rows)) if a != b), min(len(old_rows), len(new_rows)))
+        delta_rows = new_rows[keep_rows:]
+
+        if len(delta_rows) <= _MAX_DELTA_FRACTION * n_rows:
+            with open(deltadir / f'{version}.csv', 'w', newline='') as fh:
+                fh.write('\n'.join([new_lines[0], *delta_rows]) + '\n')
+
+            manifest['base_version'] = old_deltas['base_version']
+            manifest['chain'] = [*old_deltas['chain'], {
+                'version': version,
+                'file': f'{name}/deltas/{version}.csv',
+                'keep_rows': keep_rows,
+                'rows': len(delta_rows),
+            }]
+
+    chain_files = {d['file'].rsplit('/', 1)[1] for d in manifest['chain']}
+    for deltafile in deltadir.glob('*.csv'):
+        if deltafile.name not in chain_files:
+            deltafile.unlink()
+
+    return manifest
+
+
+def _manifest_entry(name, meta):
+    """
+    The entry of a dataset in the manifest of its country, everything a client needs to decide what to download
+    """
+    return {
+        'file': f'{name}.csv',
+        'fingerprint': meta['fingerprint'],
+        'size': meta['size'],
+        'invalidate_after': None if meta['invalidate_after'] is None else pd.Timestamp(meta['invalidate_after']).isoformat(),
+        'schema': {str(col): str(dtype) for col, dtype in meta['dtypes'].items()},
+        'date_column': meta.get('date_column'),
+        'partitions': meta.get('partitions'),
+        'deltas': meta.get('deltas'),
+    }
 
 
 def cache_gen(outdir, force_all=False):
@@ -15,31 +115,64 @@ def cache_gen(outdir, force_all=False):
         countrydir = outdir / iso.upper()
         countrydir.mkdir(exist_ok=True, parents=True)
         nowutc = pd.Timestamp.utcnow()
+        manifest = {'generated': nowutc.isoformat(), 'datasets': {}}
+
         for name, func in get_all_region_data_funcs_for_country(iso):
             metafile = countrydir / f'{name}.meta'
 
-            if not force_all and metafile.is_file():
+            old_meta = {}
+            if metafile.is_file():
                 with open(metafile, 'rb') as fh:
                     print(f'Opening existing meta-file {metafile.name}')
-                    meta = pickle.load(fh)
+                    old_meta = pickle.load(fh)
 
-                    if meta['invalidate_after'] > nowutc:
-                        summary += f'{name} invalidates after {meta["invalidate_after"]} (no change)\n'
-                        continue
+                # meta files written before the manifest existed have no content hash, those datasets are regenerated
+                if not force_all and 'fingerprint' in old_meta \
+                        and (old_meta['invalidate_after'] is None or old_meta['invalidate_after'] > nowutc):
+                    manifest['datasets'][name] = _manifest_entry(name, old_meta)
+                    summary += f'{name} invalidates after {old_meta["invalidate_after"]} (no change)\n'
+                    continue
 
             df = func()
 
             df_r = df.reset_index()
-            df_r.to_csv(countrydir / f'{name}.csv', index=False)
-            with open(metafile, 'wb') as fh:
-                meta = {
-                    'dtypes': df_r.dtypes.to_dict(),
-                    'invalidate_after': get_func_invalidate_after(name),
-                }
+            csv_file = countrydir / f'{name}.csv'
+            csv_text = df_r.to_csv(index=False)
 
+            csv_bytes = csv_text.encode()
+
+            meta = {
+                'dtypes': df_r.dtypes.to_dict(),
+                'invalidate_after': get_func_invalidate_after(name),
+                'fingerprint': hashlib.sha256(csv_bytes).hexdigest(),
+                'size': len(csv_bytes),
+            }
+
+            old_lines = csv_file.read_text().splitlines() if csv_file.is_file() else None
+            meta['deltas'] = _write_delta(countrydir, name, old_lines, csv_text.splitlines(), old_meta.get('deltas'))
+            if meta['deltas']['chain'] and meta['deltas']['chain'][-1]['version'] == meta['deltas']['version']:
+                summary += f'{name}: published version {meta["deltas"]["version"]} as delta of {meta["deltas"]["chain"][-1]["rows"]} rows\n'
+
+            # the complete csv is the snapshot of the current version, and is kept for clients that do not support
+            # partitions or deltas
+            with open(csv_file, 'wb') as fh:
+                fh.write(csv_bytes)
+
+            if isinstance(df.index, pd.DatetimeIndex):
+                meta['date_column'] = df_r.columns[0]
+                meta['partitions'], written = _write_partitions(countrydir, name, df_r, meta['date_column'], old_meta.get('partitions', {}))
+                summary += f'{name}: {written} of {len(meta["partitions"])} monthly partitions changed\n'
+
+            with open(metafile, 'wb') as fh:
                 pickle.dump(meta, fh, 4)  # format 4 is compatible with all python versions supported by this package
 
-                summary += f'{name} invalidates after {meta["invalidate_after"]}\n'
+            manifest['datasets'][name] = _manifest_entry(name, meta)
+            summary += f'{name} invalidates after {meta["invalidate_after"]}\n'
+
+        # clients download the manifest once instead of the meta file of every dataset
+        with open(countrydir / 'manifest.json', 'w') as fh:
+            json.dump(manifest, fh, indent=1)
+
         summary += '\n'
 
     print(f'\n\n-------\n\nSUMMARY\n\n-------\n\n{summary}')
@@ -0,0 +1,179 @@
+"""
+Weekly and monthly rollups of the region datasets
+
+Long-range views do not need every daily point. A rollup aggregates the values of a dataset per week (starting on
+Monday) or per calendar month, labelled with the first day of the period: the value columns by their mean or median,
+the CI columns of the smoothed datasets by their envelope (the lowest bottom and the highest top bound).
+
+Rollups are cached alongside the dataset they are computed from, the refresh command precomputes them. fit() picks
+the resolution for a requested number of points.
+"""
+import pandas as pd
+
+from poopsdontlie.helpers.cache import cached_results, _invalidate_registry
+from poopsdontlie.helpers.layout import ci_bound, is_long
+from poopsdontlie.helpers.lazy import LazyFunction
+
+
+# resample rules per resolution, periods are labelled with their first day
+resolutions = {
+    'W': {'rule': 'W-MON', 'closed': 'left', 'label': 'left'},
+    'M': {'rule': 'MS'},
+}
+
+hows = ('mean', 'median')
+
+_rollup_funcs = {}
+
+
+def rollup(df, resolution, how='mean'):
+    """
+    Aggregates df, in the wide or the long layout, per week (resolution W) or per month (M)
+    """
+    if resolution not in resolutions:
+        raise ValueError(f'Resolution {resolution} invalid, choose one of: {", ".join(resolutions)}')
+
+    if how not in hows:
+        raise ValueError(f'Aggregation {how} invalid, choose one of: {", ".join(hows)}')
+
+    if is_long(df):
+        grouper = pd.Grouper(level=df.index.name, freq=resolutions[resolution]['rule'], **_grouper_kw(resolution))
+        agg = {c: {'ci_bottom': 'min', 'ci_top': 'max'}.get(c, how) for c in df.columns if c != 'region_code'}
+        df_rollup = df.groupby([grouper, 'region_code']).agg(agg).reset_index(level='region_code').dropna(subset=['value'])
+    else:
+        resampled = df.resample(**resolutions[resolution])
+        bounds = {c: ci_bound(str(c)) for c in df.columns}
+
+        parts = [
+            getattr(resampled[[c for c, bound in bounds.items() if bound is None]], how)(),
+            resampled[[c for c, bound in bounds.items() if bound == 'bottom']].min(),
+            resampled[[c for c, bound in bounds.items() if bound == 'top']].max(),
+        ]
+        df_rollup = pd.concat(parts, axis=1)[df.columns]
+
+    # a rollup of a dataset without final CIs is not final either
+    df_rollup.attrs = dict(df.attrs)
+
+    return df_rollup
+
+
+def _grouper_kw(resolution):
+    return {k: v for k, v in resolutions[resolution].items() if k != 'rule'}
+
+
+def _resolve(func):
+    return func.resolve() if isinstance(func, LazyFunction) else func
+
+
+def has_rollups(func):
+    """
+    Whether func is a region dataset that has rollups, the datasets that are cached with rollups=True
+    """
+    # the registry has the undecorated dataset functions
+    entry = _invalidate_registry.get(getattr(_resolve(func), '__wrapped__', None))
+
+    return entry is not None and entry.get('rollups', False)
+
+
+def rollup_func(func):
+    """
+    Returns the cached rollups of the dataset func as a function of resolution, how, layout and columns, only the
+    rollups of the whole wide dataset are cached
+    """
+    func = _resolve(func)
+
+    if func not in _rollup_funcs:
+        # the registry has the undecorated dataset functions
+        entry = _invalidate_registry[func.__wrapped__]
+
+        def dataset_rollup(resolution, how='mean', layout=None, columns=None):
+            # the long layout is converted from the wide rollup by cached_results, like the layout of the dataset
+            kwargs = {'columns': columns} if columns is not None else {}
+
+            return rollup(func(**kwargs), resolution, how)
+
+        dataset_rollup.__name__ = f'{func.__name__}_rollup'
+        dataset_rollup.__module__ = func.__module__
+
+        _rollup_funcs[func] = cached_results(
+            key=f'{entry["key"]}_rollup',
+            invalidate_after=entry['invalidate_after'],
+            cache_level=entry['cache_level'],
+            bypass_if=('columns',),
+            vary_on=('resolution', 'how'),
+            to_long=entry['to_long'],
+        )(dataset_rollup)
+
+    return _rollup_funcs[func]
+
+
+def precompute(func):
+    """
+    Computes and caches the weekly and monthly rollups of the dataset func
+    """
+    for resolution in resolutions:
+        for how in hows:
+            rollup_func(func)(resolution=resolution, how=how)
+
+
+def _points(df):
+    return df.index.nunique()
+
+
+def fit_frame(df, max_points, how='mean'):
+    """
+    Returns df, or its weekly or monthly rollup, at the finest resolution that has no more than max_points dates, the
+    monthly rollup when even that has more
+    """
+    if how not in hows:
+        raise ValueError(f'Aggregation {how} invalid, choose one of: {", ".join(hows)}')
+
+    if _points(df) <= max_points:
+        return df
+
+    for resolution in resolutions:
+        df_rollup = rollup(df, resolution, how)
+        if _points(df_rollup) <= max_points:
+            break
+
+    return df_rollup
+
+
+def between(df, start, end):
+    """
+    Returns the dates of df from start to end, inclusive, either can be None
+    """
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+
+    return df.loc[start:end]
+
+
+def fit(func, max_points, how='mean', layout=None, columns=None, start=None, end=None):
+    """
+    Returns the dataset func at the finest resolution, daily, weekly or monthly, that has no more than max_points
+    dates, the monthly rollup when even that has more. With start and/or end only the dates between them (inclusive)
+    are returned and the resolution is picked for those
+    """
+    if how not in hows:
+        raise ValueError(f'Aggregation {how} invalid, choose one of: {", ".join(hows)}')
+
+    kwargs = {'layout': layout} if layout is not None else {}
+    if columns is not None:
+        kwargs['columns'] = columns
+
+    df = func(**kwargs)
+    if start is not None or end is not None:
+        # the cached rollups cover the whole dataset, the weeks and months at the edges of a window only aggregate
+        # the dates in it
+        return fit_frame(between(df, start, end), max_points, how)
+
+    if _points(df) <= max_points:
+        return df
+
+    for resolution in resolutions:
+        df = rollup_func(func)(resolution=resolution, how=how, **kwargs)
+        if _points(df) <= max_points:
+            break
+
+    return df
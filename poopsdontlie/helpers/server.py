@@ -0,0 +1,285 @@
+"""
+Read-only HTTP server for the datasets
+
+    GET /countries                              {iso: name} of the supported countries
+    GET /countries/<country>/regions            the regions of a country as listed by the regions command
+    GET /countries/<country>/regions/<region>   the dataset of a region, with the query parameters:
+
+        format      csv (default), json or ndjson
+        layout      wide (default) or long
+        columns     comma separated column names or region codes
+        start, end  first and last date, inclusive
+        max_points  weekly or monthly rollups when the daily data has more dates than this, the ones precomputed by
+                    the refresh command unless start or end is given
+        how         aggregation of the rollups, mean (default) or median
+
+Responses are serialized once and kept in memory along with a gzip compressed copy. They are sent with an ETag, a
+client that sends it back in If-None-Match gets a 304 without a body. Datasets are reloaded from the cache every
+max_age seconds, run the refresh command next to the server (with serve_stale set) to keep the cache fresh.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+import urllib.parse
+
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from poopsdontlie.api.countries import list_countries, list_country_regions, is_valid_region, get_region_data_for_country, \
+    expand_regions, region_has_rollups, get_region_rollup_for_country
+from poopsdontlie.helpers.cache import fingerprint
+from poopsdontlie.helpers.columns import select_regions
+from poopsdontlie.helpers.export import serialize, text_formats
+from poopsdontlie.helpers.layout import check_layout
+from poopsdontlie.helpers.rollup import between, fit_frame, hows, resolutions
+
+
+logger = logging.getLogger(__name__)
+
+_content_types = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _etag(*parts):
+    return '"' + hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:32] + '"'
+
+
+class NotFound(Exception):
+    """
+    The requested country, region or path does not exist, answered with a 404
+    """
+
+
+class DataStore:
+    """
+    The datasets and serialized responses of the server, shared by its request threads
+    """
+
+    def __init__(self, max_age=60, max_responses=256):
+        self.max_age = max_age
+        self.max_responses = max_responses
+
+        self._datasets = {}
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+        self._dataset_locks = {}
+
+    def _dataset_lock(self, key):
+        with self._lock:
+            return self._dataset_locks.setdefault(key, threading.Lock())
+
+    def _load(self, key, load):
+        # one thread (re)loads a dataset, the others that need it wait for the result
+        with self._dataset_lock(key):
+            entry = self._datasets.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.max_age:
+                df = load()
+                entry = (df, fingerprint(df)[:16], time.monotonic())
+                self._datasets[key] = entry
+
+        return entry[0], entry[1]
+
+    def dataset(self, country, region, layout):
+        """
+        Returns the dataset and a version that changes when its content changes
+        """
+        return self._load((country, region.lower(), layout), lambda: get_region_data_for_country(country, region, layout=layout))
+
+    def rollup(self, country, region, layout, resolution, how):
+        """
+        Returns the rollup of a dataset that the refresh command precomputed and its version
+        """
+        return self._load(
+            (country, region.lower(), layout, resolution, how),
+            lambda: get_region_rollup_for_country(country, region, resolution, how, layout),
+        )
+
+    def _fit(self, country, region, layout, max_points, how):
+        # the dataset or its first rollup that has no more than max_points dates, the monthly one when even that has more
+        df, version = self.dataset(country, region, layout)
+        for resolution in resolutions:
+            if df.index.nunique() <= max_points:
+                break
+
+            df, version = self.rollup(country, region, layout, resolution, how)
+
+        return df, version
+
+    def _response(self, etag, content_type, build, if_none_match):
+        if if_none_match is not None and etag in if_none_match:
+            return etag, content_type, None, None
+
+        with self._lock:
+            cached = self._responses.get(etag)
+            if cached is not None:
+                self._responses.move_to_end(etag)
+                return cached
+
+        body = build().encode()
+        response = (etag, content_type, body, gzip.compress(body, compresslevel=6))
+
+        with self._lock:
+            self._responses[etag] = response
+            while len(self._responses) > self.max_responses:
+                self._responses.popitem(last=False)
+
+        return response
+
+    def countries(self, if_none_match=None):
+        countries = {iso: country.name for iso, country in list_countries().items()}
+
+        return self._response(_etag('countries', countries), _content_types['json'], lambda: json.dumps(countries), if_none_match)
+
+    def regions(self, country, if_none_match=None):
+        regions = list_country_regions(_country(country))
+
+        return self._response(_etag('regions', regions), _content_types['json'], lambda: json.dumps(regions), if_none_match)
+
+    def region(self, country, region, query, if_none_match=None):
+        """
+        Returns (etag, content type, body, gzip compressed body) of a dataset, the bodies are None when the client
+        has the response already
+        """
+        country = _country(country)
+        if not is_valid_region(country, region):
+            raise NotFound(f'Region {region} does not exist')
+
+        format = query.get('format', 'csv')
+        if format not in text_formats:
+            raise ValueError(f'Format {format} invalid, choose one of: {", ".join(text_formats)}')
+
+        layout = check_layout(query.get('layout'))
+        columns = query['columns'].split(',') if query.get('columns') else None
+        start, end = query.get('start'), query.get('end')
+        max_points = _positive_int('max_points', query.get('max_points'))
+        how = query.get('how', 'mean')
+        if how not in hows:
+            raise ValueError(f'Aggregation {how} invalid, choose one of: {", ".join(hows)}')
+
+        # a window is rolled up from its own dates, like datasets without rollups
+        precomputed = max_points is not None and start is None and end is None and region_has_rollups(country, region)
+        if precomputed:
+            df, version = self._fit(country, region, layout, max_points, how)
+        else:
+            df, version = self.dataset(country, region, layout)
+
+        def build():
+            # the body is built from the same frame as the version in its etag
+            selected = between(select_regions(df, columns), start, end)
+            if max_points is not None and not precomputed:
+                selected = fit_frame(selected, max_points, how)
+
+            return serialize(selected, format)
+
+        etag = _etag(version, country, region.lower(), layout, format, columns, start, end, max_points, how)
+
+        return self._response(etag, _content_types[format], build, if_none_match)
+
+    def warm(self, countries=None):
+        """
+        Loads every dataset and serializes its default response
+        """
+        for country in countries or list_countries().keys():
+            for region in expand_regions(country, 'all'):
+                start = time.perf_counter()
+                self.region(country, region, {})
+                print(f'Loaded {country} {region} in {time.perf_counter() - start:.2f}s')
+
+
+def _positive_int(name, value):
+    if value is None:
+        return None
+
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError(f'{name}={value} invalid, use a positive number')
+
+    return int(value)
+
+
+def _country(country):
+    country = country.upper()
+    if country not in list_countries():
+        raise NotFound(f'Country {country} does not exist')
+
+    return country
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'poopsdontlie'
+    # keep connections open between requests
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, with Nagle's algorithm the body waits for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = [urllib.parse.unquote(p) for p in url.path.split('/') if p]
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        if_none_match = self.headers.get('If-None-Match')
+        store = self.server.store
+
+        try:
+            if parts == ['countries']:
+                response = store.countries(if_none_match)
+            elif len(parts) == 3 and parts[0] == 'countries' and parts[2] == 'regions':
+                response = store.regions(parts[1], if_none_match)
+            elif len(parts) == 4 and parts[0] == 'countries' and parts[2] == 'regions':
+                response = store.region(parts[1], parts[3], query, if_none_match)
+            else:
+                raise NotFound(f'{url.path} does not exist')
+        except NotFound as e:
+            return self._send_error(HTTPStatus.NOT_FOUND, e)
+        except ValueError as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, e)
+        except Exception:
+            logger.exception(f'GET {self.path} failed')
+            return self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, 'Internal server error')
+
+        self._send(*response)
+
+    def _send(self, etag, content_type, body, gzip_body):
+        if body is None:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip_body
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Encoding', 'gzip')
+        else:
+            self.send_response(HTTPStatus.OK)
+
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, error):
+        body = json.dumps({'error': str(error)}).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', _content_types['json'])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f'{self.address_string()} {format % args}')
+
+
+def make_server(host='127.0.0.1', port=8000, store=None):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.store = store or DataStore()
+
+    return server
@@ -0,0 +1,134 @@
+"""
+Read-only inputs shared with joblib workers
+
+Inputs that every task of a parallel stage needs are written once per run with joblib.dump and workers get a small
+SharedHandle instead of a pickled copy per task. Workers load a handle once per process, numpy arrays (including the
+blocks of a DataFrame) are memory-mapped read-only so they are not copied.
+
+    with shared_inputs(executor) as shared:
+        handle = shared.put(df)
+        executor.run(delayed(worker)(chunk, handle) for chunk in chunks)
+
+    def worker(chunk, handle):
+        df = resolve(handle)
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+from collections import OrderedDict
+from pathlib import Path
+
+
+# number of loaded inputs that are kept per worker process
+_MEMO_SIZE = 8
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _shared_dir():
+    # prefer a memory backed filesystem, like joblib does for its automatic memmapping
+    shm = Path('/dev/shm')
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+
+    return None
+
+
+def pickled_size(obj):
+    """
+    Bytes that are sent to a worker when obj is passed as task argument
+    """
+    return len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class SharedHandle:
+    def __init__(self, path, obj=None, inline=False):
+        self.path = None if path is None else str(path)
+        # the process that created the handle uses the object directly, it is only pickled for inline handles
+        self._obj = obj
+        self._inline = inline
+
+    def __getstate__(self):
+        return {'path': self.path, '_obj': self._obj if self._inline else None, '_inline': self._inline}
+
+    def load(self):
+        if self._obj is not None:
+            return self._obj
+
+        with _memo_lock:
+            if self.path in _memo:
+                _memo.move_to_end(self.path)
+                return _memo[self.path]
+
+        import joblib
+        obj = joblib.load(self.path, mmap_mode='r')
+
+        with _memo_lock:
+            _memo[self.path] = obj
+            while len(_memo) > _MEMO_SIZE:
+                _memo.popitem(last=False)
+
+        return obj
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r})'
+
+
+def resolve(obj):
+    """
+    Returns the shared object for a SharedHandle, any other object is returned as is
+    """
+    if isinstance(obj, SharedHandle):
+        return obj.load()
+
+    return obj
+
+
+class SharedInputs:
+    """
+    Context manager that owns the files of shared inputs for one run and removes them afterwards
+
+    With inline=True no files are written and handles carry the object itself, for workers on other machines.
+    """
+
+    def __init__(self, inline=False):
+        self._dir = None
+        self._count = 0
+        self._inline = inline
+        self.nbytes = 0
+
+    def __enter__(self):
+        if not self._inline:
+            self._dir = Path(tempfile.mkdtemp(prefix='poopsdontlie-shared-', dir=_shared_dir()))
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # on windows files that are still mapped by a worker can not be removed, the os cleans them up later
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+    def put(self, obj):
+        if self._inline:
+            return SharedHandle(None, obj, inline=True)
+
+        import joblib
+
+        path = self._dir / f'{self._count}.pkl'
+        self._count += 1
+
+        joblib.dump(obj, path, protocol=pickle.HIGHEST_PROTOCOL)
+        self.nbytes += path.stat().st_size
+
+        return SharedHandle(path, obj)
+
+
+def shared_inputs(executor):
+    """
+    SharedInputs for the workers of an executor, files are only used when the workers can read them
+    """
+    return SharedInputs(inline=not executor.shares_filesystem)
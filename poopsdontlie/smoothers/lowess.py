@@ -1,20 +1,33 @@
+import itertools
 import random
-#import warnings
+import warnings
 
 import pandas as pd
 import statsmodels.api as sm
 import numpy as np
 import scipy.stats as st
 
-from joblib import Parallel, delayed
+from joblib import delayed
 from tqdm.auto import tqdm
-from poopsdontlie.helpers import config
-from poopsdontlie.helpers.joblib import tqdm_joblib
+from poopsdontlie.helpers import config, planner
+from poopsdontlie.helpers.executor import get_executor
+from poopsdontlie.helpers.profiling import profiled, stage
+from poopsdontlie.helpers.shared import shared_inputs, resolve
+
+
+# memory budget for the block of resampled columns that is gathered at once in _lowess_worker_column_median
+_MEDIAN_BLOCK_BYTES = 64 * 2 ** 20
+
+# bootstrap iterations that run in-process to measure the cost per iteration before the work is planned
+_BOOTSTRAP_PROBE_ITERS = 2
+
+# default of bootstrap_tol, None is a valid value that turns the tolerance of the config off
+_from_config = object()
 
 
 def _lowess_on_df(resampled, lowess_kw):
     x = list(range(resampled.shape[0]))
-    y = resampled.values.astype(float)
+    y = resampled.astype(float) if isinstance(resampled, np.ndarray) else resampled.values.astype(float)
 
     eval_x = x.copy()
 
@@ -33,21 +46,93 @@ def _lowess_worker_with_func_resampler(iters, df, func, lowess_kw):
     return retvals
 
 
-def _merge_lowess_worker_results(index, retvals, n_jobs):
-    print('Merging lowess worker results')
+def _lowess_worker_for_col(iters, shared_df, col, idx_start, idx_end, func, lowess_kw):
+    df_sel = resolve(shared_df)[col].loc[idx_start:idx_end]
+
+    return _lowess_worker_with_func_resampler(iters, df_sel, func, lowess_kw)
+
+
+def _lowess_worker_column_median(iters, values, lowess_kw):
+    """
+    Bootstrap the median over columns: resample the columns of the 2d float array values (NaN for missing) with
+    replacement and smooth the NaN-aware median of every resample
+
+    Iterations are drawn in batches, a batch gathers a (rows, batch, columns) block so its size is bounded by
+    _MEDIAN_BLOCK_BYTES.
+    """
+    values = resolve(values)
+    rng = np.random.default_rng()
+    n_rows, n_cols = values.shape
+    batch_size = max(1, _MEDIAN_BLOCK_BYTES // max(1, n_rows * n_cols * values.itemsize))
+
+    retvals = []
+    for start in range(0, iters, batch_size):
+        idx = rng.integers(0, n_cols, size=(min(batch_size, iters - start), n_cols))
+
+        with warnings.catch_warnings():
+            # rows without any measurement in a resample result in NaN
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            medians = np.nanmedian(values[:, idx], axis=2)
+
+        for i in range(medians.shape[1]):
+            retvals.append(_lowess_on_df(medians[:, i], lowess_kw))
+
+    return retvals
+
+
+def _ci_change(old_std, new_std):
+    # the CI bounds are loc +/- z * std, so the largest change of a bound relative to the mean CI width is
+    # max(|new_std - old_std|) / (2 * mean(new_std)), independent of the confidence level
+    width = 2 * np.nanmean(new_std)
+    if not width > 0:
+        return 0.
+
+    return np.nanmax(np.abs(new_std - old_std)) / width
+
 
-    l = len(retvals)
-    merge_lambda = lambda retval, prefix: pd.DataFrame(retval).T.add_prefix(prefix)
+def _bootstrap_lowess_std(stage_name, worker, worker_args, bootstrap_iters, tol=None, batch_size=None, size=1):
+    """
+    Bootstrap a lowess smoothing, returns the stddev per datapoint and the number of iterations used
+
+    worker(iters, *worker_args) runs iters bootstrap iterations and returns a list with the smoothed result of each.
+    The planner splits the iterations over the workers based on the cost per iteration of stage_name for data of
+    size.
+
+    Without tol all bootstrap_iters iterations are run at once. With tol the iterations are run in batches of
+    batch_size and stop as soon as the CI bounds change less than tol (relative to the mean CI width) between two
+    batches, bootstrap_iters is the maximum number of iterations.
+    """
+    if tol is None:
+        batch_size = bootstrap_iters
+    elif batch_size is None:
+        batch_size = config['bootstrap_batch_size']
+
+    samples = []
+    std = None
+    while len(samples) < bootstrap_iters:
+        iters = min(batch_size, bootstrap_iters - len(samples))
+
+        if not planner.has_cost(stage_name):
+            # measure the cost per iteration on a probe in this process
+            probe = min(iters, _BOOTSTRAP_PROBE_ITERS)
+            with planner.measure(stage_name, n_items=probe, size=size):
+                samples.extend(worker(probe, *worker_args))
+            iters -= probe
+
+        plan = planner.plan(stage_name, n_items=iters, size=size)
+        with planner.measure_plan(stage_name, plan, size=size):
+            retvals = plan.executor().run(
+                (delayed(worker)(chunk, *worker_args) for chunk in plan.chunks),
+                n_jobs=plan.n_jobs, progress=tqdm(total=len(plan.chunks), unit=' bootstrap resampling tasks finished', leave=False),
+            )
 
-    with tqdm_joblib(tqdm(total=l, unit=' merge workers finished', leave=False)) as progress_bar:
-        dfs = Parallel(n_jobs=n_jobs)(
-            delayed(merge_lambda)(retvals[i], f'{i}_') for i in range(l)
-        )
+        samples.extend(itertools.chain.from_iterable(retvals))
 
-    df = pd.concat(dfs, axis=1)
-    df.index = index
+        prev_std, std = std, np.nanstd(np.vstack(samples), axis=0, ddof=1)
+        if tol is not None and prev_std is not None and _ci_change(prev_std, std) < tol:
+            break
 
-    return df.copy()
+    return std, len(samples)
 
 
 def _bootstrap_quantiles(df_results, conf_interval, bottom_col, top_col):
@@ -72,6 +157,7 @@ def _quantile_resampling(df, q=.5, iters=10, replace=True):
     return df_res.quantile(q, axis=1).T
 
 
+@profiled()
 def _bootstrap_ci_from_std(index, bootstrap_metric_std, test_metric, bottom_col, top_col, alpha=0.95):
     """
     Function to calculate confidence interval for bootstrapped samples.
@@ -99,7 +185,22 @@ def _bootstrap_ci_from_std(index, bootstrap_metric_std, test_metric, bottom_col,
     return df_res
 
 
-def lowess_from_median(df, bootstrap_iters=config['bootstrap_iters'], conf_interval=0.95, lowess_kw=None, clip_to_zero=True):
+@profiled()
+def lowess_from_median(df, bootstrap_iters=None, conf_interval=0.95, lowess_kw=None, clip_to_zero=True, bootstrap_tol=_from_config, ci=True):
+    """
+    Lowess regression on the median of all columns with a confidence interval by bootstrap resampling the columns
+
+    With bootstrap_tol (or the bootstrap_tol config key) set, bootstrapping stops early once the CI converges and
+    bootstrap_iters is the maximum, bootstrap_tol=None always runs bootstrap_iters. The iterations used are reported
+    in df.attrs['bootstrap_iters']. With ci=False the bootstrap is skipped and the CI columns are NaN,
+    df.attrs['ci_final'] tells which of the two it is.
+    """
+    if bootstrap_iters is None:
+        bootstrap_iters = config['bootstrap_iters']
+
+    if bootstrap_tol is _from_config:
+        bootstrap_tol = config['bootstrap_tol']
+
     if lowess_kw is None:
         lowess_kw = {}
 
@@ -107,32 +208,31 @@ def lowess_from_median(df, bootstrap_iters=config['bootstrap_iters'], conf_inter
         frac = np.float64(1) / ((df.index[-1] - df.index[0]) / np.timedelta64(3, 'W'))
         lowess_kw['frac'] = frac
 
-    # use resampling with replacement and calculate the median (quantile=.5)
-    resample_lambda = lambda df_l: df_l.sample(frac=1, replace=True, axis=1).quantile(.5, axis=1)
+    # resample the columns with replacement and calculate the median, on a float array with NaN for missing values
+    values = df.to_numpy(dtype=float, na_value=np.nan)
 
-    n_jobs = config['n_jobs']
-    remainder = bootstrap_iters % n_jobs
-    extra_jobs_mod = n_jobs // remainder
-    itersize = bootstrap_iters // n_jobs
-
-    iters = [itersize + (x % extra_jobs_mod == 0) for x in range(n_jobs)]
-
-    with tqdm_joblib(tqdm(total=n_jobs, unit=' bootstrap resampling workers finished', leave=False)) as progress_bar:
-        retvals = Parallel(n_jobs=n_jobs)(
-            delayed(_lowess_worker_with_func_resampler)(iters[i], df, resample_lambda, lowess_kw) for i in range(n_jobs)
-        )
+    if ci:
+        with shared_inputs(get_executor()) as shared, \
+                stage('lowess_from_median.bootstrap', df, bootstrap_iters=bootstrap_iters, bootstrap_tol=bootstrap_tol) as s:
+            worker_args = (shared.put(values), lowess_kw)
+            bootstrap_std, iters_used = _bootstrap_lowess_std(
+                'lowess_from_median.bootstrap', _lowess_worker_column_median, worker_args, bootstrap_iters, bootstrap_tol, size=values.size
+            )
+            s.set(iterations_used=iters_used)
+    else:
+        bootstrap_std, iters_used = np.full(values.shape[0], np.nan), 0
 
     # calculate the median
-    median = _lowess_on_df(df.quantile(.5, axis=1), lowess_kw)
-
-    df_results = _merge_lowess_worker_results(df.index, retvals, n_jobs)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        median = _lowess_on_df(np.nanmedian(values, axis=1), lowess_kw)
 
     colnames = {
         'bottom_col': f'median_{conf_interval * 100:0.0f}_perc_ci_bottom',
         'top_col': f'median_{conf_interval * 100:0.0f}_perc_ci_top',
     }
 
-    df_results = _bootstrap_ci_from_std(df_results.index, df_results.std(axis=1).values, median, alpha=conf_interval, **colnames)
+    df_results = _bootstrap_ci_from_std(df.index, bootstrap_std, median, alpha=conf_interval, **colnames)
 
     df_results['median'] = median
 
@@ -140,14 +240,29 @@ def lowess_from_median(df, bootstrap_iters=config['bootstrap_iters'], conf_inter
         # clip negative values to 0
         df_results[df_results < 0] = 0
 
+    df_results.attrs['bootstrap_iters'] = {'median': iters_used}
+    df_results.attrs['ci_final'] = ci
+
     return df_results
 
 
-def lowess_per_col(df, columns, bootstrap_iters=config['bootstrap_iters'], conf_interval=0.95, lowess_kw=None, clip_to_zero=True):
+@profiled()
+def lowess_per_col(df, columns, bootstrap_iters=None, conf_interval=0.95, lowess_kw=None, clip_to_zero=True, bootstrap_tol=_from_config, ci=True):
     """
     Perform Lowess regression and determine a confidence interval by bootstrap resampling
+
+    With bootstrap_tol (or the bootstrap_tol config key) set, bootstrapping stops early per column once its CI
+    converges and bootstrap_iters is the maximum, bootstrap_tol=None always runs bootstrap_iters. The iterations used
+    per column are reported in df.attrs['bootstrap_iters']. With ci=False only the lowess curves are computed and the
+    CI columns are NaN, df.attrs['ci_final'] tells which of the two it is.
     """
 
+    if bootstrap_iters is None:
+        bootstrap_iters = config['bootstrap_iters']
+
+    if bootstrap_tol is _from_config:
+        bootstrap_tol = config['bootstrap_tol']
+
     # add missing days in index
     df = df.astype(pd.Float64Dtype()).resample('D').mean().sort_index()
 
@@ -156,61 +271,69 @@ def lowess_per_col(df, columns, bootstrap_iters=config['bootstrap_iters'], conf_
     if lowess_kw is None:
         lowess_kw = {}
 
-    print('Smoothing using lowess and generating 95% CI by bootstrap resampling')
+    print(f'Smoothing using lowess{" and generating 95% CI by bootstrap resampling" if ci else ""}')
 
-    for col in tqdm(columns, unit='column'):
-        idx_start = df[col].first_valid_index()
-        idx_end = df[col].last_valid_index()
+    # interpolate all columns at once, the bootstrap workers get a shared handle to this frame instead of a copy
+    # of the column for every task
+    df_interpolated = df[list(columns)].astype(float).interpolate('linear', limit=14)
 
-        df_sel = df[col].loc[idx_start:idx_end].astype(float)
-        df_sel = df_sel.interpolate('linear', limit=14)
+    iters_used = {}
+    with shared_inputs(get_executor()) as shared:
+        shared_df = shared.put(df_interpolated)
 
-        # consider all datapoints at 3 weeks around it
-        frac = np.float64(1) / ((idx_end - idx_start) / np.timedelta64(3, 'W'))
+        for col in tqdm(columns, unit='column'):
+            idx_start = df[col].first_valid_index()
+            idx_end = df[col].last_valid_index()
 
-        if frac > 1:
-            # this means there is < 3W of data
-            # we should probably ignore the data if this is the case
-            # but for now set frac to 1 (use all samples)
-            frac = 1
+            df_sel = df_interpolated[col].loc[idx_start:idx_end]
 
-        local_run_lowess_kw = {**lowess_kw}
-        if 'frac' not in local_run_lowess_kw:
-            local_run_lowess_kw['frac'] = frac
+            # consider all datapoints at 3 weeks around it
+            frac = np.float64(1) / ((idx_end - idx_start) / np.timedelta64(3, 'W'))
 
+            if frac > 1:
+                # this means there is < 3W of data
+                # we should probably ignore the data if this is the case
+                # but for now set frac to 1 (use all samples)
+                frac = 1
 
-        smoothed = _lowess_on_df(df_sel, local_run_lowess_kw)
+            local_run_lowess_kw = {**lowess_kw}
+            if 'frac' not in local_run_lowess_kw:
+                local_run_lowess_kw['frac'] = frac
 
-        resample_lambda = _quantile_resampling
 
-        n_jobs = config['n_jobs']
-        remainder = bootstrap_iters % n_jobs
-        extra_jobs_mod = n_jobs // remainder
-        itersize = bootstrap_iters // n_jobs
-        iters = [itersize + (x % extra_jobs_mod == 0) for x in range(n_jobs)]
+            smoothed = _lowess_on_df(df_sel, local_run_lowess_kw)
 
-        # Perform bootstrap resampling of the data
-        # and  evaluate the smoothing at points
-        with tqdm_joblib(tqdm(total=n_jobs, unit=' bootstrap resampling workers finished', leave=False)) as progress_bar:
-            retvals = Parallel(n_jobs=n_jobs)(
-                delayed(_lowess_worker_with_func_resampler)(iters[i], df_sel, resample_lambda, local_run_lowess_kw) for i in range(n_jobs)
-            )
+            resample_lambda = _quantile_resampling
 
-        df_results = _merge_lowess_worker_results(df_sel.index, retvals, n_jobs)
+            if not ci:
+                bootstrap_std, iters_used[col] = np.full(len(smoothed), np.nan), 0
+            else:
+                # Perform bootstrap resampling of the data
+                # and  evaluate the smoothing at points
+                with stage('lowess_per_col.bootstrap', df_sel, column=col, bootstrap_iters=bootstrap_iters, bootstrap_tol=bootstrap_tol) as s:
+                    worker_args = (shared_df, col, idx_start, idx_end, resample_lambda, local_run_lowess_kw)
+                    bootstrap_std, iters_used[col] = _bootstrap_lowess_std(
+                        'lowess_per_col.bootstrap', _lowess_worker_for_col, worker_args, bootstrap_iters, bootstrap_tol, size=df_sel.shape[0]
+                    )
+                    s.set(iterations_used=iters_used[col])
 
-        colnames = {
-            'bottom_col': f'{col}_lowess_{conf_interval * 100:0.0f}_perc_ci_bottom',
-            'top_col': f'{col}_lowess_{conf_interval * 100:0.0f}_perc_ci_top',
-        }
+            colnames = {
+                'bottom_col': f'{col}_lowess_{conf_interval * 100:0.0f}_perc_ci_bottom',
+                'top_col': f'{col}_lowess_{conf_interval * 100:0.0f}_perc_ci_top',
+            }
 
-        df_results = _bootstrap_ci_from_std(df_results.index, df_results.std(axis=1).values, smoothed, alpha=conf_interval, **colnames)
+            df_results = _bootstrap_ci_from_std(df_sel.index, bootstrap_std, smoothed, alpha=conf_interval, **colnames)
 
-        df_results[f'{col}_lowess'] = smoothed
+            df_results[f'{col}_lowess'] = smoothed
 
-        df_ret = df_ret.join(df_results)
+            df_ret = df_ret.join(df_results)
 
     if clip_to_zero:
         # clip negative values to 0
         df_ret[df_ret < 0] = 0
 
-    return df_ret.sort_index()
+    df_ret = df_ret.sort_index()
+    df_ret.attrs['bootstrap_iters'] = iters_used
+    df_ret.attrs['ci_final'] = ci
+
+    return df_ret
@@ -1,21 +1,59 @@
+"""
+Cheap O(n) smoothers that operate on the whole frame at once
+
+All smoothers share the same api: smoother(df, columns, ...) returns a frame with a daily index and one smoothed
+column per input column. A measurement of 0 is treated as missing. They are a fast alternative to lowess when no
+confidence interval is needed.
+"""
 import numpy as np
 import pandas as pd
 
-from tqdm.auto import tqdm
+from poopsdontlie.helpers.profiling import profiled
+
+
+def _daily_block(df, columns):
+    # convert to one float block before resampling, this is much faster than working on masked Float64 columns
+    df = df[list(columns)]
+    values = df.to_numpy(dtype=float, na_value=np.nan)
+    values[values == 0] = np.nan
+
+    # add missing days in index
+    return pd.DataFrame(values, index=df.index, columns=df.columns).resample('D').last()
 
 
-def sma(df, columns, period_days=7):
+@profiled()
+def sma(df, columns, period_days=7, center=False, min_periods=None):
     """
     Perform simple moving average filter over columns
     """
+    suffix = f'_{"centered_" if center else ""}sma_{period_days}_days'
 
-    # add missing days in index
-    df = df.resample('D').last()
+    return _daily_block(df, columns).rolling(period_days, center=center, min_periods=min_periods).mean().add_suffix(suffix)
+
+
+@profiled()
+def centered_sma(df, columns, period_days=7, min_periods=None):
+    """
+    Perform centered simple moving average filter over columns, every value is the mean of the days around it
+    """
+    # the undecorated sma, so the call is only recorded once
+    return sma.__wrapped__(df, columns, period_days=period_days, center=True, min_periods=min_periods)
+
+
+@profiled()
+def ewma(df, columns, halflife_days=7, min_periods=0):
+    """
+    Perform exponentially weighted moving average filter over columns, missing days are skipped
+    """
+    return _daily_block(df, columns).ewm(halflife=halflife_days, min_periods=min_periods, ignore_na=True).mean() \
+        .add_suffix(f'_ewma_{halflife_days}_days')
 
-    df_ret = pd.DataFrame(index=df.index)
 
-    for col in tqdm(columns, unit='column'):
-        smooth = df[col].replace(0, np.nan).astype(float).rolling(7).mean()
-        df_ret = df_ret.join(smooth.rename(f'{col}_sma_{period_days}_days'))
+@profiled()
+def rolling_median(df, columns, period_days=7, center=False, min_periods=None):
+    """
+    Perform moving median filter over columns, robust to single outliers
+    """
+    suffix = f'_{"centered_" if center else ""}rolling_median_{period_days}_days'
 
-    return df_ret
+    return _daily_block(df, columns).rolling(period_days, center=center, min_periods=min_periods).median().add_suffix(suffix)
@@ -0,0 +1,91 @@
+"""
+Offline benchmarks on a synthetic NLD dataset
+
+The benchmarks are skipped unless POOPSDONTLIE_BENCHMARKS=1 is set, the scale can be set with
+POOPSDONTLIE_BENCH_PLANTS, POOPSDONTLIE_BENCH_DAYS and POOPSDONTLIE_BENCH_BOOTSTRAP_ITERS. Results can be
+stored and compared with the pytest-benchmark options, e.g.:
+
+    POOPSDONTLIE_BENCHMARKS=1 pytest poopsdontlie/tests/benchmarks --benchmark-autosave
+    POOPSDONTLIE_BENCHMARKS=1 pytest poopsdontlie/tests/benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+Peak memory (python allocations, traced with tracemalloc in the main process) is stored in the extra_info of every
+benchmark.
+"""
+import os
+import tracemalloc
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get('POOPSDONTLIE_BENCHMARKS', '') in ('', '0'):
+        skip = pytest.mark.skip(reason='set POOPSDONTLIE_BENCHMARKS=1 to run the benchmarks')
+        for item in items:
+            if 'benchmarks' in item.nodeid:
+                item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def scale():
+    return {
+        'n_plants': int(os.environ.get('POOPSDONTLIE_BENCH_PLANTS', 20)),
+        'n_days': int(os.environ.get('POOPSDONTLIE_BENCH_DAYS', 200)),
+        'bootstrap_iters': int(os.environ.get('POOPSDONTLIE_BENCH_BOOTSTRAP_ITERS', 40)),
+    }
+
+
+@pytest.fixture(scope='session')
+def synthetic_dataset(scale):
+    from poopsdontlie.countries.NLD.synthetic import generate_dataset
+
+    return generate_dataset(n_plants=scale['n_plants'], n_days=scale['n_days'])
+
+
+@pytest.fixture(scope='session')
+def synthetic_cache(synthetic_dataset, scale, tmp_path_factory):
+    """
+    A local cache seeded with the synthetic upstream data, the pipeline runs offline against it
+    """
+    from poopsdontlie.helpers import config
+    from poopsdontlie.helpers.cache import LocalFilesystemCache, reiinit_cache_config
+    from poopsdontlie.countries.NLD.synthetic import seed_cache
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(config, 'cache', 'local')
+        monkeypatch.setitem(config, 'cachedir', str(tmp_path_factory.mktemp('cache')))
+        monkeypatch.setitem(config, 'bootstrap_iters', scale['bootstrap_iters'])
+        monkeypatch.setitem(config, 'cache_max_size', None)
+        reiinit_cache_config()
+
+        cache = LocalFilesystemCache()
+        seed_cache(cache, synthetic_dataset)
+
+        yield cache
+
+    reiinit_cache_config()
+
+
+@pytest.fixture
+def bench(benchmark):
+    """
+    Benchmark func over a few rounds and record its peak memory, setup() returns the (args, kwargs) for every round
+    """
+    def run(func, setup=None, rounds=3):
+        if setup is None:
+            setup = lambda: ((), {})
+
+        args, kwargs = setup()
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        benchmark.extra_info['peak_memory_mb'] = round(peak / 2 ** 20, 2)
+
+        return benchmark.pedantic(func, setup=setup, rounds=rounds, iterations=1)
+
+    return run
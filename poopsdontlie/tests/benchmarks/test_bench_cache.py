@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.fixture(scope='module')
+def df_gemeente(synthetic_cache):
+    from poopsdontlie.countries.NLD.regions import rna_flow_per_capita_for_gemeente
+
+    return rna_flow_per_capita_for_gemeente()
+
+
+def test_bench_cache_write(bench, synthetic_cache, df_gemeente):
+    bench(synthetic_cache.put, setup=lambda: (('bench_cache_write', df_gemeente, 'apiresult', None), {}), rounds=10)
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_bench_cache_read(bench, benchmark, synthetic_cache, df_gemeente, monkeypatch, mmap):
+    from poopsdontlie.helpers import config
+
+    # with mmap the frame is a view on the page cache, the peak memory is the (python) memory a reader adds
+    monkeypatch.setitem(config, 'cache_mmap', mmap)
+    synthetic_cache.put('bench_cache_read', df_gemeente, 'apiresult', None)
+
+    bench(synthetic_cache.get, setup=lambda: (('bench_cache_read', 'apiresult'), {}), rounds=10)
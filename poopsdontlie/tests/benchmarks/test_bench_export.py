@@ -0,0 +1,35 @@
+import importlib.util
+
+import pytest
+
+
+_dependencies = {'csv.zst': 'zstandard', 'parquet': 'pyarrow', 'feather': 'pyarrow'}
+
+
+@pytest.fixture(scope='module')
+def df_smoothed_gemeente(synthetic_cache):
+    from poopsdontlie.countries.NLD.regions import rna_flow_per_capita_for_gemeente
+    from poopsdontlie.smoothers.sma import centered_sma
+
+    # a wide frame of floats like the smoothed datasets, without the cost of lowess
+    df = rna_flow_per_capita_for_gemeente()
+
+    return df.join(centered_sma(df, df.columns))
+
+
+@pytest.mark.parametrize('format', ['csv', 'csv.gz', 'csv.zst', 'json', 'ndjson', 'parquet', 'feather', 'xlsx'])
+def test_bench_export(bench, benchmark, df_smoothed_gemeente, tmp_path, format):
+    from poopsdontlie.helpers.export import export
+
+    if format in _dependencies and importlib.util.find_spec(_dependencies[format]) is None:
+        pytest.skip(f'{_dependencies[format]} is not installed')
+
+    df = df_smoothed_gemeente
+    bench(export, setup=lambda: ((df, tmp_path, 'bench_export', format), {}))
+
+    # throughput in table cells per second of the mean round
+    benchmark.extra_info['cells'] = int(df.size)
+    benchmark.extra_info['output_mb'] = round(sum(p.stat().st_size for p in tmp_path.glob('bench_export*')) / 2 ** 20, 2)
+    if benchmark.stats is not None:
+        # None with --benchmark-disable
+        benchmark.extra_info['cells_per_second'] = round(df.size / benchmark.stats.stats.mean)
@@ -0,0 +1,35 @@
+from io import BytesIO
+
+import pytest
+
+
+def test_bench_parse_sewage_data(bench, synthetic_dataset):
+    from poopsdontlie.countries.NLD.helpers import parse_sewage_data
+
+    bench(parse_sewage_data, setup=lambda: ((BytesIO(synthetic_dataset.sewage_json), ), {}))
+
+
+def test_bench_map_merge_rwzi_gmvr(bench, synthetic_cache):
+    from poopsdontlie.countries.NLD.helpers import download_sewage_data, map_merge_rwzi_gmvr
+    from poopsdontlie.helpers import config
+
+    df_rwzi_gm_vr = download_sewage_data()[['RWZI_AWZI_code', 'RWZI_AWZI_name', 'RNA_flow_per_100000']].reset_index()
+
+    # map_merge_rwzi_gmvr adds columns to its input, use a fresh copy every round
+    bench(map_merge_rwzi_gmvr, setup=lambda: ((df_rwzi_gm_vr.copy(), config['n_jobs']), {}))
+
+
+@pytest.mark.parametrize('dataset', [
+    'rna_flow_per_capita_for_gemeente',
+    'rna_flow_per_capita_for_veiligheidsregio',
+    'rna_flow_per_capita_for_rwzi',
+])
+def test_bench_rna_flow_per_capita(bench, synthetic_cache, dataset):
+    from poopsdontlie.countries.NLD import regions
+
+    func = getattr(regions, dataset)
+
+    # computes and caches the shared upstream stages, the benchmark only measures the aggregation itself
+    func()
+
+    bench(func.__wrapped__)
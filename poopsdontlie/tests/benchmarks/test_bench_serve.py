@@ -0,0 +1,53 @@
+import http.client
+import threading
+
+import pytest
+
+
+_REQUESTS = 200
+
+
+@pytest.fixture(scope='module')
+def httpd(synthetic_cache):
+    from poopsdontlie.helpers.server import make_server
+
+    server = make_server(port=0)
+    server.store.warm(['NLD'])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def _requests(port, path, headers):
+    # one keep-alive connection, like a client that polls the server
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    for _ in range(_REQUESTS):
+        conn.request('GET', path, headers=headers)
+        conn.getresponse().read()
+    conn.close()
+
+
+@pytest.mark.parametrize('case', ['plain', 'gzip', 'not_modified', 'filtered'])
+def test_bench_serve(bench, benchmark, httpd, case):
+    path = '/countries/NLD/regions/municipality'
+    headers = {}
+
+    if case == 'gzip':
+        headers['Accept-Encoding'] = 'gzip'
+    elif case == 'not_modified':
+        conn = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1])
+        conn.request('GET', path)
+        res = conn.getresponse()
+        res.read()
+        headers['If-None-Match'] = res.getheader('ETag')
+    elif case == 'filtered':
+        path += '?format=json&layout=long&start=2021-01-01'
+
+    bench(_requests, setup=lambda: ((httpd.server_address[1], path, headers), {}))
+
+    if benchmark.stats is not None:
+        # None with --benchmark-disable
+        benchmark.extra_info['requests_per_second'] = round(_REQUESTS / benchmark.stats.stats.mean)
@@ -0,0 +1,41 @@
+import pytest
+
+
+@pytest.fixture(scope='module')
+def df_veiligheidsregio(synthetic_cache):
+    from poopsdontlie.countries.NLD.regions import rna_flow_per_capita_for_veiligheidsregio
+
+    return rna_flow_per_capita_for_veiligheidsregio()
+
+
+@pytest.fixture(scope='module')
+def df_rwzi(synthetic_cache):
+    from poopsdontlie.countries.NLD.regions import rna_flow_per_capita_for_rwzi
+
+    return rna_flow_per_capita_for_rwzi()
+
+
+def test_bench_lowess_per_col(bench, df_veiligheidsregio):
+    from poopsdontlie.smoothers.lowess import lowess_per_col
+
+    df = df_veiligheidsregio.iloc[:, :5]
+
+    bench(lowess_per_col, setup=lambda: ((df, df.columns), {}))
+
+
+def test_bench_lowess_from_median(bench, df_rwzi):
+    from poopsdontlie.smoothers.lowess import lowess_from_median
+    import pandas as pd
+
+    df = df_rwzi.astype(pd.Float64Dtype())
+
+    bench(lowess_from_median, setup=lambda: ((df, ), {}))
+
+
+@pytest.mark.parametrize('smoother', ['sma', 'centered_sma', 'ewma', 'rolling_median'])
+def test_bench_fast_smoothers(bench, df_veiligheidsregio, smoother):
+    from poopsdontlie.smoothers import sma
+
+    df = df_veiligheidsregio
+
+    bench(getattr(sma, smoother), setup=lambda: ((df, df.columns), {}), rounds=10)
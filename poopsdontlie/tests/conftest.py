@@ -0,0 +1,19 @@
+import pytest
+
+from poopsdontlie.helpers import config
+from poopsdontlie.helpers.cache import reiinit_cache_config, _cache_factory
+
+
+@pytest.fixture
+def localcache(tmp_path, monkeypatch):
+    """
+    The configured cache is a local cache in a temporary directory
+    """
+    monkeypatch.setitem(config, 'cache', 'local')
+    monkeypatch.setitem(config, 'cachedir', str(tmp_path))
+    reiinit_cache_config()
+
+    yield _cache_factory()
+
+    monkeypatch.undo()
+    reiinit_cache_config()
@@ -0,0 +1,101 @@
+import subprocess
+import sys
+import textwrap
+import threading
+
+import pandas as pd
+
+from poopsdontlie.helpers import config, background
+from poopsdontlie.helpers.cache import LocalFilesystemCache, cached_results
+
+
+def _dataset(key, calls):
+    @cached_results(key=key, invalidate_after=None, cache_level='smoothed_api_result', provisional={'ci': False})
+    def dataset(ci=True):
+        calls.append(ci)
+        df = pd.DataFrame({'a_lowess': [1., 2.], 'a_ci_top': [2., 3.] if ci else [None, None]})
+        df.attrs['ci_final'] = ci
+
+        return df
+
+    return dataset
+
+
+def test_submit_runs_job_once_while_pending():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def job():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+
+    first = background.submit('test_submit', job)
+    started.wait(5)
+    assert background.submit('test_submit', job) is first
+    assert 'test_submit' in background.pending()
+
+    release.set()
+    assert background.wait(5) == []
+    assert calls == [1]
+
+
+def test_background_ci(localcache, monkeypatch):
+    monkeypatch.setitem(config, 'ci_mode', 'background')
+    calls = []
+    dataset = _dataset('test_background_ci', calls)
+
+    assert not background.ci_is_final(dataset())
+    assert background.wait(10) == []
+    assert calls == [False, True]
+
+    df = dataset()
+    assert background.ci_is_final(df)
+    assert df['a_ci_top'].notna().all()
+    assert calls == [False, True]
+
+
+def test_wait_mode_recomputes_provisional(localcache, monkeypatch):
+    monkeypatch.setitem(config, 'ci_mode', 'background')
+    calls = []
+    dataset = _dataset('test_wait_mode_recomputes_provisional', calls)
+
+    # a provisional entry is left behind when the process stopped before the background job finished
+    with monkeypatch.context() as m:
+        m.setattr(background, 'submit', lambda *args, **kwargs: None)
+        dataset()
+
+    monkeypatch.setitem(config, 'ci_mode', 'wait')
+    assert background.ci_is_final(dataset())
+    assert calls == [False, True]
+
+
+def test_wait_finishes_loky_jobs_before_exit(tmp_path):
+    # a job that starts a loky pool during the interpreter shutdown fails, commands wait for the jobs before that
+    script = textwrap.dedent(f"""
+        import pandas as pd
+
+        from joblib import delayed
+        from poopsdontlie.helpers import config, background
+        from poopsdontlie.helpers.cache import cached_results, reiinit_cache_config
+        from poopsdontlie.helpers.executor import get_executor
+
+        config.update(cache='local', cachedir={str(tmp_path)!r}, ci_mode='background', executor='loky', n_jobs=2)
+        reiinit_cache_config()
+
+        @cached_results(key='test_loky', invalidate_after=None, cache_level='smoothed_api_result', provisional={{'ci': False}})
+        def dataset(ci=True):
+            df = pd.DataFrame({{'a': [1., 2.]}})
+            if ci:
+                df['b'] = get_executor().run((delayed(abs)(-i) for i in range(2)), n_jobs=2)
+            df.attrs['ci_final'] = ci
+            return df
+
+        assert not background.ci_is_final(dataset())
+        background.wait()
+    """)
+    subprocess.run([sys.executable, '-c', script], check=True, timeout=120)
+
+    df = LocalFilesystemCache(tmp_path / 'local').get('test_loky', 'smoothed_api_result')
+    assert background.ci_is_final(df)
+    assert list(df['b']) == [0, 1]
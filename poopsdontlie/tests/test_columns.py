@@ -0,0 +1,105 @@
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers.cache import cached_columns, cached_results
+from poopsdontlie.helpers.columns import select_columns, select_regions
+from poopsdontlie.helpers.layout import wide_to_long
+
+
+@pytest.fixture
+def df():
+    index = pd.date_range('2022-01-01', periods=30, freq='D')
+
+    return pd.DataFrame({f'RNA_flow_per_capita_GM{i:04d}': range(i, i + 30) for i in range(4)}, index=index)
+
+
+def _counting(calls):
+    def double(df, columns, factor=2):
+        calls.extend(columns)
+        retval = (df[columns] * factor).add_suffix('_doubled')
+        retval.attrs['computed'] = {col: True for col in columns}
+
+        return retval
+
+    return double
+
+
+def test_select_columns(df):
+    assert select_columns(df, None) == list(df.columns)
+    assert select_columns(df, ['GM0002', 'RNA_flow_per_capita_GM0001']) == ['RNA_flow_per_capita_GM0002', 'RNA_flow_per_capita_GM0001']
+    assert select_columns(df, 'gm0003') == ['RNA_flow_per_capita_GM0003']
+
+    with pytest.raises(ValueError):
+        select_columns(df, ['GM9999'])
+
+
+def test_select_regions(df):
+    df_smooth = pd.concat([
+        df.add_suffix('_lowess'), df.add_suffix('_lowess_95_perc_ci_bottom'), df.add_suffix('_lowess_95_perc_ci_top'),
+    ], axis=1)
+
+    assert list(select_regions(df_smooth, ['GM0001']).columns) == [
+        'RNA_flow_per_capita_GM0001_lowess',
+        'RNA_flow_per_capita_GM0001_lowess_95_perc_ci_bottom',
+        'RNA_flow_per_capita_GM0001_lowess_95_perc_ci_top',
+    ]
+    assert list(select_regions(df, 'RNA_flow_per_capita_GM0002').columns) == ['RNA_flow_per_capita_GM0002']
+    assert select_regions(wide_to_long(df), ['RNA_flow_per_capita_GM0003'])['region_code'].unique().tolist() == ['GM0003']
+
+    with pytest.raises(ValueError):
+        select_regions(wide_to_long(df), ['GM9999'])
+
+
+def test_cached_columns_computes_missing_columns_only(localcache, df):
+    calls = []
+    double = cached_columns(key='test_cached_columns', invalidate_after=None)(_counting(calls))
+
+    result = double(df, ['RNA_flow_per_capita_GM0001'])
+    assert list(result.columns) == ['RNA_flow_per_capita_GM0001_doubled']
+    assert calls == ['RNA_flow_per_capita_GM0001']
+
+    calls.clear()
+    result = double(df, df.columns)
+    assert calls == ['RNA_flow_per_capita_GM0000', 'RNA_flow_per_capita_GM0002', 'RNA_flow_per_capita_GM0003']
+    pd.testing.assert_frame_equal(result, (df * 2).add_suffix('_doubled'))
+    assert result.attrs['computed'] == {col: True for col in df.columns}
+
+
+def test_cached_columns_keyed_by_column_and_params(localcache, df):
+    calls = []
+    double = cached_columns(key='test_cached_columns_keys', invalidate_after=None)(_counting(calls))
+
+    double(df, ['RNA_flow_per_capita_GM0001'])
+    double(df, ['RNA_flow_per_capita_GM0001'], factor=3)
+    double(df, ['RNA_flow_per_capita_GM0001'])
+    assert len(calls) == 2
+
+    # new data replaces the entry of the column instead of adding one
+    updated = df.assign(RNA_flow_per_capita_GM0001=0)
+    assert double(updated, ['RNA_flow_per_capita_GM0001']).iloc[0, 0] == 0
+    assert double(updated, ['RNA_flow_per_capita_GM0001']).attrs == {'computed': {'RNA_flow_per_capita_GM0001': True}}
+    assert len(calls) == 3
+    assert len([e for e in localcache.entries() if e['key'].startswith('test_cached_columns_keys@')]) == 2
+
+
+def test_cached_results_bypass(localcache, df):
+    calls = []
+
+    @cached_results(key='test_cached_results_bypass', invalidate_after=None, cache_level='apiresult', bypass_if=('columns',))
+    def dataset(columns=None):
+        calls.append(columns)
+        return df if columns is None else df[select_columns(df, columns)]
+
+    dataset()
+    dataset()
+    assert list(dataset(columns=['GM0001']).columns) == ['RNA_flow_per_capita_GM0001']
+    assert calls == [None, ['GM0001']]
+
+
+def test_cached_results_bypass_positional(localcache, df):
+    @cached_results(key='test_cached_results_bypass_positional', invalidate_after=None, cache_level='apiresult', bypass_if=('columns',))
+    def dataset(columns=None):
+        return df if columns is None else df[select_columns(df, columns)]
+
+    assert list(dataset(['GM0001']).columns) == ['RNA_flow_per_capita_GM0001']
+    pd.testing.assert_frame_equal(dataset(), df)
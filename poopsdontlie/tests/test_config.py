@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+from poopsdontlie.helpers.config import Config
+
+
+def test_env_overrides(monkeypatch):
+    monkeypatch.setenv('POOPSDONTLIE_N_JOBS', '3')
+    monkeypatch.setenv('POOPSDONTLIE_BOOTSTRAP_ITERS', '100')
+    monkeypatch.setenv('POOPSDONTLIE_CACHEDIR', '/tmp/poopsdontlie-test')
+
+    config = Config()
+
+    assert config['n_jobs'] == 3
+    assert config['bootstrap_iters'] == 100
+    assert config['cachedir'] == '/tmp/poopsdontlie-test'
+
+
+def test_values_are_read_at_call_time(monkeypatch):
+    config = Config()
+    assert config['n_jobs'] > 0
+
+    monkeypatch.setenv('POOPSDONTLIE_N_JOBS', '2')
+    config.reload()
+    assert config['n_jobs'] == 2
+
+    config['n_jobs'] = 5
+    assert config['n_jobs'] == 5
+
+
+def test_import_has_no_side_effects(tmp_path):
+    env = {**os.environ, 'HOME': str(tmp_path), 'XDG_CONFIG_HOME': str(tmp_path / 'config'), 'XDG_CACHE_HOME': str(tmp_path / 'cache')}
+    code = '''
+import json, sys
+from poopsdontlie.helpers.config import config
+print(json.dumps('psutil' in sys.modules))
+'''
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True, env=env).stdout
+
+    assert json.loads(output.strip().splitlines()[-1]) is False
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,113 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers.cache import RemoteCache
+from poopsdontlie.helpers.remotecache import _write_delta
+
+
+@pytest.fixture
+def df_r():
+    index = pd.date_range('2022-01-01', periods=60, freq='D', name='Date_measurement')
+
+    return pd.DataFrame({'a': range(60), 'b': 1.5}, index=index).reset_index()
+
+
+@pytest.fixture
+def remote(tmp_path, monkeypatch):
+    remote_dir = tmp_path / 'remote' / 'NLD'
+    remote_dir.mkdir(parents=True)
+
+    cache = RemoteCache('https://example.com', tmpdir=tmp_path / 'local')
+    cache.downloads = []
+
+    def fake_download(url, outfile):
+        cache.downloads.append(url)
+        shutil.copyfile(remote_dir / url.split('/NLD/')[1], outfile)
+
+    monkeypatch.setattr(cache, '_http_get_req_file', fake_download)
+
+    return cache, remote_dir
+
+
+def _publish(remote_dir, df_r, old_deltas):
+    csv_file = remote_dir / 'data.csv'
+    old_lines = csv_file.read_text().splitlines() if csv_file.is_file() else None
+    csv_text = df_r.to_csv(index=False)
+
+    deltas = _write_delta(remote_dir, 'data', old_lines, csv_text.splitlines(), old_deltas)
+    csv_file.write_text(csv_text)
+
+    return deltas
+
+
+def _update(df_r, day):
+    # the last days of the data change and a new day is added
+    df_r = df_r.copy()
+    df_r.loc[df_r.index[-2:], 'b'] = float(day)
+    new_row = {'Date_measurement': df_r['Date_measurement'].iloc[-1] + pd.Timedelta(days=1), 'a': day, 'b': 0.}
+
+    return pd.concat([df_r, pd.DataFrame([new_row])], ignore_index=True)
+
+
+def test_write_delta_contains_changed_tail(tmp_path, df_r):
+    deltas = _publish(tmp_path, df_r, None)
+    assert deltas == {'base_version': 1, 'version': 1, 'rows': 60, 'chain': []}
+
+    deltas = _publish(tmp_path, _update(df_r, 100), deltas)
+    assert deltas['version'] == 2
+    assert deltas['chain'] == [{'version': 2, 'file': 'data/deltas/2.csv', 'keep_rows': 58, 'rows': 3}]
+    assert (tmp_path / 'data' / 'deltas' / '2.csv').is_file()
+
+
+def test_write_delta_unchanged_keeps_version(tmp_path, df_r):
+    deltas = _publish(tmp_path, df_r, None)
+
+    assert _publish(tmp_path, df_r, deltas) == deltas
+
+
+def test_write_delta_starts_new_base_when_too_large(tmp_path, df_r):
+    deltas = _publish(tmp_path, _update(df_r, 100), None)
+    deltas = _publish(tmp_path, _update(df_r, 101), deltas)
+
+    changed = df_r.assign(b=3.)
+    deltas = _publish(tmp_path, changed, deltas)
+
+    assert deltas == {'base_version': 3, 'version': 3, 'rows': 60, 'chain': []}
+    assert not list((tmp_path / 'data' / 'deltas').glob('*.csv'))
+
+
+def test_remote_applies_deltas(remote, df_r):
+    cache, remote_dir = remote
+    dtype, parse_dates = cache._filter_dtypes(df_r.dtypes.to_dict())
+
+    meta = {'deltas': _publish(remote_dir, df_r, None), 'invalidate_after': None}
+    cache._store_snapshot('NLD', 'data', meta, df_r.set_index('Date_measurement'))
+
+    for day in (100, 101):
+        df_r = _update(df_r, day)
+        meta['deltas'] = _publish(remote_dir, df_r, meta['deltas'])
+
+    df = cache._get_with_deltas('NLD', 'data', meta, dtype, parse_dates)
+
+    pd.testing.assert_frame_equal(df, df_r.set_index('Date_measurement'), check_freq=False)
+    assert cache.downloads == ['https://example.com/NLD/data/deltas/2.csv', 'https://example.com/NLD/data/deltas/3.csv']
+
+    # up to date, nothing is downloaded
+    cache.downloads.clear()
+    assert cache._get_with_deltas('NLD', 'data', meta, dtype, parse_dates).shape[0] == df_r.shape[0]
+    assert cache.downloads == []
+
+
+def test_remote_without_chain_falls_back(remote, df_r):
+    cache, remote_dir = remote
+    dtype, parse_dates = cache._filter_dtypes(df_r.dtypes.to_dict())
+
+    meta = {'deltas': _publish(remote_dir, df_r, None), 'invalidate_after': None}
+    assert cache._get_with_deltas('NLD', 'data', meta, dtype, parse_dates) is None
+
+    cache._store_snapshot('NLD', 'data', meta, df_r.set_index('Date_measurement'))
+    meta['deltas'] = _publish(remote_dir, df_r.assign(b=3.), meta['deltas'])
+
+    assert cache._get_with_deltas('NLD', 'data', meta, dtype, parse_dates) is None
@@ -0,0 +1,64 @@
+import io
+import os
+import threading
+
+import pytest
+
+from joblib import delayed
+from tqdm.auto import tqdm
+
+from poopsdontlie.helpers import config
+from poopsdontlie.helpers.executor import get_executor, SerialExecutor, ThreadExecutor, LokyExecutor
+
+
+def _where(i):
+    return i, os.getpid(), threading.get_ident()
+
+
+@pytest.mark.parametrize('name, cls', [('serial', SerialExecutor), ('threads', ThreadExecutor), ('loky', LokyExecutor)])
+def test_executors_return_results_in_order(monkeypatch, name, cls):
+    monkeypatch.setitem(config, 'executor', name)
+    monkeypatch.setitem(config, 'n_jobs', 2)
+
+    executor = get_executor()
+    assert isinstance(executor, cls)
+
+    progress = tqdm(total=6, file=io.StringIO())
+    retvals = executor.run((delayed(_where)(i) for i in range(6)), progress=progress)
+
+    assert [r[0] for r in retvals] == list(range(6))
+    assert progress.n == 6
+
+    pids = {r[1] for r in retvals}
+    if name == 'loky':
+        assert os.getpid() not in pids
+    else:
+        assert pids == {os.getpid()}
+
+    if name == 'serial':
+        assert {r[2] for r in retvals} == {threading.get_ident()}
+
+
+def test_serial_executor_has_one_worker(monkeypatch):
+    monkeypatch.setitem(config, 'executor', 'serial')
+    monkeypatch.setitem(config, 'n_jobs', 8)
+
+    assert get_executor().max_workers() == 1
+
+
+def test_invalid_executor(monkeypatch):
+    monkeypatch.setitem(config, 'executor', 'carrier-pigeon')
+
+    with pytest.raises(ValueError):
+        get_executor()
+
+
+def test_dask_executor_requires_dask(monkeypatch):
+    pytest.importorskip('dask.distributed')
+
+    monkeypatch.setitem(config, 'executor', 'dask')
+    monkeypatch.setitem(config, 'n_jobs', 2)
+
+    retvals = get_executor().run(delayed(_where)(i) for i in range(4))
+
+    assert [r[0] for r in retvals] == list(range(4))
@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers.export import export, formats, to_long
+
+
+@pytest.fixture
+def df():
+    index = pd.date_range('2022-01-01', periods=5, freq='D', name='Date_measurement')
+    df = pd.DataFrame({'GM0001': [1, 2, None, 4, 5], 'GM0002': [5, 4, 3, 2, 1]}, index=index)
+
+    return df.astype(pd.Int64Dtype())
+
+
+def _read_back(path, format):
+    if format.startswith('csv'):
+        return pd.read_csv(path, index_col=0, parse_dates=True)
+    if format == 'parquet':
+        return pd.read_parquet(path)
+    if format == 'feather':
+        return pd.read_feather(path).set_index('Date_measurement')
+    if format == 'xlsx':
+        return pd.read_excel(path, index_col=0)
+
+
+@pytest.mark.parametrize('format', ['csv', 'csv.gz', 'csv.zst', 'parquet', 'feather', 'xlsx'])
+def test_export_roundtrip(df, tmp_path, format):
+    dependency = {'csv.zst': 'zstandard', 'parquet': 'pyarrow', 'feather': 'pyarrow'}.get(format)
+    if dependency is not None:
+        pytest.importorskip(dependency)
+
+    path = export(df, tmp_path, 'NLD_gemeente', format)
+
+    assert path.name == f'NLD_gemeente{formats[format][0]}'
+    df_read = _read_back(path, format)
+    np.testing.assert_array_equal(df_read.to_numpy(dtype=float, na_value=np.nan), df.to_numpy(dtype=float, na_value=np.nan))
+    assert list(df_read.index) == list(df.index)
+
+
+def test_ndjson_is_long_format(df, tmp_path):
+    path = export(df, tmp_path, 'NLD_gemeente', 'ndjson')
+
+    with open(path) as fh:
+        records = [json.loads(line) for line in fh]
+
+    assert len(records) == 9
+    assert records[0] == {'Date_measurement': '2022-01-01T00:00:00.000', 'column': 'GM0001', 'value': 1}
+
+
+def test_to_long_names_unnamed_index(df):
+    assert list(to_long(df.rename_axis(None)).columns) == ['date', 'column', 'value']
+
+
+def test_export_unknown_format(df, tmp_path):
+    with pytest.raises(ValueError):
+        export(df, tmp_path, 'NLD_gemeente', 'docx')
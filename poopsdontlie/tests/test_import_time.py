@@ -0,0 +1,45 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+
+heavy_modules = ('pandas', 'numpy', 'geopandas', 'statsmodels', 'scipy', 'joblib', 'pycountry', 'requests', 'tqdm')
+
+
+def _import_in_subprocess(module):
+    code = f'''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+print(json.dumps({{'duration': duration, 'heavy': [m for m in {heavy_modules!r} if m in sys.modules]}}))
+'''
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize('module', ['poopsdontlie', 'poopsdontlie.cli.poopsdontlie'])
+def test_import_does_not_load_compute_modules(module):
+    result = _import_in_subprocess(module)
+
+    print(f'import {module} took {result["duration"] * 1000:0.0f}ms')
+
+    assert result['heavy'] == []
+    # generous bound, importing the compute stack takes several seconds
+    assert result['duration'] < 1.5
+
+
+def test_dataset_registry_without_compute_modules():
+    code = f'''
+import json, sys
+from poopsdontlie import list_country_regions, get_valid_regions, is_valid_region
+list_country_regions('NLD')
+assert is_valid_region('NLD', 'smooth_gemeente')
+print(json.dumps([m for m in {heavy_modules!r} if m in sys.modules]))
+'''
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+
+    assert json.loads(output.strip().splitlines()[-1]) == []
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers.cache import cached_results
+from poopsdontlie.helpers.export import export
+from poopsdontlie.helpers.layout import check_layout, smoothed_to_long, wide_to_long
+
+
+@pytest.fixture
+def df():
+    index = pd.date_range('2022-01-01', periods=4, freq='D', name='Date_measurement')
+
+    return pd.DataFrame({
+        'RNA_flow_per_capita_GM0001': pd.array([1, 2, None, 4], dtype='Int64'),
+        'RNA_flow_per_capita_GM0002': pd.array([None, None, 7, 8], dtype='Int64'),
+    }, index=index)
+
+
+def test_check_layout():
+    assert check_layout(None) == 'wide'
+    assert check_layout('long') == 'long'
+
+    with pytest.raises(ValueError):
+        check_layout('tall')
+
+
+def test_wide_to_long_drops_missing_values(df):
+    df_long = wide_to_long(df)
+
+    assert df_long.index.name == 'date'
+    assert list(df_long.columns) == ['region_code', 'value']
+    assert df_long['region_code'].tolist() == ['GM0001', 'GM0001', 'GM0002', 'GM0001', 'GM0002']
+    assert df_long['value'].tolist() == [1, 2, 7, 4, 8]
+
+
+def test_smoothed_to_long(df):
+    df_smooth = pd.DataFrame(index=df.index)
+    for col in df.columns:
+        df_smooth[f'{col}_lowess_95_perc_ci_bottom'] = 0.5
+        df_smooth[f'{col}_lowess_95_perc_ci_top'] = 1.5
+        df_smooth[f'{col}_lowess'] = 1.
+    df_smooth.attrs['ci_final'] = True
+
+    df_long = smoothed_to_long(df_smooth)
+
+    assert list(df_long.columns) == ['region_code', 'value', 'ci_bottom', 'ci_top']
+    assert len(df_long) == 8
+    assert df_long.iloc[0].tolist() == ['GM0001', 1., 0.5, 1.5]
+    assert df_long.attrs['ci_final']
+
+    df_median = pd.DataFrame({'median_95_perc_ci_bottom': np.nan, 'median_95_perc_ci_top': np.nan, 'median': 2.}, index=df.index)
+    assert smoothed_to_long(df_median, region='NL')['region_code'].unique().tolist() == ['NL']
+
+
+def test_cached_results_varies_on_layout(localcache, df):
+    calls = []
+
+    @cached_results(key='test_cached_results_layout', invalidate_after=None, cache_level='apiresult', vary_on=('layout',))
+    def dataset(layout=None):
+        calls.append(layout)
+        return wide_to_long(df) if check_layout(layout) == 'long' else df
+
+    pd.testing.assert_frame_equal(dataset(), df)
+    pd.testing.assert_frame_equal(dataset(layout='long'), wide_to_long(df))
+    dataset()
+    dataset(layout='long')
+    pd.testing.assert_frame_equal(dataset('long'), wide_to_long(df))
+
+    assert calls == [None, 'long']
+
+
+def test_cached_results_converts_to_long(localcache, df):
+    calls = []
+
+    @cached_results(key='test_cached_results_to_long', invalidate_after=None, cache_level='apiresult', to_long=wide_to_long)
+    def dataset(layout=None):
+        calls.append(layout)
+        return df
+
+    pd.testing.assert_frame_equal(dataset(layout='long'), wide_to_long(df))
+    pd.testing.assert_frame_equal(dataset('wide'), df)
+    pd.testing.assert_frame_equal(dataset(), df)
+
+    # only the wide frame is computed and cached
+    assert calls == [None]
+    assert [e['key'] for e in localcache.entries()] == ['test_cached_results_to_long']
+
+    with pytest.raises(ValueError):
+        dataset(layout='tall')
+
+
+def test_export_long_json(tmp_path, df):
+    path = export(wide_to_long(df), tmp_path, 'test', 'json')
+
+    records = pd.read_json(path, orient='records')
+    assert list(records.columns) == ['date', 'region_code', 'value']
+    assert len(records) == 5
@@ -0,0 +1,301 @@
+import pickle
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers import config
+from poopsdontlie.helpers.cache import LocalFilesystemCache, cached_results, reiinit_cache_config, parse_size, \
+    InvalidateAfterTimeForTz, InvalidateBeginningOfNextMonth, get_func_invalidate_after, memoized
+
+
+@pytest.fixture
+def fscache(tmp_path):
+    return LocalFilesystemCache(cache_dir=tmp_path)
+
+
+def test_put_get_roundtrip(fscache):
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    fscache.put('key', df, 'backend')
+
+    pd.testing.assert_frame_equal(fscache.get('key', 'backend'), df)
+
+
+def test_write_leaves_no_temp_files(fscache, tmp_path):
+    fscache.put('key', 'value', 'backend')
+
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_file()) == ['backend-key.bin', 'backend-key.stats']
+
+
+def test_truncated_entry_is_quarantined(fscache, tmp_path):
+    fscache.put('key', list(range(1000)), 'backend')
+
+    cachefile = tmp_path / 'backend-key.bin'
+    cachefile.write_bytes(cachefile.read_bytes()[:20])
+
+    assert fscache.get('key', 'backend') is None
+    assert not cachefile.exists()
+    assert len(list((tmp_path / 'corrupt').iterdir())) == 1
+
+
+def test_invalid_cache_object_is_quarantined(fscache, tmp_path):
+    with open(tmp_path / 'backend-key.bin', 'wb') as fh:
+        pickle.dump(['not', 'a', 'cache', 'object'], fh)
+
+    assert fscache.get('key', 'backend') is None
+    assert not fscache.exists('key', 'backend')
+
+
+def test_lock_is_exclusive(fscache):
+    events = []
+
+    def worker(name):
+        with fscache.lock('key', 'backend'):
+            events.append(f'{name}-enter')
+            time.sleep(.2)
+            events.append(f'{name}-exit')
+
+    threads = [threading.Thread(target=worker, args=(i, )) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # the critical sections must not interleave
+    assert events[0].split('-')[0] == events[1].split('-')[0]
+    assert events[2].split('-')[0] == events[3].split('-')[0]
+
+
+def test_cached_results_computes_once(localcache):
+    calls = []
+
+    @cached_results(key='test_cached_results_computes_once', invalidate_after=None, cache_level='backend')
+    def slow_func():
+        calls.append(1)
+        time.sleep(.3)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(slow_func())) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ['result'] * 3
+    assert len(calls) == 1
+
+
+def test_memoized_computes_shared_stages_once(monkeypatch):
+    monkeypatch.setitem(config, 'cache', None)
+    reiinit_cache_config()
+    calls = []
+
+    @cached_results(key='test_memoized_upstream', invalidate_after=None, cache_level='backend')
+    def upstream():
+        calls.append(1)
+        return pd.DataFrame({'a': [1, 2, 3]})
+
+    def dataset():
+        df = upstream()
+        df['a'] *= 2
+
+        return df
+
+    with memoized():
+        assert dataset()['a'].tolist() == [2, 4, 6]
+        assert dataset()['a'].tolist() == [2, 4, 6]
+
+    assert len(calls) == 1
+
+    # outside the block nothing is kept
+    upstream()
+    assert len(calls) == 2
+
+    monkeypatch.undo()
+    reiinit_cache_config()
+
+
+def test_memoized_is_per_thread(monkeypatch):
+    monkeypatch.setitem(config, 'cache', None)
+    reiinit_cache_config()
+    calls = []
+
+    @cached_results(key='test_memoized_is_per_thread', invalidate_after=None, cache_level='backend')
+    def upstream():
+        calls.append(1)
+        return pd.DataFrame({'a': [1, 2, 3]})
+
+    with memoized():
+        upstream()
+
+        # e.g. a request thread of the server while the CLI runs a memoized batch
+        thread = threading.Thread(target=upstream)
+        thread.start()
+        thread.join()
+
+        upstream()
+
+    assert len(calls) == 2
+
+    monkeypatch.undo()
+    reiinit_cache_config()
+
+
+def test_mmap_roundtrip(fscache, tmp_path, monkeypatch):
+    monkeypatch.setitem(config, 'cache_mmap', True)
+    index = pd.date_range('2022-01-01', periods=10, freq='D', name='Date_measurement')
+    df = pd.DataFrame({'a': range(10), 'b': [None] * 5 + list(range(5))}, index=index, dtype='Int64')
+    doubled = df * 2
+    doubled.attrs['ci_final'] = True
+
+    fscache.put('key', df, 'apiresult')
+    fscache.put('key', doubled, 'apiresult')
+    assert len(list(tmp_path.glob('*.mmap'))) == 1
+
+    result = fscache.get('key', 'apiresult')
+    pd.testing.assert_frame_equal(result, doubled)
+    assert result.attrs == {'ci_final': True}
+
+    # frames with mixed dtypes are pickled
+    fscache.put('mixed', pd.DataFrame({'a': [1], 'b': ['x']}), 'apiresult')
+    assert fscache.get('mixed', 'apiresult')['b'].tolist() == ['x']
+
+    fscache.remove('key', 'apiresult')
+    assert not list(tmp_path.glob('*.mmap'))
+
+
+def test_mmap_concurrent_put(fscache, tmp_path, monkeypatch):
+    monkeypatch.setitem(config, 'cache_mmap', True)
+    df = pd.DataFrame({'a': [1., 2.]})
+
+    fscache.put('key', df, 'apiresult')
+    previous = next(tmp_path.glob('*.mmap'))
+
+    # another process wrote its copy but has not pointed the entry to it yet
+    cachefile = fscache._genpath('key', 'apiresult')
+    concurrent = fscache._write_sidecar(cachefile, df * 3)
+
+    fscache.put('key', df * 2, 'apiresult')
+    assert not previous.exists()
+    assert concurrent.exists()
+    pd.testing.assert_frame_equal(fscache.get('key', 'apiresult'), df * 2)
+
+    # once old enough the copy nothing points to is swept, the current one is kept
+    assert fscache.sweep_expired(tmp_max_age=-1) == []
+    assert not concurrent.exists()
+    pd.testing.assert_frame_equal(fscache.get('key', 'apiresult'), df * 2)
+
+
+def test_parse_size():
+    assert parse_size(None) is None
+    assert parse_size(1000) == 1000
+    assert parse_size('2KB') == 2048
+    assert parse_size('1.5 GB') == int(1.5 * 1024 ** 3)
+
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_stats_track_hits(fscache):
+    fscache.put('key', 'value', 'backend')
+    fscache.get('key', 'backend')
+    fscache.get('key', 'backend')
+
+    entry, = fscache.entries()
+    assert entry['key'] == 'key'
+    assert entry['cache_level'] == 'backend'
+    assert entry['hits'] == 2
+
+
+def test_stats_written_once_per_interval(fscache, tmp_path):
+    fscache.put('key', 'value', 'backend')
+    fscache.get('key', 'backend')
+
+    statsfile = tmp_path / 'backend-key.stats'
+    written = statsfile.read_text()
+    for _ in range(10):
+        fscache.get('key', 'backend')
+
+    assert statsfile.read_text() == written
+    entry, = fscache.entries()
+    assert entry['hits'] == 11
+
+
+def test_put_evicts_only_over_max_size(fscache, monkeypatch):
+    evictions = []
+    monkeypatch.setattr(fscache, 'evict', evictions.append)
+    # every entry is about 30KB
+    monkeypatch.setitem(config, 'cache_max_size', 100_000)
+
+    for key in ('a', 'a', 'b', 'c'):
+        fscache.put(key, list(range(10_000)), 'backend')
+    assert evictions == []
+
+    fscache.put('d', list(range(10_000)), 'backend')
+    assert evictions == [100_000]
+
+
+def test_sweep_expired(fscache):
+    fscache.put('expired', 'value', 'backend', pd.Timestamp.utcnow() - pd.Timedelta(seconds=1))
+    fscache.put('valid', 'value', 'backend', pd.Timestamp.utcnow() + pd.Timedelta(days=1))
+
+    removed = fscache.sweep_expired()
+
+    assert [e['key'] for e in removed] == ['expired']
+    assert [e['key'] for e in fscache.entries()] == ['valid']
+
+
+def test_evict_least_recently_used(fscache):
+    for key in ('a', 'b', 'c'):
+        fscache.put(key, list(range(10_000)), 'backend')
+        time.sleep(.01)
+
+    fscache.get('a', 'backend')
+    size = next(fscache.entries())['size']
+
+    fscache.evict(2 * size)
+
+    assert sorted(e['key'] for e in fscache.entries()) == ['a', 'c']
+
+
+def test_clear_level(fscache):
+    fscache.put('key', 'value', 'backend')
+    fscache.put('key', 'value', 'apiresult')
+
+    fscache.clear('backend')
+
+    assert not fscache.exists('key', 'backend')
+    assert fscache.exists('key', 'apiresult')
+
+
+def test_invalidation_policies():
+    now = pd.Timestamp.utcnow()
+
+    after_time = InvalidateAfterTimeForTz((15, 17), 'Europe/Amsterdam')()
+    assert now < after_time <= now + pd.Timedelta(days=1)
+
+    next_month = InvalidateBeginningOfNextMonth()()
+    assert now < next_month <= now + pd.Timedelta(days=32)
+
+
+def test_policy_evaluated_at_write_time(localcache):
+    expiries = []
+
+    def policy():
+        expiries.append(pd.Timestamp.utcnow() + pd.Timedelta(hours=1))
+        return expiries[-1]
+
+    @cached_results(key='test_policy_evaluated_at_write_time', invalidate_after=policy, cache_level='backend')
+    def func():
+        return 'result'
+
+    # nothing is evaluated at decoration time
+    assert expiries == []
+
+    func()
+    func()
+
+    assert len(expiries) == 1
+    assert get_func_invalidate_after(func.__wrapped__) > expiries[0]
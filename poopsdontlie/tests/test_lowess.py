@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers import config, planner
+from poopsdontlie.smoothers.lowess import lowess_per_col, lowess_from_median, _lowess_worker_column_median
+
+
+@pytest.fixture(autouse=True)
+def serial_config(monkeypatch):
+    monkeypatch.setitem(config, 'executor', 'serial')
+    monkeypatch.setitem(config, 'bootstrap_batch_size', 20)
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    index = pd.date_range('2021-01-01', periods=90, freq='D')
+    trend = 100 + 50 * np.sin(np.arange(90) / 15)
+
+    return pd.DataFrame({f'col_{i}': trend * rng.lognormal(0, .2, size=90) for i in range(3)}, index=index)
+
+
+def test_fixed_bootstrap_runs_all_iters(df):
+    df_smooth = lowess_per_col(df, ['col_0'], bootstrap_iters=30)
+
+    assert df_smooth.attrs['bootstrap_iters'] == {'col_0': 30}
+    assert list(df_smooth.columns) == ['col_0_lowess_95_perc_ci_bottom', 'col_0_lowess_95_perc_ci_top', 'col_0_lowess']
+    assert (df_smooth['col_0_lowess_95_perc_ci_bottom'] <= df_smooth['col_0_lowess']).all()
+    assert (df_smooth['col_0_lowess'] <= df_smooth['col_0_lowess_95_perc_ci_top']).all()
+
+
+def test_without_ci_only_smooths(df):
+    df_smooth = lowess_per_col(df, ['col_0'], bootstrap_iters=30, ci=False)
+    df_full = lowess_per_col(df, ['col_0'], bootstrap_iters=30)
+
+    assert df_smooth.attrs['ci_final'] is False and df_full.attrs['ci_final'] is True
+    assert df_smooth['col_0_lowess_95_perc_ci_bottom'].isna().all()
+    pd.testing.assert_series_equal(df_smooth['col_0_lowess'], df_full['col_0_lowess'])
+
+    assert lowess_from_median(df, bootstrap_iters=30, ci=False)['median_95_perc_ci_top'].isna().all()
+
+
+def test_adaptive_bootstrap_stops_early(df):
+    df_smooth = lowess_per_col(df, df.columns, bootstrap_iters=1_000, bootstrap_tol=.5)
+
+    for col in df.columns:
+        assert 40 <= df_smooth.attrs['bootstrap_iters'][col] < 1_000
+
+
+def test_adaptive_bootstrap_is_capped(df):
+    df_smooth = lowess_from_median(df, bootstrap_iters=50, bootstrap_tol=0)
+
+    assert df_smooth.attrs['bootstrap_iters'] == {'median': 50}
+
+
+def test_fixed_bootstrap_overrides_config(df, monkeypatch):
+    monkeypatch.setitem(config, 'bootstrap_tol', .5)
+
+    df_smooth = lowess_from_median(df, bootstrap_iters=300, bootstrap_tol=None)
+
+    assert df_smooth.attrs['bootstrap_iters'] == {'median': 300}
+
+
+def test_column_median_worker(df):
+    values = df.to_numpy(dtype=float)
+    values[::7, 1:] = np.nan
+
+    retvals = _lowess_worker_column_median(5, values, {'frac': .3})
+
+    assert len(retvals) == 5
+    assert all(r.shape == (90, ) for r in retvals)
+
+
+def test_lowess_from_median_handles_missing_values(df):
+    df = df.astype(pd.Float64Dtype())
+    df.iloc[::5, 0] = pd.NA
+
+    df_smooth = lowess_from_median(df, bootstrap_iters=20)
+
+    assert not df_smooth.isna().any().any()
+    assert (df_smooth['median_95_perc_ci_bottom'] <= df_smooth['median_95_perc_ci_top']).all()
+
+
+def test_lowess_per_col_with_process_workers(df, monkeypatch):
+    monkeypatch.setitem(config, 'executor', 'loky')
+    monkeypatch.setitem(config, 'n_jobs', 2)
+
+    # pretend iterations are expensive so the planner runs them in worker processes
+    monkeypatch.setitem(planner._costs, 'lowess_per_col.bootstrap', 1.)
+
+    df_smooth = lowess_per_col(df, ['col_0', 'col_1'], bootstrap_iters=4)
+
+    assert df_smooth.attrs['bootstrap_iters'] == {'col_0': 4, 'col_1': 4}
+    assert not df_smooth.isna().any().any()
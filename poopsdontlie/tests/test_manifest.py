@@ -0,0 +1,130 @@
+import json
+import shutil
+
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers import config, remotecache
+from poopsdontlie.helpers.cache import RemoteCache, _invalidate_registry
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    index = pd.date_range('2022-01-01', periods=60, freq='D', name='Date_measurement')
+    data = {'df': pd.DataFrame({'a': range(60), 'b': 1.5}, index=index)}
+
+    def manifest_dataset():
+        return data['df']
+
+    monkeypatch.setattr(remotecache, 'list_countries', lambda: {'TST': SimpleNamespace(name='Test')})
+    monkeypatch.setattr(remotecache, 'get_all_region_data_funcs_for_country', lambda iso: [('manifest_dataset', manifest_dataset)])
+    monkeypatch.setitem(_invalidate_registry, manifest_dataset, {
+        'key': 'manifest_dataset',
+        'cache_level': 'apiresult',
+        'invalidate_after': None,
+        'country': 'TST',
+    })
+
+    return data
+
+
+@pytest.fixture
+def remote_dir(tmp_path):
+    return tmp_path / 'remote'
+
+
+def _client(tmp_path, remote_dir):
+    cache = RemoteCache('https://example.com', tmpdir=tmp_path / 'local')
+    cache.downloads = []
+
+    def fake_download(url, outfile):
+        path = remote_dir / url[len('https://example.com/'):]
+        if not path.is_file():
+            raise FileNotFoundError(url)
+
+        cache.downloads.append(url[len('https://example.com/'):])
+        shutil.copyfile(path, outfile)
+
+    cache._http_get_req_file = fake_download
+
+    return cache
+
+
+def test_manifest_lists_datasets(dataset, remote_dir):
+    remotecache.cache_gen(remote_dir)
+
+    with open(remote_dir / 'TST' / 'manifest.json') as fh:
+        entry = json.load(fh)['datasets']['manifest_dataset']
+
+    assert entry['size'] == (remote_dir / 'TST' / 'manifest_dataset.csv').stat().st_size
+    assert entry['schema'] == {'Date_measurement': 'datetime64[ns]', 'a': 'int64', 'b': 'float64'}
+    assert entry['invalidate_after'] is None
+    assert len(entry['fingerprint']) == 64
+
+
+def test_exists_uses_manifest(dataset, remote_dir, tmp_path):
+    remotecache.cache_gen(remote_dir)
+    cache = _client(tmp_path, remote_dir)
+
+    assert cache.exists('manifest_dataset', 'apiresult')
+    assert cache.exists('manifest_dataset', 'apiresult')
+    assert cache.downloads == ['TST/manifest.json']
+
+
+def test_exists_checks_expiry(dataset, remote_dir, tmp_path, monkeypatch):
+    entry = next(e for e in _invalidate_registry.values() if e['key'] == 'manifest_dataset')
+    monkeypatch.setitem(entry, 'invalidate_after', pd.Timestamp.utcnow() - pd.Timedelta(days=1))
+    remotecache.cache_gen(remote_dir)
+    cache = _client(tmp_path, remote_dir)
+
+    assert not cache.exists('manifest_dataset', 'apiresult')
+    assert cache.get('manifest_dataset', 'apiresult') is None
+
+
+def test_get_downloads_only_changed_datasets(dataset, remote_dir, tmp_path):
+    remotecache.cache_gen(remote_dir)
+
+    df = _client(tmp_path, remote_dir).get('manifest_dataset', 'apiresult')
+    pd.testing.assert_frame_equal(df, dataset['df'], check_freq=False)
+
+    # unchanged, only the manifest is downloaded
+    cache = _client(tmp_path, remote_dir)
+    pd.testing.assert_frame_equal(cache.get('manifest_dataset', 'apiresult'), dataset['df'], check_freq=False)
+    assert cache.downloads == ['TST/manifest.json']
+
+    # the last day changed, only its delta is downloaded
+    dataset['df'] = dataset['df'].assign(b=[1.5] * 59 + [2.5])
+    remotecache.cache_gen(remote_dir, force_all=True)
+
+    cache = _client(tmp_path, remote_dir)
+    pd.testing.assert_frame_equal(cache.get('manifest_dataset', 'apiresult'), dataset['df'], check_freq=False)
+    assert cache.downloads == ['TST/manifest.json', 'TST/manifest_dataset/deltas/2.csv']
+
+
+def test_get_without_manifest_uses_meta_files(dataset, remote_dir, tmp_path):
+    remotecache.cache_gen(remote_dir)
+    (remote_dir / 'TST' / 'manifest.json').unlink()
+
+    cache = _client(tmp_path, remote_dir)
+    pd.testing.assert_frame_equal(cache.get('manifest_dataset', 'apiresult'), dataset['df'], check_freq=False)
+    assert cache.downloads[:2] == ['TST/manifest_dataset.meta', 'TST/manifest_dataset/2022-01.csv']
+
+
+def test_get_keeps_stale_snapshot_on_evict(dataset, remote_dir, tmp_path, monkeypatch):
+    entry = next(e for e in _invalidate_registry.values() if e['key'] == 'manifest_dataset')
+    monkeypatch.setitem(entry, 'invalidate_after', pd.Timestamp.utcnow() - pd.Timedelta(days=1))
+    monkeypatch.setitem(config, 'cache_max_size', 1)
+    remotecache.cache_gen(remote_dir)
+
+    # with serve_stale the expired snapshot is returned, it is the only entry and over the size limit
+    cache = _client(tmp_path, remote_dir)
+    pd.testing.assert_frame_equal(cache.get('manifest_dataset', 'apiresult', ignore_expiredate=True), dataset['df'],
+                                  check_freq=False)
+    assert [e['key'] for e in cache.entries()] == ['manifest_dataset']
+
+    cache = _client(tmp_path, remote_dir)
+    pd.testing.assert_frame_equal(cache.get('manifest_dataset', 'apiresult', ignore_expiredate=True), dataset['df'],
+                                  check_freq=False)
+    assert cache.downloads == ['TST/manifest.json']
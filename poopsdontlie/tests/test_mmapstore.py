@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers import mmapstore
+
+
+@pytest.fixture
+def index():
+    return pd.date_range('2022-01-01', periods=20, freq='D', name='Date_measurement')
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'int64', 'Int64', 'Float64'])
+def test_roundtrip(tmp_path, index, dtype):
+    df = pd.DataFrame({f'GM{i:04d}': np.arange(20) * i for i in range(3)}, index=index).astype(dtype)
+    if dtype[0].isupper():
+        df.iloc[:5, 1] = pd.NA
+
+    mmapstore.write(tmp_path / 'entry', df)
+
+    pd.testing.assert_frame_equal(mmapstore.read(tmp_path / 'entry'), df)
+
+
+def test_read_is_a_view_on_the_file(tmp_path, index):
+    df = pd.DataFrame(np.ones((20, 3)), index=index, columns=['a', 'b', 'c'])
+    mmapstore.write(tmp_path / 'entry', df)
+
+    result = mmapstore.read(tmp_path / 'entry')
+    values = result['b'].to_numpy()
+    while not isinstance(values, np.memmap) and values.base is not None:
+        values = values.base
+    assert isinstance(values, np.memmap)
+
+    # copy-on-write, changes stay in this process
+    result.iloc[0, 0] = 2.
+    assert mmapstore.read(tmp_path / 'entry').iloc[0, 0] == 1.
+
+
+def test_can_mmap(index):
+    assert mmapstore.can_mmap(pd.DataFrame({'a': [1.], 'b': [2.]}))
+    assert not mmapstore.can_mmap(pd.DataFrame({'a': [1.], 'b': [2]}))
+    assert not mmapstore.can_mmap(pd.DataFrame({'a': ['x']}))
+    assert not mmapstore.can_mmap(pd.Series([1.]))
@@ -0,0 +1,104 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers.cache import LocalFilesystemCache, PartitionedStore, RemoteCache, fingerprint, \
+    partition_by_month, month_is_immutable
+from poopsdontlie.helpers.remotecache import _write_partitions
+
+
+@pytest.fixture
+def df():
+    index = pd.date_range('2022-01-01', '2022-03-31', freq='D', name='Date_measurement')
+
+    return pd.DataFrame({'a': range(len(index)), 'b': 1.5}, index=index)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PartitionedStore(LocalFilesystemCache(cache_dir=tmp_path), 'test_partitions')
+
+
+def test_fingerprint_is_stable(df):
+    assert fingerprint(df) == fingerprint(df.copy())
+    assert fingerprint(df) != fingerprint(df.assign(b=2.5))
+    assert fingerprint(df) != fingerprint(df, salt='other')
+
+
+def test_partition_by_month(df):
+    partitions = partition_by_month(df)
+
+    assert list(partitions) == ['2022-01', '2022-02', '2022-03']
+    assert partitions['2022-02'].shape[0] == 28
+    assert list(partition_by_month(df.reset_index(), 'Date_measurement')) == list(partitions)
+
+
+def test_month_is_immutable():
+    now = pd.Timestamp('2022-06-15', tz='UTC')
+
+    assert month_is_immutable('2022-01', now)
+    assert not month_is_immutable('2022-05', now)
+
+
+def test_store_roundtrip(store, df):
+    assert store.write(df) == ['2022-01', '2022-02', '2022-03']
+
+    pd.testing.assert_frame_equal(store.read(), df, check_freq=False)
+
+
+def test_store_only_rewrites_changed_partitions(store, df):
+    store.write(df)
+
+    changed = df.copy()
+    changed.loc['2022-03-10', 'b'] = 3.
+    assert store.write(changed) == ['2022-03']
+
+    pd.testing.assert_frame_equal(store.read(), changed, check_freq=False)
+
+
+def test_store_removes_stale_partitions(store, df):
+    store.write(df)
+    store.write(df.loc['2022-02':])
+
+    assert list(store.index()) == ['2022-02', '2022-03']
+
+
+def test_store_reuses_by_source_fingerprint(store, df):
+    store.write(df, source_fingerprints={'2022-01': 'abc'})
+
+    assert store.get_partition('2022-01', 'abc') is not None
+    assert store.get_partition('2022-01', 'changed') is None
+    assert store.get_partition('2022-02', 'abc') is None
+
+
+def test_remote_downloads_changed_partitions(tmp_path, df, monkeypatch):
+    remote_dir = tmp_path / 'remote' / 'NLD'
+    remote_dir.mkdir(parents=True)
+    downloads = []
+
+    def fake_download(url, outfile):
+        downloads.append(url)
+        shutil.copyfile(remote_dir / url.split('/NLD/')[1], outfile)
+
+    cache = RemoteCache('https://example.com', tmpdir=tmp_path / 'local')
+    monkeypatch.setattr(cache, '_http_get_req_file', fake_download)
+
+    df_r = df.reset_index()
+    meta = {'date_column': 'Date_measurement'}
+    meta['partitions'], written = _write_partitions(remote_dir, 'data', df_r, 'Date_measurement', {})
+    assert written == 3
+
+    dtype, parse_dates = cache._filter_dtypes(df_r.dtypes.to_dict())
+    pd.testing.assert_frame_equal(cache._get_partitioned('NLD', 'data', meta, dtype, parse_dates), df, check_freq=False)
+    assert len(downloads) == 3
+
+    changed = df_r.copy()
+    changed.loc[changed.shape[0] - 1, 'b'] = 3.
+    meta['partitions'], written = _write_partitions(remote_dir, 'data', changed, 'Date_measurement', meta['partitions'])
+    assert written == 1
+
+    downloads.clear()
+    result = cache._get_partitioned('NLD', 'data', meta, dtype, parse_dates)
+    assert downloads == ['https://example.com/NLD/data/2022-03.csv']
+    assert result['b'].iloc[-1] == 3.
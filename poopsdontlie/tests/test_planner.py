@@ -0,0 +1,76 @@
+import pytest
+
+from poopsdontlie.helpers import config, planner
+from poopsdontlie.helpers.executor import LokyExecutor, SerialExecutor
+
+
+@pytest.fixture
+def loky(monkeypatch):
+    monkeypatch.setitem(config, 'n_jobs', 4)
+
+    return LokyExecutor()
+
+
+@pytest.fixture
+def stage(monkeypatch):
+    monkeypatch.setattr(planner, '_costs', {})
+
+    return 'test_stage'
+
+
+def test_split_evenly():
+    assert planner.split_evenly(8, 4) == [2, 2, 2, 2]
+    assert planner.split_evenly(10, 4) == [3, 3, 2, 2]
+    assert planner.split_evenly(3, 8) == [1, 1, 1]
+    assert planner.split_evenly(0, 4) == [0]
+
+
+def test_cheap_work_runs_serially(loky, stage):
+    planner.record_cost(stage, n_items=100, seconds=.001)
+
+    plan = planner.plan(stage, n_items=1_000, executor=loky)
+
+    assert not plan.parallel
+    assert plan.chunks == [1_000]
+    assert isinstance(plan.executor(), SerialExecutor)
+
+
+def test_expensive_work_runs_on_all_workers(loky, stage):
+    planner.record_cost(stage, n_items=10, seconds=1.)
+
+    plan = planner.plan(stage, n_items=1_000, executor=loky)
+
+    assert plan.n_jobs == 4
+    assert sum(plan.chunks) == 1_000
+    assert 4 <= len(plan.chunks) <= 16
+
+
+def test_workers_are_capped(loky, stage):
+    planner.record_cost(stage, n_items=1, seconds=1.)
+
+    assert planner.plan(stage, n_items=3, executor=loky).n_jobs == 3
+    assert planner.plan(stage, n_items=100, executor=loky, max_workers=2).n_jobs == 2
+    assert planner.plan(stage, n_items=100, executor=SerialExecutor()).n_jobs == 1
+
+
+def test_cost_scales_with_size(stage):
+    with planner.measure(stage, n_items=2, size=10):
+        pass
+
+    planner.record_cost(stage, n_items=1, seconds=1., size=10)
+
+    assert planner.cost_per_item(stage, size=20) == pytest.approx(2 * planner.cost_per_item(stage, size=10))
+    assert planner.has_cost(stage)
+
+
+def test_planned_runs_update_the_cost(stage, monkeypatch):
+    planner.record_cost(stage, n_items=10, seconds=1.)
+
+    plan = planner.Plan(1, [10], 1.)
+    times = iter([0., 3.])
+    monkeypatch.setattr(planner.time, 'perf_counter', lambda: next(times))
+    with planner.measure_plan(stage, plan):
+        pass
+
+    # the average of the probe and the run
+    assert planner.cost_per_item(stage) == pytest.approx(.2)
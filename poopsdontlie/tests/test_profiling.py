@@ -0,0 +1,102 @@
+import json
+
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers.cache import cached_results
+from poopsdontlie.helpers.profiling import stage, profiled, summarize, add_sink, remove_sink, sink_from_spec, \
+    MemorySink, JsonLinesSink, PrometheusTextfileSink
+
+
+@pytest.fixture
+def memory_sink():
+    sink = add_sink(MemorySink())
+    yield sink
+    remove_sink(sink)
+
+
+def test_stage_records_shape_and_parent(memory_sink):
+    df = pd.DataFrame({'a': range(10), 'b': range(10)})
+
+    with stage('outer', df) as s:
+        with stage('inner'):
+            pass
+        s.set_output(df.iloc[:5])
+
+    inner, outer = memory_sink.records
+    assert inner['stage'] == 'inner'
+    assert inner['parent'] == 'outer'
+    assert outer['parent'] is None
+    assert (outer['rows_in'], outer['cols_in'], outer['rows_out'], outer['cols_out']) == (10, 2, 5, 2)
+    assert outer['wall_time'] >= inner['wall_time'] >= 0
+
+
+def test_profiled_decorator(memory_sink):
+    @profiled()
+    def double(df):
+        return pd.concat([df, df])
+
+    double(pd.DataFrame({'a': range(3)}))
+
+    record, = memory_sink.records
+    assert record['stage'] == 'double'
+    assert record['rows_out'] == 6
+
+
+def test_nested_smoother_recorded_once(memory_sink):
+    from poopsdontlie.smoothers.sma import centered_sma
+
+    centered_sma(pd.DataFrame({'a': [1., 2., 3.]}, index=pd.date_range('2022-01-01', periods=3)), ['a'])
+
+    assert [r['stage'] for r in memory_sink.records] == ['centered_sma']
+
+
+def test_jsonl_and_prometheus_sinks(tmp_path):
+    jsonl = add_sink(JsonLinesSink(tmp_path / 'stages.jsonl'))
+    prom = add_sink(PrometheusTextfileSink(tmp_path / 'poopsdontlie.prom'))
+    try:
+        for _ in range(2):
+            with stage('step', cache='hit', cache_level='backend'):
+                pass
+    finally:
+        remove_sink(jsonl)
+        remove_sink(prom)
+
+    lines = (tmp_path / 'stages.jsonl').read_text().splitlines()
+    assert [json.loads(line)['stage'] for line in lines] == ['step', 'step']
+
+    metrics = (tmp_path / 'poopsdontlie.prom').read_text()
+    assert 'poopsdontlie_stage_runs_total{stage="step"} 2' in metrics
+    assert 'poopsdontlie_stage_cache_total{level="backend",result="hit",stage="step"} 2' in metrics
+
+
+def test_sink_from_spec():
+    assert isinstance(sink_from_spec('jsonl:/tmp/stages.jsonl'), JsonLinesSink)
+
+    with pytest.raises(ValueError):
+        sink_from_spec('jsonl')
+
+
+def test_summarize():
+    records = [
+        {'stage': 'a', 'wall_time': 1., 'cpu_time': .5, 'peak_rss_delta': 10, 'cache': 'miss'},
+        {'stage': 'a', 'wall_time': 2., 'cpu_time': .5, 'peak_rss_delta': 5, 'cache': 'hit'},
+        {'stage': 'b', 'wall_time': .1, 'cpu_time': .1, 'peak_rss_delta': None},
+    ]
+
+    a, b = summarize(records)
+    assert a == {'stage': 'a', 'calls': 2, 'wall_time': 3., 'cpu_time': 1., 'peak_rss_delta': 10, 'hits': 1, 'misses': 1}
+    assert b['stage'] == 'b'
+
+
+def test_cached_results_records_hits_and_misses(memory_sink, localcache):
+    @cached_results(key='test_cached_results_records_hits_and_misses', invalidate_after=None, cache_level='backend')
+    def func():
+        return pd.DataFrame({'a': range(4)})
+
+    func()
+    func()
+
+    records = [r for r in memory_sink.records if r['stage'] == 'test_cached_results_records_hits_and_misses']
+    assert [r['cache'] for r in records] == ['miss', 'hit']
+    assert records[1]['rows_out'] == 4
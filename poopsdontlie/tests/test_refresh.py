@@ -0,0 +1,116 @@
+import pandas as pd
+
+from poopsdontlie.helpers import config, refresh
+from poopsdontlie.helpers.cache import cached_results, refreshing
+
+
+def _source(name, t):
+    return refresh.Upstream('TST', name, f'https://example.com/{name}', lambda: t)
+
+
+def test_next_update():
+    t = pd.Timestamp('2022-01-01 14:17', tz='UTC')
+    sources = [_source('a', t), _source('b', t + pd.Timedelta(days=1)), _source('c', t), _source('d', None)]
+
+    wake, due = refresh.next_update(sources)
+
+    assert wake == t
+    assert [source.name for source in due] == ['a', 'c']
+    assert refresh.next_update([_source('d', None)]) == (None, [])
+
+
+def test_poll_until_changed(monkeypatch):
+    responses = iter([False, False, True])
+    monkeypatch.setattr(refresh, 'upstream_changed', lambda url, validators: (next(responses), {'etag': 'x'}))
+    sleeps = []
+
+    state = {}
+    changed = refresh.poll([_source('a', None)], state, 10, 60, sleeps.append)
+
+    assert [source.name for source in changed] == ['a']
+    assert sleeps == [10, 10]
+    assert state == {'a': {'etag': 'x'}}
+
+
+def test_poll_gives_up_after_timeout(monkeypatch):
+    monkeypatch.setattr(refresh, 'upstream_changed', lambda url, validators: (False, validators))
+
+    assert refresh.poll([_source('a', None)], {}, 10, 0, lambda s: None) == []
+
+
+def test_serve_stale_and_refreshing(localcache, monkeypatch):
+    calls = []
+
+    @cached_results(key='test_serve_stale', invalidate_after=None, cache_level='backend')
+    def dataset():
+        calls.append(1)
+        return len(calls)
+
+    # an entry that expired a minute ago
+    localcache.put('test_serve_stale', 0, 'backend', pd.Timestamp.utcnow() - pd.Timedelta(minutes=1))
+
+    monkeypatch.setitem(config, 'serve_stale', True)
+    assert dataset() == 0
+    assert calls == []
+
+    # the refresh recomputes the expired entry, readers get the new one afterwards
+    with refreshing():
+        assert dataset() == 1
+    assert dataset() == 1
+
+    # forced, entries are recomputed even when they did not expire
+    with refreshing(force=True):
+        assert dataset() == 2
+    assert dataset() == 2
+
+
+def test_serve_stale_survives_eviction(localcache, monkeypatch):
+    monkeypatch.setitem(config, 'serve_stale', True)
+    monkeypatch.setitem(config, 'cache_max_size', '1GB')
+
+    localcache.put('stale', 'value', 'backend', pd.Timestamp.utcnow() - pd.Timedelta(minutes=1))
+    # any write, e.g. the first stage of a refresh, used to sweep the expired entries readers are served
+    localcache.put('other', 'value', 'backend')
+    assert localcache.evict(2 ** 30) == []
+
+    # a read by the refresh does not remove it either
+    assert localcache.get('stale', 'backend') is None
+    assert localcache.get('stale', 'backend', ignore_expiredate=True) == 'value'
+
+    monkeypatch.setitem(config, 'serve_stale', False)
+    assert [e['key'] for e in localcache.sweep_expired()] == ['stale']
+
+
+def test_refresh_maps_with_new_tables(localcache, monkeypatch):
+    from io import BytesIO
+
+    from poopsdontlie.api import countries
+    from poopsdontlie.countries.NLD import helpers, regions
+    from poopsdontlie.countries.NLD.synthetic import generate_dataset
+
+    monkeypatch.setitem(config, 'n_jobs', 1)
+    monkeypatch.setattr(countries, 'get_all_region_data_funcs_for_country', lambda country: [
+        ('rna_flow_per_capita_for_veiligheidsregio', regions.rna_flow_per_capita_for_veiligheidsregio),
+    ])
+
+    dataset = generate_dataset(n_plants=5, n_days=30, start='2020-12-15')
+    # CBS publishes other shares and populations for the same plants
+    republished = generate_dataset(n_plants=5, n_days=30, start='2020-12-15', seed=1)
+
+    served = {
+        helpers.rivm_sewage_data_url: dataset.sewage_json,
+        helpers.cbs_mappings_2020_url: dataset.mappings_2020_xlsx,
+        helpers.cbs_mappings_2021_url: dataset.mappings_2021_xlsx,
+    }
+    monkeypatch.setattr(helpers, 'download_file_with_progressbar', lambda url, leave=True: BytesIO(served[url]))
+
+    refresh.refresh('NLD')
+    before = regions.rna_flow_per_capita_for_veiligheidsregio()
+
+    served[helpers.cbs_mappings_2020_url] = republished.mappings_2020_xlsx
+    served[helpers.cbs_mappings_2021_url] = republished.mappings_2021_xlsx
+    refresh.refresh('NLD', force=True)
+    after = regions.rna_flow_per_capita_for_veiligheidsregio()
+
+    assert before.index.equals(after.index)
+    assert not before.equals(after)
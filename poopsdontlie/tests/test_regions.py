@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers import config
+
+
+def _reference_veiligheidsregio(df_rwzi_gm_vr, vrcols):
+    # the per-column aggregation the vectorized one replaced
+    df_vr_rna_flow = pd.DataFrame(index=pd.to_datetime([]))
+    for col in vrcols:
+        df_vr = df_rwzi_gm_vr[['Date_measurement', col, 'population_attached_to_rwzi']].groupby('Date_measurement').sum()
+        df_vr_rna_flow = df_vr_rna_flow.join(
+            (df_vr[col] / df_vr['population_attached_to_rwzi']).round(0).resample('D').last().rename(f'RNA_flow_per_capita_{col}'),
+            how='outer'
+        )
+
+    return df_vr_rna_flow.round(0).astype(pd.Int64Dtype())
+
+
+def _reference_gemeente(df_rwzi_gm_vr, gmcols):
+    df_gem_rna_flow = pd.DataFrame(index=pd.to_datetime([]))
+    for col in gmcols:
+        df_sel = df_rwzi_gm_vr[['Date_measurement', col, 'population_attached_to_rwzi']].copy()
+        df_sel[col] = df_sel[col] / df_sel['population_attached_to_rwzi']
+        df_gem = df_sel.groupby('Date_measurement').sum() / df_sel.groupby('Date_measurement').count()
+        df_gem_rna_flow = df_gem_rna_flow.join(
+            df_gem[col].round(0).resample('D').last().rename(f'RNA_flow_per_capita_{col}'),
+            how='outer'
+        )
+
+    return df_gem_rna_flow.round(0).replace(0, np.nan).astype(pd.Int64Dtype())
+
+
+@pytest.fixture
+def mapped(localcache, monkeypatch):
+    from poopsdontlie.countries.NLD import regions
+    from poopsdontlie.countries.NLD.helpers import get_rwzi_gmvm_mapped_data
+    from poopsdontlie.countries.NLD.synthetic import generate_dataset, seed_cache
+
+    monkeypatch.setitem(config, 'n_jobs', 1)
+    seed_cache(localcache, generate_dataset(n_plants=8, n_days=60, start='2020-12-01'))
+    df_rwzi_gm_vr = get_rwzi_gmvm_mapped_data(jobs=1)
+
+    monkeypatch.setattr(regions, 'get_rwzi_gmvm_mapped_data', lambda jobs: df_rwzi_gm_vr.copy())
+
+    return df_rwzi_gm_vr
+
+
+def _assert_equal(df, expected):
+    # 0/0 on days without a measurement for a region was cast to the smallest Int64, it is NA now
+    expected = expected.mask(expected == np.iinfo('int64').min)
+
+    pd.testing.assert_frame_equal(df, expected, check_names=False, check_freq=False)
+
+
+def test_per_capita_matches_per_column(mapped):
+    from poopsdontlie.countries.NLD import regions
+
+    vrcols = sorted(c for c in mapped.columns if c.startswith('VR'))
+    gmcols = sorted(c for c in mapped.columns if c.startswith('GM'))
+
+    _assert_equal(regions.rna_flow_per_capita_for_veiligheidsregio.__wrapped__(jobs=1), _reference_veiligheidsregio(mapped, vrcols))
+    _assert_equal(regions.rna_flow_per_capita_for_gemeente.__wrapped__(jobs=1), _reference_gemeente(mapped, gmcols))
+
+
+def test_per_capita_without_population(monkeypatch):
+    from poopsdontlie.countries.NLD import regions
+
+    df_rwzi_gm_vr = pd.DataFrame({
+        'Date_measurement': pd.to_datetime(['2021-01-01', '2021-01-01', '2021-01-02']),
+        'population_attached_to_rwzi': pd.array([100, 300, 0], dtype='Int64'),
+        'GM0001': pd.array([1000, 900, 0], dtype='Int64'),
+        'VR01': pd.array([1000, 900, 0], dtype='Int64'),
+    })
+    monkeypatch.setattr(regions, 'get_rwzi_gmvm_mapped_data', lambda jobs: df_rwzi_gm_vr.copy())
+
+    # a day where no plant had a population
+    df_vr = regions.rna_flow_per_capita_for_veiligheidsregio.__wrapped__(jobs=1)
+    assert df_vr['RNA_flow_per_capita_VR01'].iloc[0] == 5
+    assert pd.isna(df_vr['RNA_flow_per_capita_VR01'].iloc[1])
+
+    df_gm = regions.rna_flow_per_capita_for_gemeente.__wrapped__(jobs=1)
+    assert df_gm['RNA_flow_per_capita_GM0001'].iloc[0] == 6
+    assert pd.isna(df_gm['RNA_flow_per_capita_GM0001'].iloc[1])
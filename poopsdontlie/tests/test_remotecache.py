@@ -7,6 +7,9 @@ from poopsdontlie.helpers import config
 from poopsdontlie.helpers.cache import RemoteCache
 from poopsdontlie.helpers.cache import _invalidate_registry, get_func_invalidate_after
 
+# the compute code is imported lazily, import it to fill the cache registry
+import poopsdontlie.countries.NLD.regions
+
 cache_test_call_noexpire = {
     'key': 'asd',
     'cache_level': 'zxcvb',
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers.cache import cached_results
+from poopsdontlie.helpers.layout import smoothed_to_long, wide_to_long
+from poopsdontlie.helpers.rollup import fit, has_rollups, precompute, rollup
+
+
+def _index(days):
+    # 2022-01-03 is a Monday
+    return pd.date_range('2022-01-03', periods=days, freq='D', name='Date_measurement')
+
+
+def _raw(days=28):
+    return pd.DataFrame({
+        'RNA_flow_per_capita_GM0001': pd.array(np.arange(days), dtype='Int64'),
+        'RNA_flow_per_capita_GM0002': pd.array([pd.NA] * 7 + list(range(days - 7)), dtype='Int64'),
+    }, index=_index(days))
+
+
+def _smoothed(days=28):
+    values = np.arange(days, dtype=float)
+    df = pd.DataFrame({
+        'GM0001_lowess': values,
+        'GM0001_lowess_95_perc_ci_bottom': values - 1 - values % 3,
+        'GM0001_lowess_95_perc_ci_top': values + 1 + values % 3,
+    }, index=_index(days))
+    df.attrs['ci_final'] = True
+
+    return df
+
+
+def test_rollup_weekly_raw():
+    df = rollup(_raw(), 'W')
+
+    assert list(df.index) == list(pd.date_range('2022-01-03', periods=4, freq='7D'))
+    assert list(df.columns) == list(_raw().columns)
+    assert list(df['RNA_flow_per_capita_GM0001']) == [3, 10, 17, 24]
+    assert pd.isna(df['RNA_flow_per_capita_GM0002'].iloc[0])
+    assert df['RNA_flow_per_capita_GM0002'].iloc[1] == 3
+
+
+def test_rollup_monthly_median():
+    df = rollup(_raw(60), 'M', 'median')
+
+    assert list(df.index) == [pd.Timestamp('2022-01-01'), pd.Timestamp('2022-02-01'), pd.Timestamp('2022-03-01')]
+    # 29 days in January from the 3rd, the median is the 15th of them
+    assert df['RNA_flow_per_capita_GM0001'].iloc[0] == 14
+
+
+def test_rollup_smoothed_envelope():
+    df = rollup(_smoothed(), 'W')
+    week = _smoothed().iloc[:7]
+
+    assert df['GM0001_lowess'].iloc[0] == week['GM0001_lowess'].mean()
+    assert df['GM0001_lowess_95_perc_ci_bottom'].iloc[0] == week['GM0001_lowess_95_perc_ci_bottom'].min()
+    assert df['GM0001_lowess_95_perc_ci_top'].iloc[0] == week['GM0001_lowess_95_perc_ci_top'].max()
+    assert df.attrs == {'ci_final': True}
+
+
+def test_rollup_long_matches_wide():
+    for wide, to_long in ((_raw(), wide_to_long), (_smoothed(), smoothed_to_long)):
+        df = rollup(to_long(wide), 'W')
+        expected = to_long(rollup(wide, 'W'))
+
+        assert list(df.columns) == list(expected.columns)
+        pd.testing.assert_frame_equal(
+            df.reset_index().sort_values(['region_code', 'date'], ignore_index=True),
+            expected.reset_index().sort_values(['region_code', 'date'], ignore_index=True),
+            check_dtype=False, check_names=False,
+        )
+
+
+def test_rollup_invalid():
+    with pytest.raises(ValueError):
+        rollup(_raw(), 'D')
+
+    with pytest.raises(ValueError):
+        rollup(_raw(), 'W', 'max')
+
+
+def test_fit(localcache):
+    calls = []
+
+    @cached_results(key='test_rollup_dataset', invalidate_after=None, cache_level='backend', to_long=wide_to_long, rollups=True)
+    def dataset(layout=None):
+        calls.append(layout)
+        return _raw(120)
+
+    @cached_results(key='test_rollup_no_rollups', invalidate_after=None, cache_level='backend', to_long=wide_to_long)
+    def no_rollups(layout=None):
+        return _raw()
+
+    assert has_rollups(dataset)
+    assert not has_rollups(no_rollups)
+    assert not has_rollups(_raw)
+
+    assert len(fit(dataset, 120)) == 120
+    assert len(fit(dataset, 20)) == 18
+    assert len(fit(dataset, 10)) == 5
+    # the monthly rollup when even that has too many points
+    assert len(fit(dataset, 2)) == 5
+    assert fit(dataset, 10, layout='long').index.nunique() == 5
+
+    with pytest.raises(ValueError):
+        fit(dataset, 10, 'max')
+
+    # the wide dataset and its rollups are cached, the long layouts are converted from them
+    precompute(dataset)
+    assert calls == [None]
+    assert sorted(e['key'] for e in localcache.entries()) == [
+        'test_rollup_dataset', 'test_rollup_dataset_rollup@resolution=M@how=mean',
+        'test_rollup_dataset_rollup@resolution=M@how=median', 'test_rollup_dataset_rollup@resolution=W@how=mean',
+        'test_rollup_dataset_rollup@resolution=W@how=median',
+    ]
+
+
+def test_fit_window(localcache):
+    @cached_results(key='test_rollup_window', invalidate_after=None, cache_level='backend', to_long=wide_to_long, rollups=True)
+    def dataset(layout=None):
+        return _raw(120)
+
+    # the 31 days fit, the whole dataset would be rolled up
+    df = fit(dataset, 100, start='2022-02-01', end='2022-03-03')
+    assert len(df) == 31
+    assert df.index[0] == pd.Timestamp('2022-02-01')
+
+    # the weeks at the edges of the window only aggregate the dates in it
+    df = fit(dataset, 10, start='2022-01-05', end='2022-02-20')
+    assert len(df) == 7
+    assert df['RNA_flow_per_capita_GM0001'].iloc[0] == 4
+    assert fit(dataset, 10, layout='long', start='2022-01-05', end='2022-02-20').index.nunique() == 7
@@ -0,0 +1,149 @@
+import gzip
+import http.client
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+from poopsdontlie.helpers import server
+from poopsdontlie.helpers.layout import check_layout, wide_to_long
+from poopsdontlie.helpers.rollup import rollup
+
+
+@pytest.fixture
+def loads():
+    return []
+
+
+@pytest.fixture
+def client(monkeypatch, loads):
+    index = pd.date_range('2022-01-01', periods=5, freq='D', name='Date_measurement')
+    df = pd.DataFrame({'RNA_flow_per_capita_GM0001': range(5), 'RNA_flow_per_capita_GM0002': range(10, 15)}, index=index)
+
+    def fake_region_data(country, region, layout=None):
+        loads.append((region, layout))
+
+        return wide_to_long(df) if check_layout(layout) == 'long' else df
+
+    def fake_region_rollup(country, region, resolution, how='mean', layout=None):
+        loads.append((region, layout, resolution, how))
+        df_rollup = rollup(df, resolution, how)
+
+        return wide_to_long(df_rollup) if check_layout(layout) == 'long' else df_rollup
+
+    monkeypatch.setattr(server, 'get_region_data_for_country', fake_region_data)
+    monkeypatch.setattr(server, 'get_region_rollup_for_country', fake_region_rollup)
+
+    httpd = server.make_server(port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    def get(path, **headers):
+        conn = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1])
+        conn.request('GET', path, headers=headers)
+        res = conn.getresponse()
+        body = res.read()
+        conn.close()
+
+        return res, body
+
+    yield get
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_countries_and_regions(client):
+    res, body = client('/countries')
+    assert res.status == 200
+    assert 'NLD' in json.loads(body)
+
+    res, body = client('/countries/nld/regions')
+    assert any(region.startswith('municipality') for region in json.loads(body))
+
+    assert client('/countries/XXX/regions')[0].status == 404
+
+
+def test_dataset_is_serialized_once(client, loads):
+    res, body = client('/countries/NLD/regions/municipality')
+    assert res.status == 200
+    assert res.getheader('Content-Type').startswith('text/csv')
+    assert body.decode().splitlines()[0] == 'Date_measurement,RNA_flow_per_capita_GM0001,RNA_flow_per_capita_GM0002'
+
+    etag = res.getheader('ETag')
+    res, gzip_body = client('/countries/NLD/regions/municipality', **{'Accept-Encoding': 'gzip'})
+    assert res.getheader('Content-Encoding') == 'gzip'
+    assert gzip.decompress(gzip_body) == body
+
+    res, body = client('/countries/NLD/regions/municipality', **{'If-None-Match': etag})
+    assert res.status == 304
+    assert body == b''
+
+    assert loads == [('municipality', 'wide')]
+
+
+def test_dataset_filters(client, loads):
+    _, body = client('/countries/NLD/regions/municipality?format=json&columns=GM0002&start=2022-01-02&end=2022-01-03')
+    assert json.loads(body) == {
+        '1641081600000': {'RNA_flow_per_capita_GM0002': 11},
+        '1641168000000': {'RNA_flow_per_capita_GM0002': 12},
+    }
+
+    _, body = client('/countries/NLD/regions/municipality?format=ndjson&layout=long&end=2022-01-01')
+    assert [json.loads(line)['region_code'] for line in body.decode().splitlines()] == ['GM0001', 'GM0002']
+
+    _, body = client('/countries/NLD/regions/municipality?format=ndjson&layout=long&columns=GM0002&end=2022-01-02')
+    assert [json.loads(line)['value'] for line in body.decode().splitlines()] == [10, 11]
+
+    # every response is selected from the dataset loaded once per layout
+    assert loads == [('municipality', 'wide'), ('municipality', 'long')]
+
+
+def test_dataset_rollups(client, loads):
+    # the weekly rollup that the refresh command precomputed
+    _, body = client('/countries/NLD/regions/municipality?max_points=3')
+    assert body.decode().splitlines()[1:] == ['2021-12-27,0.5,10.5', '2022-01-03,3.0,13.0']
+    client('/countries/NLD/regions/municipality?max_points=2&columns=GM0002')
+    assert loads == [('municipality', 'wide'), ('municipality', 'wide', 'W', 'mean')]
+
+    # the daily data fits
+    _, body = client('/countries/NLD/regions/municipality?max_points=5')
+    assert len(body.decode().splitlines()) == 6
+
+    # a window is rolled up from the dates in it
+    _, body = client('/countries/NLD/regions/municipality?max_points=1&start=2022-01-03')
+    assert body.decode().splitlines()[1:] == ['2022-01-03,3.0,13.0']
+    assert len(loads) == 2
+
+
+def test_errors(client):
+    assert client('/countries/NLD/regions/nowhere')[0].status == 404
+    assert client('/countries/NLD/regions/municipality?format=xlsx')[0].status == 400
+    assert client('/countries/NLD/regions/municipality?columns=GM9999')[0].status == 400
+    assert client('/countries/NLD/regions/municipality?start=yesterday-ish')[0].status == 400
+    assert client('/countries/NLD/regions/municipality?max_points=0')[0].status == 400
+
+
+def test_internal_error(client, monkeypatch):
+    def broken(country, region, layout=None):
+        raise RuntimeError('upstream is down')
+
+    monkeypatch.setattr(server, 'get_region_data_for_country', broken)
+
+    res, body = client('/countries/NLD/regions/municipality')
+    assert res.status == 500
+    assert json.loads(body) == {'error': 'Internal server error'}
+
+
+def test_key_error_is_internal(client, monkeypatch):
+    # a bug in a dataset is not a missing resource
+    def broken(country, region, layout=None):
+        raise KeyError('RNA_flow_per_100000')
+
+    monkeypatch.setattr(server, 'get_region_data_for_country', broken)
+
+    res, body = client('/countries/NLD/regions/municipality')
+    assert res.status == 500
+    assert json.loads(body) == {'error': 'Internal server error'}
+    assert client('/countries/XXX/regions')[0].status == 404
@@ -0,0 +1,41 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from poopsdontlie.helpers.shared import SharedInputs, resolve, pickled_size
+
+
+def test_handle_is_small_and_loads_memory_mapped():
+    df = pd.DataFrame({'a': np.arange(100_000, dtype=float), 'b': 'text'})
+
+    with SharedInputs() as shared:
+        handle = shared.put(df)
+
+        # the creating process uses the original object
+        assert resolve(handle) is df
+
+        # a worker receives a pickled copy of the handle and loads it from the shared file
+        worker_handle = pickle.loads(pickle.dumps(handle))
+        loaded = resolve(worker_handle)
+
+        assert pickled_size(handle) < 1_000 < shared.nbytes
+        pd.testing.assert_frame_equal(loaded, df)
+        assert isinstance(loaded['a'].values.base, np.memmap) or not loaded['a'].values.flags.writeable
+
+        # loading again in the same worker process is memoized
+        assert resolve(pickle.loads(pickle.dumps(handle))) is loaded
+
+
+def test_resolve_passes_other_objects():
+    obj = object()
+
+    assert resolve(obj) is obj
+
+
+def test_files_are_removed():
+    with SharedInputs() as shared:
+        shared.put([1, 2, 3])
+        shared_dir = shared._dir
+
+    assert not shared_dir.exists()
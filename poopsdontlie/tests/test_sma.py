@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from poopsdontlie.smoothers.sma import sma, centered_sma, ewma, rolling_median
+
+
+@pytest.fixture
+def df():
+    # measurements every other day, with a gap
+    index = pd.date_range('2021-01-01', periods=30, freq='2D')
+    values = np.arange(1, 31, dtype=float)
+
+    return pd.DataFrame({'a': values, 'b': values * 2}, index=index).drop(index[10:12]).astype(pd.Float64Dtype())
+
+
+def test_sma_uses_period_days(df):
+    df_smooth = sma(df, df.columns, period_days=3, min_periods=1)
+
+    assert list(df_smooth.columns) == ['a_sma_3_days', 'b_sma_3_days']
+    assert df_smooth.index.freqstr == 'D'
+    assert df_smooth.loc['2021-01-03', 'a_sma_3_days'] == 1.5
+    assert df_smooth.loc['2021-01-04', 'a_sma_3_days'] == 2
+
+
+def test_sma_treats_zero_as_missing(df):
+    df.iloc[1, 0] = 0
+
+    df_smooth = sma(df, ['a'], period_days=3, min_periods=1)
+
+    assert df_smooth.loc['2021-01-03', 'a_sma_3_days'] == 1
+
+
+def test_centered_sma(df):
+    df_smooth = centered_sma(df, ['a'], period_days=3, min_periods=1)
+
+    assert list(df_smooth.columns) == ['a_centered_sma_3_days']
+    assert df_smooth.loc['2021-01-02', 'a_centered_sma_3_days'] == 1.5
+
+
+def test_ewma_matches_per_column(df):
+    df_smooth = ewma(df, df.columns, halflife_days=4)
+
+    expected = df['b'].astype(float).resample('D').last().ewm(halflife=4, ignore_na=True).mean()
+    pd.testing.assert_series_equal(df_smooth['b_ewma_4_days'], expected, check_names=False)
+
+
+def test_rolling_median(df):
+    df.iloc[2, 0] = 1_000
+
+    df_smooth = rolling_median(df, ['a'], period_days=5, center=True, min_periods=1)
+
+    assert df_smooth.loc['2021-01-05', 'a_centered_rolling_median_5_days'] == 4
@@ -0,0 +1,21 @@
+from poopsdontlie.countries.NLD.synthetic import generate_dataset, parse_dataset
+
+
+def test_synthetic_dataset_parses_like_upstream():
+    parsed = parse_dataset(generate_dataset(n_plants=5, n_days=30, start='2020-12-15'))
+
+    df_sewage = parsed['rivm_sewage_data']
+    assert df_sewage.index.name == 'Date_measurement'
+    assert df_sewage.index.is_monotonic_increasing
+    assert set(df_sewage['RWZI_AWZI_code']) <= set(range(1000, 1005))
+    assert df_sewage['RNA_flow_per_100000'].dtype == float
+
+    df_2020 = parsed['cbs_awzi_population_mappings_2020']
+    # five plants and the row for inhabitants without a plant
+    assert df_2020.shape[0] == 6
+    assert df_2020['Code Rioolwaterzuiveringsinstallatie'].isnull().sum() == 1
+
+    df_2021 = parsed['cbs_awzi_population_mappings_2021']
+    assert set(df_2021['regio_type']) == {'GM', 'VR'}
+    for _, df_plant in df_2021[df_2021['einddatum'].isnull() & (df_2021['toelichting'] == 'definitief')].groupby('rwzi_code'):
+        assert abs(df_plant[df_plant['regio_type'] == 'GM']['aandeel'].sum() - 1) < 1e-9
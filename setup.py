@@ -52,6 +52,11 @@ setup(
         'geopandas>=0.10.2',
         'scipy>=1.8.0',
     ],
+    extras_require={
+        'dask': ['dask[distributed]>=2022.1.0'],
+        'ray': ['ray>=1.12.0'],
+        'export': ['pyarrow>=7.0.0', 'xlsxwriter>=3.0.3', 'zstandard>=0.17.0'],
+    },
     entry_points={
         'console_scripts': [
             'poopsdontlie=poopsdontlie.cli.poopsdontlie:run',